@@ -0,0 +1,85 @@
+# benchmarks/bench_index.py
+
+"""
+Benchmarks for igv_streamlit.index on the indexes in ``local-data/``.
+
+Run from the repository root, e.g.::
+
+    python benchmarks/bench_index.py --regions 10000
+
+For the bundled BAI, CRAI and ``.fai``, and a tabix index of the bundled
+GFF, reports the time to parse the index and to load it again from the
+cache, then how many byte ranges ``--regions`` random regions need, and
+the time per region asking for them in one vectorized call and one call
+each.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from igv_streamlit import _tabix, index  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "local-data")
+BAI   = os.path.join(DATA, "SPT24175.filtered.bam.bai")
+CRAI  = os.path.join(DATA, "PF0833-C.filtered.cram.crai")
+FAI   = os.path.join(DATA, "PlasmoDB-54_Pfalciparum3D7_Genome.fasta.fai")
+GFF   = os.path.join(DATA, "PlasmoDB-55_Pfalciparum3D7.gff")
+
+
+def _regions(fai: index.FastaIndex, n: int, width: int,
+             seed: int = 0) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """``n`` random regions of up to ``width`` bases on the reference."""
+    rnd    = random.Random(seed)
+    chroms = [rnd.randrange(len(fai.names)) for _ in range(n)]
+    starts = np.array([rnd.randrange(int(fai.length[c])) for c in chroms])
+    ends   = starts + np.array([rnd.randrange(1, width) for _ in chroms])
+    return [fai.names[c] for c in chroms], starts, ends
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--regions", type=int, default=10_000,
+                        help="random regions to look up")
+    parser.add_argument("--width", type=int, default=100_000,
+                        help="most bases in a region")
+    args = parser.parse_args()
+
+    _, tbi = _tabix.indexed_copy(GFF)
+    fai = index.load_index(FAI)
+    chroms, starts, ends = _regions(fai, args.regions, args.width)
+    print(f"{args.regions} regions of up to {args.width} bases")
+    print(f"{'index':<6} {'bytes':>9} {'parse ms':>9} {'cached us':>10} "
+          f"{'ranges':>7} {'vectorized us':>14} {'one by one us':>14} "
+          f"{'speedup':>8}")
+    for label, path in (("BAI", BAI), ("CRAI", CRAI), ("FAI", FAI), ("tabix", tbi)):
+        index._cache.clear()
+        t0  = time.perf_counter()
+        idx = index.load_index(path)
+        parse = time.perf_counter() - t0
+        t0  = time.perf_counter()
+        index.load_index(path)
+        cached = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        found = index.byte_ranges(idx, chroms, starts, ends)
+        vectorized = (time.perf_counter() - t0) / args.regions
+        t0 = time.perf_counter()
+        for region in zip(chroms, starts.tolist(), ends.tolist()):
+            index.byte_ranges(idx, *region)
+        single = (time.perf_counter() - t0) / args.regions
+        print(f"{label:<6} {os.path.getsize(path):>9} {parse * 1e3:>9.2f} "
+              f"{cached * 1e6:>10.1f} {len(found):>7} {vectorized * 1e6:>14.2f} "
+              f"{single * 1e6:>14.2f} {single / vectorized:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
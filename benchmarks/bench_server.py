@@ -0,0 +1,861 @@
+# benchmarks/bench_server.py
+
+"""
+Benchmarks for the igv-streamlit local file server.
+
+Run from the repository root, e.g.::
+
+    python benchmarks/bench_server.py sendfile
+
+The server runs in this process and the load is generated from a child
+process, so ``time.process_time()`` here measures server-side CPU only.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import http.client
+import multiprocessing as mp
+import os
+import random
+import resource
+import socket
+import socketserver
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from igv_streamlit import server  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "local-data")
+BAM   = os.path.join(DATA, "SPT24175.filtered.bam")
+CRAM  = os.path.join(DATA, "PF0833-C.filtered.cram")
+FASTA = os.path.join(DATA, "PlasmoDB-54_Pfalciparum3D7_Genome.fasta")
+
+
+# ── client side ──────────────────────────────────────────────────────────────
+
+def _fetch(url: str, headers: dict | None = None) -> int:
+    u = urlsplit(url)
+    conn = http.client.HTTPConnection(u.hostname, u.port)
+    conn.request("GET", u.path, headers=headers or {})
+    n = len(conn.getresponse().read())
+    conn.close()
+    return n
+
+
+def _client(url: str, size: int, full: int, ranges: int, range_len: int,
+            seed: int, out: mp.Queue) -> None:
+    rng = random.Random(seed)
+    total = 0
+    for _ in range(full):
+        total += _fetch(url)
+    for _ in range(ranges):
+        start = rng.randrange(0, max(1, size - range_len))
+        total += _fetch(url, {"Range": f"bytes={start}-{start + range_len - 1}"})
+    out.put(total)
+
+
+def _run_load(url: str, size: int, *, clients: int, full: int, ranges: int,
+              range_len: int) -> tuple[int, float, float]:
+    """Return (bytes served, wall seconds, server CPU seconds)."""
+    q: mp.Queue = mp.Queue()
+    procs = [mp.Process(target=_client,
+                        args=(url, size, full, ranges, range_len, i, q))
+             for i in range(clients)]
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    for p in procs:
+        p.start()
+    total = sum(q.get() for _ in procs)
+    for p in procs:
+        p.join()
+    return total, time.perf_counter() - t0, time.process_time() - cpu0
+
+
+def _range_client(port: int, path: str, size: int, range_len: int,
+                  seconds: float, seed: int, out: mp.Queue,
+                  session: str | None = None) -> None:
+    """
+    Random range GETs on one keep-alive connection for ``seconds``; puts
+    ``(session, requests, bytes, latencies)`` on ``out``.
+    """
+    rng  = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    if session:
+        path = f"{path}?{server._SESSION_PARAM}={session}"
+    headers = {}
+    n = total = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = rng.randrange(0, max(1, size - range_len))
+        headers["Range"] = f"bytes={start}-{start + range_len - 1}"
+        t0 = time.perf_counter()
+        conn.request("GET", path, headers=headers)
+        total += len(conn.getresponse().read())
+        latencies.append(time.perf_counter() - t0)
+        n += 1
+    out.put((session, n, total, latencies))
+
+
+def _hold_connections(port: int, path: str, size: int, n: int, range_len: int,
+                      held: mp.Event, release: mp.Event, out: mp.Queue) -> None:
+    """
+    Open ``n`` connections, start a range GET on each, then stall reading.
+    Reports how many were served (206), rejected (503) or still waiting for
+    a response after a few seconds (queued).
+    """
+    _raise_fd_limit()
+
+    async def one(stalled: asyncio.Event, i: int) -> str:
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            start = (i * 4096) % max(1, size - range_len)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n"
+                         f"Range: bytes={start}-{start + range_len - 1}\r\n"
+                         f"Connection: close\r\n\r\n".encode())
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+            except asyncio.TimeoutError:
+                return "queued"
+            if head.split(b" ")[1] != b"206":
+                return "rejected"
+            await reader.readexactly(1024)
+            return "served"
+        finally:
+            stalled.set()
+            while not release.is_set():
+                await asyncio.sleep(0.05)
+            if writer is not None:
+                writer.close()
+
+    async def main() -> None:
+        events = [asyncio.Event() for _ in range(n)]
+        tasks  = [asyncio.create_task(one(e, i)) for i, e in enumerate(events)]
+        await asyncio.gather(*(e.wait() for e in events))
+        held.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        out.put({outcome: results.count(outcome)
+                 for outcome in ("served", "queued", "rejected")})
+
+    asyncio.run(main())
+
+
+def _raise_fd_limit() -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _proc_status() -> tuple[int, int]:
+    """Return (RSS in KiB, thread count) of this process (Linux only)."""
+    rss = threads = 0
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    return rss, threads
+
+
+# ── scenarios ────────────────────────────────────────────────────────────────
+
+def bench_sendfile(args) -> None:
+    """Throughput and server CPU per GB, copy loop vs ``os.sendfile``."""
+    print(f"{'file':<8} {'mode':<9} {'MB/s':>9} {'CPU s/GB':>9}")
+    for label, path in (("BAM", BAM), ("FASTA", FASTA)):
+        url  = server.register_file(path)
+        size = os.path.getsize(path)
+        for mode, enabled in (("copy", False), ("sendfile", True)):
+            if enabled and not hasattr(os, "sendfile"):
+                continue
+            server._USE_SENDFILE = enabled
+            total, wall, cpu = _run_load(
+                url, size, clients=args.clients, full=args.full,
+                ranges=args.ranges, range_len=args.range_len)
+            gb = total / 1e9
+            print(f"{label:<8} {mode:<9} {total / 1e6 / wall:>9.1f} "
+                  f"{cpu / gb:>9.2f}")
+    server._USE_SENDFILE = hasattr(os, "sendfile")
+
+
+def bench_concurrency(args) -> None:
+    """
+    Hold ``--connections`` stalled range downloads of the FASTA open at once
+    and report the server's RSS growth and thread count.  Use a
+    ``--range-len`` larger than the socket buffers (e.g. 8 MiB) so the
+    server really is blocked on every connection.
+    """
+    if args.engine is None:
+        print(f"{'engine':<10} {'conns':>6} {'served':>7} {'queued':>7} "
+              f"{'503':>5} {'peak RSS MiB':>13} {'threads':>8}")
+        for engine in ("threading", "asyncio"):
+            subprocess.run([sys.executable, __file__, "concurrency",
+                            "--engine", engine,
+                            "--connections", str(args.connections),
+                            "--range-len", str(args.range_len),
+                            *(["--max-workers", str(args.max_workers)]
+                              if args.max_workers else [])], check=True)
+        return
+
+    _raise_fd_limit()
+    server.configure_server(engine=args.engine)
+    if args.max_workers:
+        server.configure_server(max_workers=args.max_workers)
+    url  = server.register_file(FASTA)
+    path = urlsplit(url).path
+    rss0, _ = _proc_status()
+
+    held, release, q = mp.Event(), mp.Event(), mp.Queue()
+    client = mp.Process(target=_hold_connections,
+                        args=(server.get_server_port(), path,
+                              os.path.getsize(FASTA), args.connections,
+                              args.range_len, held, release, q))
+    client.start()
+    held.wait()
+    peak_rss = peak_threads = 0
+    for _ in range(20):
+        rss, threads = _proc_status()
+        peak_rss, peak_threads = max(peak_rss, rss), max(peak_threads, threads)
+        time.sleep(0.05)
+    release.set()
+    outcomes = q.get()
+    client.join()
+    print(f"{args.engine:<10} {args.connections:>6} {outcomes['served']:>7} "
+          f"{outcomes['queued']:>7} {outcomes['rejected']:>5} "
+          f"{(peak_rss - rss0) / 1024:>13.1f} {peak_threads:>8}")
+
+
+def _locus_jump_requests(url_for=server.register_file) -> list[tuple[str, dict]]:
+    """
+    The requests igv.js makes to show a CRAM locus from cold: the CRAI, the
+    CRAM file definition and header container, the data container named in
+    the CRAI, the FASTA index and the reference slice under the locus.
+    ``url_for`` gives each file's URL.
+    """
+    with gzip.open(CRAM + ".crai", "rt") as f:
+        _seq, _start, _span, container, slice_off, slice_len = \
+            map(int, f.readline().split())
+    with open(FASTA + ".fai") as f:
+        _name, _length, seq_off, _bases, line_len = f.readline().split()
+    ref_start = int(seq_off) + 400_000 // 60 * int(line_len)
+    cram, crai = url_for(CRAM), url_for(CRAM + ".crai")
+    fasta, fai = url_for(FASTA), url_for(FASTA + ".fai")
+    return [
+        (crai,  {}),
+        (cram,  {"Range": "bytes=0-65535"}),
+        (cram,  {"Range": f"bytes={container}-"
+                          f"{container + slice_off + slice_len - 1}"}),
+        (fai,   {}),
+        (fasta, {"Range": f"bytes={ref_start}-{ref_start + 10_000}"}),
+    ]
+
+
+def bench_keepalive(args) -> None:
+    """Latency of one locus jump: new connection per request vs keep-alive."""
+    server.configure_server(engine=args.engine or "threading")
+    requests = [(urlsplit(u).path, h) for u, h in _locus_jump_requests()]
+    port = server.get_server_port()
+
+    def jump(conn: http.client.HTTPConnection | None) -> float:
+        t0 = time.perf_counter()
+        for path, headers in requests:
+            c = conn or http.client.HTTPConnection("127.0.0.1", port)
+            c.request("GET", path,
+                      headers=headers if conn else {**headers, "Connection": "close"})
+            c.getresponse().read()
+            if conn is None:
+                c.close()
+        return (time.perf_counter() - t0) * 1000
+
+    print(f"{'mode':<22} {'median ms':>10} {'p95 ms':>8}")
+    for mode in ("connection per request", "keep-alive"):
+        conn = http.client.HTTPConnection("127.0.0.1", port) \
+            if mode == "keep-alive" else None
+        times = sorted(jump(conn) for _ in range(args.jumps))
+        print(f"{mode:<22} {statistics.median(times):>10.2f} "
+              f"{times[int(len(times) * 0.95) - 1]:>8.2f}")
+
+
+def bench_blockcache(args) -> None:
+    """
+    Repeated locus jumps over keep-alive with the block cache off and on.
+    Local disks answer from the page cache either way; the disk reads that
+    ``bytes saved`` avoids are what matters on network storage.
+    """
+    server.configure_server(engine=args.engine or "threading")
+    requests = [(urlsplit(u).path, h) for u, h in _locus_jump_requests()]
+    conn = http.client.HTTPConnection("127.0.0.1", server.get_server_port())
+
+    print(f"{'cache':<8} {'median ms':>10} {'hits':>7} {'misses':>7} "
+          f"{'MB saved':>9}")
+    for label, capacity in (("off", 0), ("64 MiB", 64 * 1024 * 1024)):
+        server.configure_server(block_cache_size=capacity)
+        before = server.server_stats()["block_cache"]
+        times = []
+        for _ in range(args.jumps):
+            t0 = time.perf_counter()
+            for path, headers in requests:
+                conn.request("GET", path, headers=headers)
+                conn.getresponse().read()
+            times.append((time.perf_counter() - t0) * 1000)
+        after = server.server_stats()["block_cache"]
+        print(f"{label:<8} {statistics.median(times):>10.2f} "
+              f"{after['hits'] - before['hits']:>7} "
+              f"{after['misses'] - before['misses']:>7} "
+              f"{(after['bytes_saved'] - before['bytes_saved']) / 1e6:>9.1f}")
+
+
+def bench_cachedread(args) -> None:
+    """
+    Random range reads of each size, from ``--clients`` keep-alive
+    connections for ``--seconds``, read through the block cache versus
+    sent with sendfile.  Ranges fall in the first 32 MiB of the FASTA, so
+    the cache answers from memory once warm.  Reports requests per second,
+    median latency and the server's CPU per GB for each, to pick
+    ``_CACHED_READ_MAX``.
+    """
+    server.configure_server(engine=args.engine or "threading", fair_share=False,
+                            block_cache_size=64 * 1024 * 1024)
+    path = urlsplit(server.register_file(FASTA)).path
+    port = server.get_server_port()
+    hot  = min(32 << 20, os.path.getsize(FASTA))
+    limit = server._CACHED_READ_MAX
+
+    print(f"{'range':>8} {'mode':<9} {'req/s':>8} {'p50 ms':>8} {'CPU s/GB':>9}")
+    for range_len in (16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20):
+        for mode, cached in (("sendfile", 0), ("cache", range_len)):
+            server._CACHED_READ_MAX = cached
+            q: mp.Queue = mp.Queue()
+            procs = [mp.Process(target=_range_client,
+                                args=(port, path, hot, range_len, args.seconds,
+                                      seed, q))
+                     for seed in range(args.clients)]
+            cpu0 = time.process_time()
+            for p in procs:
+                p.start()
+            results = [q.get() for _ in procs]
+            for p in procs:
+                p.join()
+            cpu = time.process_time() - cpu0
+            lat = sorted(t for r in results for t in r[3])
+            gb  = sum(r[2] for r in results) / 1e9
+            print(f"{range_len >> 10:>7}K {mode:<9} "
+                  f"{sum(r[1] for r in results) / args.seconds:>8.0f} "
+                  f"{lat[len(lat) // 2] * 1e3:>8.3f} {cpu / gb:>9.2f}")
+    server._CACHED_READ_MAX = limit
+    server.configure_server(fair_share=True)
+
+
+def bench_readahead(args) -> None:
+    """
+    Pan across the FASTA from a cold page cache with read-ahead off and on.
+    Each step is a range request for the next ``--range-len`` bytes after
+    a short pause standing in for igv.js drawing the previous one.  Pages
+    are dropped with ``posix_fadvise(DONTNEED)`` before each run (Linux).
+    """
+    server.configure_server(engine=args.engine or "threading")
+    path = urlsplit(server.register_file(FASTA)).path
+    conn = http.client.HTTPConnection("127.0.0.1", server.get_server_port())
+    size = os.path.getsize(FASTA)
+    steps = min(args.jumps, size // args.range_len)
+
+    print(f"{'read-ahead':<11} {'median ms':>10} {'p95 ms':>8} {'issued':>7}")
+    for label, enabled in (("off", False), ("on", True)):
+        server.configure_server(readahead=enabled, block_cache_size=0)
+        fd = os.open(FASTA, os.O_RDONLY)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+        issued = server.server_stats()["readahead"]["issued"]
+        times = []
+        for i in range(steps):
+            start = i * args.range_len
+            t0 = time.perf_counter()
+            conn.request("GET", path, headers={
+                "Range": f"bytes={start}-{start + args.range_len - 1}"})
+            conn.getresponse().read()
+            times.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.005)
+        times.sort()
+        print(f"{label:<11} {statistics.median(times):>10.2f} "
+              f"{times[int(len(times) * 0.95) - 1]:>8.2f} "
+              f"{server.server_stats()['readahead']['issued'] - issued:>7}")
+
+
+def bench_registry(args) -> None:
+    """
+    Registry cost with ``--files`` files registered: first registration,
+    re-registering every path (what each Streamlit rerun does), a
+    ``register_files`` batch, and serving a HEAD request.
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"sample{i:06d}.bam") for i in range(args.files)]
+        for path in paths:
+            open(path, "wb").close()
+
+        def timed(fn) -> float:
+            t0 = time.perf_counter()
+            fn()
+            return (time.perf_counter() - t0) / len(paths) * 1e6
+
+        first  = timed(lambda: [server.register_file(p) for p in paths])
+        again  = timed(lambda: [server.register_file(p) for p in paths])
+        batch  = timed(lambda: server.register_files(paths))
+        target = urlsplit(server.register_file(paths[-1])).path
+        conn = http.client.HTTPConnection("127.0.0.1", server.get_server_port())
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            conn.request("HEAD", target)
+            conn.getresponse().read()
+        head = (time.perf_counter() - t0) * 1000
+
+    print(f"{args.files} files registered")
+    print(f"{'register_file, first':<26} {first:>8.2f} us/file")
+    print(f"{'register_file, again':<26} {again:>8.2f} us/file")
+    print(f"{'register_files (batch)':<26} {batch:>8.2f} us/file")
+    print(f"{'HEAD request':<26} {head:>8.2f} us/request")
+
+
+def bench_prefork(args) -> None:
+    """
+    Range-request throughput of the pre-forked server with 1, 2, 4, ...
+    ``--workers`` processes, each driven by twice as many keep-alive clients
+    for ``--seconds``.  Scaling needs as many free cores as worker and
+    client processes together.
+    """
+    import tempfile
+
+    from igv_streamlit import _prefork
+
+    size = os.path.getsize(BAM)
+    st   = os.stat(BAM)
+    counts = sorted({min(2 ** i, args.workers)
+                     for i in range(args.workers.bit_length() + 1)})
+    print(f"{os.cpu_count()} CPUs, {args.range_len} byte ranges of the BAM")
+    print(f"{'workers':>7} {'clients':>7} {'req/s':>9} {'MB/s':>8} {'speedup':>8}")
+    base = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in counts:
+            pool = _prefork.WorkerPool(0, n, os.path.join(tmp, f"{n}.jsonl"),
+                                       server._worker_config())
+            pool.registry.append("bench", server._FileRecord(BAM, st))
+            port = pool.server_address[1]
+            try:
+                clients = 2 * n
+                q: mp.Queue = mp.Queue()
+                procs = [mp.Process(target=_range_client,
+                                    args=(port, "/file/bench", size, args.range_len,
+                                          args.seconds, i, q))
+                         for i in range(clients)]
+                for p in procs:
+                    p.start()
+                results = [q.get() for _ in procs]
+                for p in procs:
+                    p.join()
+            finally:
+                pool.shutdown()
+                pool.serve_forever()
+            rate  = sum(r[1] for r in results) / args.seconds
+            mb    = sum(r[2] for r in results) / args.seconds / 1e6
+            base  = base or rate
+            print(f"{n:>7} {clients:>7} {rate:>9.0f} {mb:>8.1f} {rate / base:>7.2f}x")
+
+
+def bench_fairness(args) -> None:
+    """
+    Three sessions at once for ``--seconds``: a "hog" with ``--clients``
+    connections and a "bulk" session with one, both fetching 4 MiB ranges
+    of the FASTA, and a "small" one fetching 16 KiB slices.  Reports each
+    session's bandwidth and request latency with fair scheduling off, on,
+    and on with ``--session-rate`` (if given).  The clients run on this
+    machine too, so shares only follow the scheduler when the server, not
+    the clients, is short of CPU or disk.  ``--engine`` picks the server
+    engine.
+    """
+    if args.engine:
+        server.configure_server(engine=args.engine)
+    url  = server.register_file(FASTA)
+    path = urlsplit(url).path
+    port = server.get_server_port()
+    size = os.path.getsize(FASTA)
+    sessions = [("hog", args.clients, 4 << 20), ("bulk", 1, 4 << 20),
+                ("small", 1, 16 << 10)]
+
+    print(f"{'fair':<5} {'session':<7} {'conns':>5} {'MB/s':>8} "
+          f"{'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    settings = [("off", False, 0), ("on", True, 0)]
+    if args.session_rate:
+        settings.append(("cap", True, args.session_rate))
+    for label, fair, rate in settings:
+        server.configure_server(fair_share=fair, session_rate=rate)
+        q: mp.Queue = mp.Queue()
+        procs = [mp.Process(target=_range_client,
+                            args=(port, path, size, range_len, args.seconds,
+                                  seed, q, name))
+                 for seed, (name, conns, range_len) in enumerate(
+                     s for s in sessions for _ in range(s[1]))]
+        for p in procs:
+            p.start()
+        results = [q.get() for _ in procs]
+        for p in procs:
+            p.join()
+        for name, conns, _ in sessions:
+            mine = [r for r in results if r[0] == name]
+            lat  = sorted(t for r in mine for t in r[3])
+            print(f"{label:<5} {name:<7} {conns:>5} "
+                  f"{sum(r[2] for r in mine) / args.seconds / 1e6:>8.1f} "
+                  f"{sum(r[1] for r in mine) / args.seconds:>8.1f} "
+                  f"{lat[len(lat) // 2] * 1e3:>8.2f} "
+                  f"{lat[int(len(lat) * 0.95)] * 1e3:>8.2f}")
+    print(server.server_stats()["scheduler"])
+    server.configure_server(fair_share=True, session_rate=0)
+
+
+class _SlowUpstream(BaseHTTPRequestHandler):
+    """
+    Remote server stand-in: serves ``local-data`` with range support, after
+    ``latency`` seconds per request.  A ``stall_rate`` share of requests
+    take ``stall_latency`` instead, and an ``error_rate`` share fail.
+    """
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    stall_rate = stall_latency = error_rate = 0.0
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def handle(self) -> None:
+        try:
+            super().handle()
+        except ConnectionError:
+            pass                        # a hedged request's loser, dropped
+
+    def do_GET(self) -> None:
+        if random.random() < self.error_rate:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        time.sleep(self.stall_latency if random.random() < self.stall_rate
+                   else self.latency)
+        path = os.path.join(DATA, os.path.basename(self.path))
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        spec = self.headers.get("Range", "").removeprefix("bytes=")
+        if spec:
+            first, _, last = spec.partition("-")
+            start, end = int(first), min(int(last or end), end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", f'"{os.stat(path).st_mtime_ns:x}"')
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            self.wfile.write(f.read(end - start + 1))
+
+
+class _SlowFtpUpstream(socketserver.StreamRequestHandler):
+    """
+    FTP server stand-in: anonymous, passive-mode reads of ``local-data``
+    with ``REST``, after ``latency`` seconds per command.
+    """
+
+    latency = 0.0
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.reply("220 stand-in")
+        rest, passive = 0, None
+        for line in self.rfile:
+            cmd, _, arg = line.decode().strip().partition(" ")
+            cmd  = cmd.upper()
+            path = os.path.join(DATA, os.path.basename(arg))
+            time.sleep(self.latency)
+            if cmd in ("SIZE", "MDTM", "RETR") and not os.path.isfile(path):
+                self.reply("550 No such file")
+            elif cmd == "SIZE":
+                self.reply(f"213 {os.path.getsize(path)}")
+            elif cmd == "MDTM":
+                self.reply(time.strftime("213 %Y%m%d%H%M%S",
+                                         time.gmtime(os.path.getmtime(path))))
+            elif cmd in ("PASV", "EPSV"):
+                passive = socket.create_server(("127.0.0.1", 0))
+                port = passive.getsockname()[1]
+                self.reply(f"229 Extended Passive Mode (|||{port}|)" if cmd == "EPSV"
+                           else f"227 Passive Mode (127,0,0,1,{port >> 8},{port & 255})")
+            elif cmd == "REST":
+                rest = int(arg)
+                self.reply(f"350 Restarting at {rest}")
+            elif cmd == "RETR":
+                self.reply("150 Sending")
+                conn, _ = passive.accept()
+                passive.close()
+                try:
+                    with open(path, "rb") as f:
+                        conn.sendfile(f, rest)
+                    self.reply("226 Done")
+                except OSError:
+                    self.reply("426 Aborted")
+                finally:
+                    conn.close()
+                rest = 0
+            elif cmd == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:                           # USER, PASS, TYPE, NOOP
+                self.reply({"USER": "331 Any password", "PASS": "230 In"}.get(
+                    cmd, "200 OK"))
+
+
+def bench_proxy(args) -> None:
+    """
+    A locus jump on the bundled CRAM and FASTA from a stand-in remote server
+    (``--upstream`` http or ftp) with ``--latency`` seconds per request or
+    FTP command: fetched directly (http), through the caching proxy from
+    cold, and through it again once cached.
+    """
+    import tempfile
+
+    if args.upstream == "ftp":
+        _SlowFtpUpstream.latency = args.latency
+        upstream = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SlowFtpUpstream)
+    else:
+        _SlowUpstream.latency = args.latency
+        upstream = ThreadingHTTPServer(("127.0.0.1", 0), _SlowUpstream)
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    origin = f"{args.upstream}://127.0.0.1:{upstream.server_address[1]}/"
+    requests = _locus_jump_requests(lambda path: origin + os.path.basename(path))
+
+    def jump(urls) -> float:
+        conns = {}
+        t0 = time.perf_counter()
+        for url, headers in urls:
+            u = urlsplit(url)
+            conn = conns.get(u.port) or conns.setdefault(
+                u.port, http.client.HTTPConnection(u.hostname, u.port))
+            conn.request("GET", u.path, headers=headers)
+            conn.getresponse().read()
+        return (time.perf_counter() - t0) * 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.configure_server(engine=args.engine or "threading", cache_dir=tmp)
+        proxied = [(server.register_remote(url), h) for url, h in requests]
+        print(f"{args.latency * 1000:.0f} ms per upstream {args.upstream} "
+              f"{'command' if args.upstream == 'ftp' else 'request'}")
+        print(f"{'':<14} {'ms':>8} {'upstream requests':>18}")
+        runs = [("direct", requests)] if args.upstream == "http" else []
+        for label, urls in runs + [("proxy, cold", proxied),
+                                   ("proxy, warm", proxied)]:
+            before = server.server_stats()["proxy"]["upstream_requests"]
+            ms = jump(urls)
+            after = server.server_stats()["proxy"]["upstream_requests"]
+            print(f"{label:<14} {ms:>8.1f} {after - before:>18}")
+        print(server.server_stats()["proxy"])
+
+
+def bench_mirrors(args) -> None:
+    """
+    ``--jumps`` uncached 64 KiB reads of the bundled FASTA through the
+    caching proxy, from stand-in remotes taking ``--latency`` seconds per
+    request: one whose ``--stall-rate`` of requests stall for 20 times as
+    long; that one plus a steady mirror 50% slower and a mirror failing
+    ``--error-rate`` of requests, hedged at the 95th percentile; and those
+    three raced.
+    """
+    import tempfile
+
+    def start(**behaviour) -> str:
+        upstream = ThreadingHTTPServer(
+            ("127.0.0.1", 0), type("Mirror", (_SlowUpstream,), behaviour))
+        upstream.daemon_threads = True
+        threading.Thread(target=upstream.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{upstream.server_address[1]}/" + \
+               os.path.basename(FASTA)
+
+    def stalling() -> str:
+        return start(latency=args.latency, stall_rate=args.stall_rate,
+                     stall_latency=20 * args.latency)
+
+    def mirrors() -> list[str]:
+        return [stalling(), start(latency=1.5 * args.latency),
+                start(latency=args.latency, error_rate=args.error_rate)]
+
+    rnd = random.Random(0)
+    offsets = [rnd.randrange(os.path.getsize(FASTA) - 65536)
+               for _ in range(args.jumps)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Nothing is kept, so every read goes upstream
+        server.configure_server(engine=args.engine or "threading",
+                                cache_dir=tmp, proxy_cache_size=0)
+        print(f"{args.latency * 1000:.0f} ms per upstream request, "
+              f"{args.stall_rate:.0%} stalls, {args.error_rate:.0%} errors")
+        print(f"{'':<16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'failed':>7} {'hedged':>7}")
+        for label, percentile, urls in (
+                ("one server",      95, lambda: [stalling()]),
+                ("mirrors, hedged", 95, mirrors),
+                ("mirrors, raced",   0, mirrors)):
+            server.configure_server(hedge_percentile=percentile)
+            url  = urlsplit(server.register_remote(urls()))
+            conn = http.client.HTTPConnection(url.hostname, url.port)
+            before = server.server_stats()["proxy"]["hedged"]
+            times, failed = [], 0
+            for offset in offsets:
+                t0 = time.perf_counter()
+                conn.request("GET", url.path,
+                             headers={"Range": f"bytes={offset}-{offset + 65535}"})
+                response = conn.getresponse()
+                response.read()
+                times.append((time.perf_counter() - t0) * 1000)
+                failed += response.status != 206
+            conn.close()
+            q = statistics.quantiles(times, n=100)
+            hedged = server.server_stats()["proxy"]["hedged"] - before
+            print(f"{label:<16} {q[49]:>8.1f} {q[94]:>8.1f} {q[98]:>8.1f} "
+                  f"{failed:>7} {hedged:>7}")
+        print(server.server_stats()["proxy"]["mirrors"])
+
+
+def _cache_client(cache_dir: str, url: str, cache_size: int, reads: int,
+                  length: int, seed: int, q) -> None:
+    from igv_streamlit import _proxy
+    server.configure_server(cache_dir=cache_dir, proxy_cache_size=cache_size)
+    with open(FASTA, "rb") as f:
+        expected = f.read()
+    rnd = random.Random(seed)
+    # Most reads in a hot first 4 MiB, as views keep coming back to loci
+    hot = min(4 << 20, len(expected)) - length
+    bad = 0
+    t0  = time.perf_counter()
+    for _ in range(reads):
+        offset = rnd.randrange(hot if rnd.random() < 0.8 else len(expected) - length)
+        bad += _proxy.read((url,), offset, length) != expected[offset:offset + length]
+    q.put((bad, time.perf_counter() - t0, _proxy.stats()))
+
+
+def bench_sharedcache(args) -> None:
+    """
+    ``--workers`` processes each making ``--jumps`` ``--range-len`` reads of
+    the bundled FASTA through the caching proxy, from a stand-in remote
+    taking ``--latency`` seconds per request, with ``proxy_cache_size`` a
+    quarter of the file so blocks are evicted all along: sharing one
+    ``cache_dir``, then each with its own.  Every byte read is checked.
+    """
+    import tempfile
+
+    _SlowUpstream.latency = args.latency
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), _SlowUpstream)
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{upstream.server_address[1]}/" + os.path.basename(FASTA)
+    cache_size = os.path.getsize(FASTA) // 4
+
+    print(f"{args.workers} workers, {args.latency * 1000:.0f} ms per upstream "
+          f"request, {cache_size / 1e6:.1f} MB cache")
+    print(f"{'cache_dir':<9} {'reads/s':>8} {'hit rate':>8} {'upstream MB':>11} "
+          f"{'evictions':>9} {'corrupt':>7}")
+    for label in ("shared", "separate"):
+        with tempfile.TemporaryDirectory() as tmp:
+            q: mp.Queue = mp.Queue()
+            procs = [mp.Process(target=_cache_client,
+                                args=(tmp if label == "shared" else
+                                      os.path.join(tmp, str(i)),
+                                      url, cache_size, args.jumps, args.range_len,
+                                      i, q))
+                     for i in range(args.workers)]
+            for p in procs:
+                p.start()
+            results = [q.get() for _ in procs]
+            for p in procs:
+                p.join()
+        stats = [r[2] for r in results]
+        hits  = sum(st["hits"] for st in stats)
+        rate  = args.workers * args.jumps / max(r[1] for r in results)
+        print(f"{label:<9} {rate:>8.1f} "
+              f"{hits / (hits + sum(st['misses'] for st in stats)):>8.0%} "
+              f"{sum(st['upstream_bytes'] for st in stats) / 1e6:>11.1f} "
+              f"{sum(st['evictions'] for st in stats):>9} "
+              f"{sum(r[0] for r in results):>7}")
+
+
+SCENARIOS = {
+    "sendfile":    bench_sendfile,
+    "concurrency": bench_concurrency,
+    "keepalive":   bench_keepalive,
+    "blockcache":  bench_blockcache,
+    "cachedread":  bench_cachedread,
+    "readahead":   bench_readahead,
+    "registry":    bench_registry,
+    "prefork":     bench_prefork,
+    "fairness":    bench_fairness,
+    "proxy":       bench_proxy,
+    "mirrors":     bench_mirrors,
+    "sharedcache": bench_sharedcache,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--clients",   type=int, default=4,
+                        help="client processes (fairness: the hog's connections; "
+                             "cachedread)")
+    parser.add_argument("--full",      type=int, default=10,
+                        help="whole-file GETs per client")
+    parser.add_argument("--ranges",    type=int, default=200,
+                        help="range GETs per client")
+    parser.add_argument("--range-len", type=int, default=256 * 1024)
+    parser.add_argument("--connections", type=int, default=1000,
+                        help="concurrent connections (concurrency)")
+    parser.add_argument("--engine", choices=server._ENGINES,
+                        help="server engine (concurrency: default compares both; "
+                             "fairness)")
+    parser.add_argument("--jumps", type=int, default=200,
+                        help="locus jumps / pan steps / reads to time (keepalive, "
+                             "blockcache, readahead, mirrors, sharedcache)")
+    parser.add_argument("--max-workers", type=int,
+                        help="server max_workers (concurrency)")
+    parser.add_argument("--files", type=int, default=50_000,
+                        help="registered files (registry)")
+    parser.add_argument("--session-rate", type=float,
+                        help="per-session cap in bytes/s to also try (fairness)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="most worker processes to try (prefork), or "
+                             "processes sharing a cache (sharedcache)")
+    parser.add_argument("--latency", type=float, default=0.08,
+                        help="seconds per upstream request or FTP command "
+                             "(proxy, mirrors, sharedcache)")
+    parser.add_argument("--upstream", choices=("http", "ftp"), default="http",
+                        help="protocol of the stand-in remote server (proxy)")
+    parser.add_argument("--stall-rate", type=float, default=0.05,
+                        help="share of upstream requests that stall (mirrors)")
+    parser.add_argument("--error-rate", type=float, default=0.3,
+                        help="share of requests a flaky mirror fails (mirrors)")
+    parser.add_argument("--seconds", type=float, default=5.0,
+                        help="load duration per worker count (prefork), "
+                             "setting (fairness) or size and mode (cachedread)")
+    args = parser.parse_args()
+    SCENARIOS[args.scenario](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -47,13 +47,22 @@ when pointing to files on the local filesystem:
 from __future__ import annotations
 
 import copy
+import hashlib
+import logging
 import os
 import inspect
 from typing import Any
+from urllib.parse import quote, urlsplit
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-from .server import register_file
+from . import _fasta, _proxy, _tabix, server
+from ._streamlit_mount import file_middleware
+from .server import (configure_server, register_file, register_files,
+                     server_stats)
+
+logger = logging.getLogger(__name__)
 
 # ── igv.js CDN (pinned to a stable 3.x release) ──────────────────────────────
 _IGV_JS_URL = "https://cdn.jsdelivr.net/npm/igv@3.1.2/dist/igv.min.js"
@@ -67,6 +76,10 @@ _PATH_TO_URL: dict[str, str] = {
     "aliasPath":   "aliasURL",
 }
 
+# Remote URLs the caching proxy may serve: ftp:// and lists of mirror URLs
+# always, http(s):// with configure_server(proxy_remote=True)
+_PROXIED_KEYS = frozenset({"url", "indexURL", "fastaURL"})
+
 # ── JavaScript for the v2 component ──────────────────────────────────────────
 _JS = r"""
 export default function(component) {
@@ -443,22 +456,151 @@ _igv_component = st.components.v2.component(
 
 # ── helpers ───────────────────────────────────────────────────────────────────
 
-def _resolve_local_paths(obj: Any) -> Any:
+def _auto_index_track(track: dict) -> dict:
+    """
+    Point a large, unindexed plain-text track (GFF/GTF/BED/VCF ``path``) at a
+    sorted, bgzipped, tabix-indexed copy so igv.js only fetches the visible
+    region instead of downloading and parsing the whole file.
+
+    The copy is built once per file version in the artifact store, on a
+    background thread; until it is ready (and if it can't be built) the
+    track is served as-is.  Tracks that don't qualify are returned as-is
+    too, minus the ``autoIndex`` option, which igv.js doesn't know.
+    """
+    auto  = track.get("autoIndex")
+    track = {k: v for k, v in track.items() if k != "autoIndex"}
+    path  = track.get("path")
+
+    if (auto is False or not isinstance(path, str)
+            or "indexPath" in track or "indexURL" in track
+            or _tabix.preset_for(path) is None or not os.path.isfile(path)):
+        return track
+    if auto is None and not (
+            server._auto_index
+            and os.path.getsize(path) >= server._auto_index_min_size):
+        return track
+
+    try:
+        built = _tabix.built_indexed_copy(os.path.abspath(path))
+    except OSError:
+        return track
+    if built is None:                   # being built (or failed to)
+        return track
+    gz, tbi = built
+
+    # The trailing file name lets igv.js infer format/compression from the URL
+    name = quote(os.path.basename(path))
+    del track["path"]
+    track["url"]      = f"{register_file(gz)}/{name}.gz"
+    track["indexURL"] = f"{register_file(tbi)}/{name}.gz.tbi"
+    return track
+
+
+def _index_reference(reference: dict) -> dict:
+    """
+    Add an ``indexPath`` to a reference with a local ``fastaPath`` but no
+    index, so igv.js fetches only the visible sequence instead of
+    downloading the whole FASTA.  An existing ``<fasta>.fai`` is used if it
+    is up to date; otherwise one is built once per file version in the
+    artifact store.
+    """
+    fasta = reference.get("fastaPath")
+    if (not isinstance(fasta, str) or "indexPath" in reference
+            or "indexURL" in reference or not os.path.isfile(fasta)):
+        return reference
+    try:
+        fai = _fasta.fai_for(fasta)
+    except (OSError, ValueError):
+        logger.warning("igv-streamlit: could not index %s; igv.js will "
+                       "download it in full", fasta, exc_info=True)
+        return reference
+    return {**reference, "indexPath": fai}
+
+
+def _session_id() -> str | None:
+    """
+    A short id for the current Streamlit session, added to track data URLs
+    so the file server can share bandwidth fairly between sessions.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return None
+    return hashlib.sha256(ctx.session_id.encode()).hexdigest()[:16]
+
+
+def _is_proxied(value: Any, proxy: bool | None) -> bool:
+    """
+    Whether the caching proxy serves the URL ``value``, given the track's
+    own ``proxy`` setting.  FTP, which igv.js can't read itself, and lists
+    of mirror URLs, which it can't choose between, always are unless the
+    track says otherwise.
+    """
+    mirrored = isinstance(value, list) and len(value) > 0
+    urls = value if mirrored else [value]
+    if not all(isinstance(url, str) for url in urls):
+        return False
+    schemes = {urlsplit(url).scheme.lower() for url in urls}
+    if proxy is None:
+        proxy = mirrored or "ftp" in schemes or server._proxy_remote
+    return bool(proxy) and schemes <= set(_proxy.SCHEMES)
+
+
+def _with_session(url: str, track: dict, session: str | None) -> str:
+    """
+    Tag the file server URL of a BAM or CRAM ``track`` with ``session``, so
+    its large bodies take turns with other sessions'.  The tag is part of
+    the browser's cache key, so everything else, from feature tracks to
+    indexes and references, is left alone to stay the same across sessions.
+    """
+    if not session or not server._fair_share:
+        return url
+    data = {"url": track.get("url") or track.get("path"),
+            "format": track.get("format", "")}
+    if _proxy.index_kind(data) not in ("bam", "cram"):
+        return url
+    return f"{url}{'&' if '?' in url else '?'}{server._SESSION_PARAM}={session}"
+
+
+def _resolve_local_paths(obj: Any, session: str | None = None) -> Any:
     """
     Recursively walk a config dict/list and replace any ``path``-style
-    properties with ``url``-style ones pointing to the local file server.
+    properties with ``url``-style ones pointing to the local file server,
+    and remote URLs the caching proxy serves with proxied ones.  Alignments
+    served either way are tagged with ``session`` (see :func:`_with_session`).
     """
     if isinstance(obj, list):
-        return [_resolve_local_paths(item) for item in obj]
+        return [_resolve_local_paths(item, session) for item in obj]
 
     if isinstance(obj, dict):
+        proxy   = obj.get("proxy")
+        proxied = {key for key, value in obj.items()
+                   if key in _PROXIED_KEYS and _is_proxied(value, proxy)}
+        obj     = _auto_index_track({k: v for k, v in obj.items() if k != "proxy"})
         resolved: dict[str, Any] = {}
         for key, value in obj.items():
             if key in _PATH_TO_URL and isinstance(value, str):
                 url_key = _PATH_TO_URL[key]
                 resolved[url_key] = register_file(value)
+                if url_key == "url":
+                    resolved[url_key] = _with_session(resolved[url_key], obj, session)
+            elif key in proxied:
+                resolved[key] = server.register_remote(value)
+                if key == "url":
+                    resolved[key] = _with_session(resolved[key], obj, session)
+            elif key in _PROXIED_KEYS and isinstance(value, list) and value:
+                resolved[key] = value[0]        # mirrors, not proxied
             else:
-                resolved[key] = _resolve_local_paths(value)
+                resolved[key] = _resolve_local_paths(value, session)
+        data = next((key for key in ("fastaURL", "url") if key in proxied), None)
+        if data and obj.get("indexed") is not False \
+                and not {"indexURL", "indexPath"} & obj.keys():
+            # igv.js would guess the index by suffixing the proxied URL, which
+            # the file server answers 404; proxy the index it means instead
+            kind = _proxy.index_kind(obj)
+            if kind is not None:
+                urls = obj[data] if isinstance(obj[data], list) else [obj[data]]
+                resolved["indexURL"] = server.register_remote(
+                    list(_proxy.guessed_index(tuple(urls), kind)))
         return resolved
 
     return obj
@@ -472,20 +614,23 @@ def _build_igv_config(
     extra: dict,
 ) -> dict:
     config: dict[str, Any] = {}
+    session = _session_id()
 
     if genome and isinstance(genome, str):
         config["genome"] = genome
     elif genome and isinstance(genome, dict):
-        config["reference"] = _resolve_local_paths(copy.deepcopy(genome))
+        config["reference"] = _resolve_local_paths(
+            _index_reference(copy.deepcopy(genome)), session)
 
     if reference:
-        config["reference"] = _resolve_local_paths(copy.deepcopy(reference))
+        config["reference"] = _resolve_local_paths(
+            _index_reference(copy.deepcopy(reference)), session)
 
     if locus:
         config["locus"] = locus
 
     if tracks:
-        config["tracks"] = _resolve_local_paths(copy.deepcopy(tracks))
+        config["tracks"] = _resolve_local_paths(copy.deepcopy(tracks), session)
 
     config.update(extra)
     return config
@@ -579,4 +724,51 @@ def browser(
     return result
 
 
-__all__ = ["browser", "resolve_path"]
\ No newline at end of file
+def pin(tracks, loci, *, reference: dict | None = None,
+        workers: int = 8) -> dict[str, dict]:
+    """
+    Download and pin what igv.js reads of remote tracks to show ``loci``,
+    so an app can browse them offline.
+
+    Each track's index, the header of its data file and the byte ranges the
+    index gives for every locus (widened by its own width on each side) are
+    fetched through the caching proxy and pinned in its disk cache: pinned
+    blocks are never evicted and don't count toward ``proxy_cache_size``.
+    The app must serve the same tracks through the proxy (a track's
+    ``"proxy": True``, ``proxy_remote=True``, mirror lists or ``ftp://``)
+    with the same ``cache_dir``.  Also run as ``igv-streamlit pin``.
+
+    Parameters
+    ----------
+    tracks : list of dict, or dict of name to dict
+        igv.js track configs with ``url`` (and optionally ``indexURL``) of
+        remote BAM, CRAM or tabix-indexed files.
+    loci : list of str, or dict of name to str
+        Loci like ``"chr1:1,000,000-1,100,000"``, or whole references.
+    reference : dict, optional
+        A reference config whose ``fastaURL`` (with its ``.fai``) to pin too.
+    workers : int, optional
+        Ranges fetched at once (default: 8).
+
+    Returns
+    -------
+    dict
+        Per track name (and ``"reference"``): the ``bytes`` pinned, the
+        ``blocks`` needed and ``pinned_blocks`` of them, the fraction
+        ``complete`` and any ``errors``.
+    """
+    from . import _pin
+    return _pin.pin(tracks, loci, reference=reference, workers=workers)
+
+
+def unpin(tracks, *, reference: dict | None = None) -> int:
+    """
+    Unpin what :func:`pin` pinned of ``tracks`` (and ``reference``), leaving
+    it cached but evictable again.  Returns the bytes unpinned.
+    """
+    from . import _pin
+    return _pin.unpin(tracks, reference=reference)
+
+
+__all__ = ["browser", "configure_server", "file_middleware", "pin", "resolve_path",
+           "server_stats", "unpin"]
\ No newline at end of file
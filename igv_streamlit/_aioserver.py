@@ -0,0 +1,303 @@
+# igv_streamlit/_aioserver.py
+
+"""
+asyncio engine for the local file server.
+
+Speaks the same ``/file/<token>`` protocol as the threaded engine in
+:mod:`igv_streamlit.server` (responses are planned by the shared
+``_build_reply``), but multiplexes every connection on a single event-loop
+thread instead of spawning an OS thread per connection.  Replies are
+planned on the loop's default executor, or for proxied files on the proxy's
+own bounded one, so requests waiting on a slow upstream can't take the
+threads local files are read on.
+
+Bodies are streamed with ``loop.sendfile`` where the transport supports it,
+otherwise in ``_CHUNK_SIZE`` pieces gated by ``drain()``, so memory per
+connection is bounded by the transport's write buffer however slowly the
+client reads.  Connections are HTTP/1.1 keep-alive: each one has a
+header-read timeout for the first request, an idle timeout between
+requests, and every write must make progress within a write timeout (the
+``server`` module's ``_READ_TIMEOUT``, ``_KEEPALIVE_TIMEOUT`` and
+``_WRITE_TIMEOUT``).  Requests beyond ``max_requests`` in flight at once
+are answered ``503`` with ``Retry-After``.  Large bodies take turns between
+sessions under the same ``_scheduler`` as the threaded engine, waiting on
+the event loop rather than blocking it.
+
+Enable with ``igv_streamlit.configure_server(engine="asyncio")``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+from email.utils import formatdate
+from http import HTTPStatus
+
+from . import server as _srv
+
+logger = logging.getLogger(__name__)
+
+_MAX_HEADER_BYTES = 65536
+_SENDFILE_SLICE   = 1 << 20   # bytes per loop.sendfile call (timeout granularity)
+
+
+class _Headers(dict):
+    """Request headers keyed by lower-cased name."""
+
+    def get(self, name: str, default=None):
+        return super().get(name.lower(), default)
+
+
+def _parse_head(head: bytes) -> tuple[str, str, str, _Headers] | None:
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        return None
+    headers = _Headers()
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            return None
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def _status_line(status: int) -> str:
+    try:
+        phrase = HTTPStatus(status).phrase
+    except ValueError:
+        phrase = ""
+    return f"HTTP/1.1 {status} {phrase}\r\n"
+
+
+class AsyncFileServer:
+    """
+    Minimal asyncio HTTP server for registered files.
+
+    Mirrors the parts of ``ThreadingHTTPServer`` that ``server._start_server``
+    uses: the socket is bound in the constructor, :meth:`serve_forever` runs
+    the event loop in the calling thread and :meth:`shutdown` stops it from
+    any other thread.
+    """
+
+    def __init__(self, address: tuple[str, int], max_requests: int,
+                 reuse_port: bool = False):
+        self.socket = socket.create_server(address, backlog=1024,
+                                           reuse_port=reuse_port)
+        self.server_address = self.socket.getsockname()
+        self.max_requests = max_requests
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Only touched on the event loop thread
+        self.connections = self.active = self.peak_active = 0
+        self.accepted = self.rejected = 0
+
+    def serve_forever(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    def shutdown(self) -> None:
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def stats(self) -> dict[str, int]:
+        return {"max_requests": self.max_requests,
+                "connections":  self.connections,
+                "active":       self.active,
+                "peak_active":  self.peak_active,
+                "accepted":     self.accepted,
+                "rejected":     self.rejected}
+
+    async def _serve(self) -> None:
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(
+            self._handle_connection, sock=self.socket, limit=_MAX_HEADER_BYTES)
+        async with server:
+            await self._stop.wait()
+        # Connections still open are closed before the loop is
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    # ── per connection ───────────────────────────────────────────────────────
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter) -> None:
+        # asyncio only sets TCP_NODELAY itself when the listening socket was
+        # created with an explicit IPPROTO_TCP, which create_server() doesn't
+        # do; without it each response waits on the client's delayed ACK.
+        writer.get_extra_info("socket").setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections += 1
+        timeout = _srv._READ_TIMEOUT
+        try:
+            while await self._handle_request(reader, writer, timeout):
+                timeout = _srv._KEEPALIVE_TIMEOUT
+        except (ConnectionError, TimeoutError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("igv-streamlit: error serving request")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter,
+                              timeout: float) -> bool:
+        """Serve one request; return whether the connection may be reused."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise
+            return False                    # client closed an idle connection
+        except asyncio.LimitOverrunError:
+            await self._write_head(writer, _srv._empty_reply(431), False)
+            return False
+
+        request = _parse_head(head)
+        if request is None:
+            await self._write_head(writer, _srv._empty_reply(400), False)
+            return False
+        method, target, version, headers = request
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = (version == "HTTP/1.1" and "close" not in connection) or \
+                     (version == "HTTP/1.0" and "keep-alive" in connection)
+        # An unread request body would be parsed as the next request
+        keep_alive = keep_alive and not _srv._has_request_body(headers)
+
+        if method == "OPTIONS":
+            # Answered on the loop, even at capacity: no file, no executor
+            writer.write(_srv._preflight_response(keep_alive))
+            await asyncio.wait_for(writer.drain(), _srv._WRITE_TIMEOUT)
+            return keep_alive
+
+        if self.active >= self.max_requests:
+            self.rejected += 1
+            await self._write_head(writer, _srv._empty_reply(
+                503, ("Retry-After", str(_srv._RETRY_AFTER))), False)
+            await asyncio.wait_for(writer.drain(), _srv._WRITE_TIMEOUT)
+            return False
+
+        self.accepted += 1
+        self.active   += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            return await self._respond(writer, method, target, headers, keep_alive)
+        finally:
+            self.active -= 1
+
+    async def _respond(self, writer: asyncio.StreamWriter, method: str,
+                       target: str, headers: _Headers, keep_alive: bool) -> bool:
+        loop  = asyncio.get_running_loop()
+        reply = await loop.run_in_executor(
+            _srv._reply_executor(target), _srv._build_reply, method, target, headers)
+        session = None
+        try:
+            await self._write_head(writer, reply, keep_alive)
+            if method != "HEAD":
+                if _srv._fair_share and reply.bulk:
+                    session = _srv._session_key(
+                        target, writer.get_extra_info("peername"))
+                    _srv._scheduler.begin(session)
+                for segment in reply.segments:
+                    if isinstance(segment, bytes):
+                        if session:
+                            await _srv._scheduler.throttle_async(session, len(segment))
+                        writer.write(segment)
+                    elif not await (
+                            self._write_fair(writer, session, reply.handle.fd, *segment)
+                            if session else
+                            self._write_file(writer, reply.handle.fd, *segment)):
+                        # File shrank under us; Content-Length can't be met
+                        return False
+            await asyncio.wait_for(writer.drain(), _srv._WRITE_TIMEOUT)
+        finally:
+            if session:
+                _srv._scheduler.end(session)
+            reply.close()
+        return keep_alive
+
+    async def _write_head(self, writer: asyncio.StreamWriter,
+                          reply: _srv._Reply, keep_alive: bool) -> None:
+        lines = [_status_line(reply.status),
+                 f"Date: {formatdate(usegmt=True)}\r\n"]
+        if not keep_alive:
+            lines.append("Connection: close\r\n")
+        lines += [f"{name}: {value}\r\n" for name, value in reply.headers]
+        lines.append("\r\n")
+        writer.write("".join(lines).encode("latin-1"))
+
+    async def _write_fair(self, writer: asyncio.StreamWriter, session: str,
+                          fd: int, offset: int, count: int) -> bool:
+        """:meth:`_write_file` a slice at a time, taking turns with other sessions."""
+        loop = asyncio.get_running_loop()
+        end  = offset + count
+        while offset < end:
+            n = min(_srv._FAIR_SLICE, end - offset)
+            await _srv._scheduler.throttle_async(session, n)
+            if not _srv._scheduler.contended():
+                if not await self._write_file(writer, fd, offset, n):
+                    return False
+            else:
+                async with _srv._scheduler.turn_async(session, n):
+                    chunk = await loop.run_in_executor(None, _srv._pread, fd, n, offset)
+                    writer.write(chunk)
+                # Whatever a slow client can't take yet is waited out
+                # without holding up other sessions
+                await asyncio.wait_for(writer.drain(), _srv._WRITE_TIMEOUT)
+                if len(chunk) < n:
+                    return False
+            offset += n
+        return True
+
+    async def _write_file(self, writer: asyncio.StreamWriter,
+                          fd: int, offset: int, count: int) -> bool:
+        """
+        Stream ``count`` bytes of ``fd`` from ``offset``.
+
+        Returns ``False`` if the file ended before ``count`` bytes were sent.
+        """
+        loop = asyncio.get_running_loop()
+        end  = offset + count
+
+        if _srv._USE_SENDFILE and writer.get_extra_info("sslcontext") is None:
+            await asyncio.wait_for(writer.drain(), _srv._WRITE_TIMEOUT)
+            with open(fd, "rb", buffering=0, closefd=False) as f:
+                try:
+                    while offset < end:
+                        n = await asyncio.wait_for(
+                            loop.sendfile(writer.transport, f, offset,
+                                          min(_SENDFILE_SLICE, end - offset),
+                                          fallback=False),
+                            _srv._WRITE_TIMEOUT)
+                        if n == 0:
+                            return False
+                        offset += n
+                    return True
+                except asyncio.SendfileNotAvailableError:
+                    pass
+                except RuntimeError:
+                    # loop.sendfile's way of saying the client went away
+                    if writer.transport.is_closing():
+                        raise ConnectionResetError from None
+                    raise
+
+        while offset < end:
+            chunk = await loop.run_in_executor(
+                None, _srv._pread, fd, min(_srv._CHUNK_SIZE, end - offset), offset)
+            if not chunk:
+                return False
+            writer.write(chunk)
+            await asyncio.wait_for(writer.drain(), _srv._WRITE_TIMEOUT)
+            offset += len(chunk)
+        return True
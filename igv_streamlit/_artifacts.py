@@ -0,0 +1,363 @@
+# igv_streamlit/_artifacts.py
+
+"""
+On-disk store for files derived from registered files.
+
+Artifacts (compressed variants, indexes, ...) are keyed by the identity of
+the file they were built from -- path, inode, size and mtime -- so a changed
+source simply misses and is rebuilt; a stale artifact is never served.
+Builds write to a temporary file next to the final one and are published
+with an atomic ``os.replace``.  Several processes can share the store: a
+build holds a lock file next to the artifact, so the others wait for it
+instead of building the same artifact again, and removes it when done.
+
+Artifacts take at most ``_capacity`` bytes of disk.  Beyond that the least
+recently used are evicted after a build; recency is each artifact's atime,
+which using it bumps.
+
+The store lives in ``$IGV_STREAMLIT_CACHE_DIR``, falling back to
+``$XDG_CACHE_HOME/igv-streamlit`` or ``~/.cache/igv-streamlit``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:                     # Windows: no locks between processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_cache_dir: str | None = None
+
+# Artifacts are <digest[:2]>/<digest[2:]>-<source name><suffix>
+_DIGEST = re.compile(r"[0-9a-f]{40}")
+
+# Bytes of disk artifacts may take, and the fraction of it a trim evicts
+# down to, so a full store isn't scanned again after every build
+_capacity = 4 * 1024 * 1024 * 1024
+_TRIM_TO  = 0.9
+# Using an artifact bumps its atime at most this often (seconds)
+_TOUCH_INTERVAL = 3600.0
+_trimming = threading.Lock()
+
+_build_locks: dict[str, threading.Lock] = {}
+_build_locks_lock = threading.Lock()
+
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="igv-artifacts")
+_pending: set[str] = set()
+_failed:  set[str] = set()         # not retried until the source changes
+_pending_lock = threading.Lock()
+
+
+def cache_dir() -> str:
+    if _cache_dir is not None:
+        return _cache_dir
+    env = os.environ.get("IGV_STREAMLIT_CACHE_DIR")
+    if env:
+        return env
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "igv-streamlit")
+
+
+def set_cache_dir(path: str) -> None:
+    global _cache_dir
+    _cache_dir = os.path.abspath(path)
+
+
+def set_capacity(size: int) -> None:
+    """Cap the store at ``size`` bytes, evicting artifacts now if it is over."""
+    global _capacity
+    _capacity = size
+    trim()
+
+
+def lock_fd(fd: int, shared: bool = False, wait: bool = True) -> bool:
+    """
+    ``flock`` the open file ``fd`` against other processes (and other
+    descriptors of it in this one).  Returns ``False`` if ``wait`` is false
+    and someone else holds a conflicting lock.  A no-op without ``fcntl``.
+    """
+    if fcntl is None:
+        return True
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    try:
+        fcntl.flock(fd, operation if wait else operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def lock_range(fd: int, start: int, length: int, shared: bool = False,
+               wait: bool = True) -> bool:
+    """
+    ``lockf`` bytes ``start``-``start + length`` of ``fd`` (to the end of
+    the file and beyond for a ``length`` of 0).  Such locks belong to the
+    process, not the thread, and closing any descriptor of the file drops
+    them all.  Returns ``False`` if the lock wasn't taken: another process
+    holds a conflicting one and ``wait`` is false, or the kernel saw a
+    deadlock between this process's threads and another's.  A no-op
+    without ``fcntl``.
+    """
+    if fcntl is None:
+        return True
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    try:
+        fcntl.lockf(fd, operation if wait else operation | fcntl.LOCK_NB,
+                    length, start)
+    except OSError:
+        return False
+    return True
+
+
+def unlock_range(fd: int, start: int, length: int) -> None:
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_UN, length, start)
+
+
+@contextmanager
+def locked(path: str, remove: bool = False):
+    """
+    Hold an exclusive lock on the lock file ``path`` (created if missing),
+    and with ``remove`` delete the file before letting go of it.  Anyone
+    who opened it before then finds it gone once they get the lock, and
+    starts over on a new one.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        lock_fd(fd)
+        if _same_file(fd, path):
+            break
+        os.close(fd)
+    try:
+        yield
+    finally:
+        if remove:
+            try:
+                os.remove(path)
+            except OSError:             # Windows: someone else has it open
+                pass
+        os.close(fd)                    # releases the lock
+
+
+def _same_file(fd: int, path: str) -> bool:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    held = os.fstat(fd)
+    return (st.st_dev, st.st_ino) == (held.st_dev, held.st_ino)
+
+
+def artifact_path(source: str, st: os.stat_result, suffix: str) -> str:
+    """Where the ``suffix`` artifact of ``source`` (in state ``st``) lives."""
+    identity = f"{source}\0{st.st_dev}\0{st.st_ino}\0{st.st_size}\0{st.st_mtime_ns}"
+    digest   = hashlib.sha1(identity.encode("utf-8", "surrogateescape")).hexdigest()
+    name     = os.path.basename(source)
+    return os.path.join(cache_dir(), digest[:2], f"{digest[2:]}-{name}{suffix}")
+
+
+def display_name(path: str) -> str:
+    """
+    The file name of ``path``, or for an artifact the name of its source
+    plus its suffix (``genes.gff.gz``), without the digest in front.
+    """
+    name = os.path.basename(path)
+    digest, sep, rest = name.partition("-")
+    if sep and _DIGEST.fullmatch(os.path.basename(os.path.dirname(path)) + digest):
+        return rest
+    return name
+
+
+def _touch(path: str) -> bool:
+    """
+    Mark the artifact at ``path`` used, if it exists.  Only its atime
+    changes: its mtime is part of the ETag it is served with.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    now = time.time_ns()
+    if now - st.st_atime_ns > _TOUCH_INTERVAL * 1e9:
+        try:
+            os.utime(path, ns=(now, st.st_mtime_ns))
+        except OSError:
+            pass
+    return True
+
+
+def lookup(source: str, st: os.stat_result, suffix: str) -> str | None:
+    """Return the artifact's path if it has already been built."""
+    path = artifact_path(source, st, suffix)
+    return path if _touch(path) else None
+
+
+def get_or_build(
+    source: str,
+    suffix: str,
+    build: Callable[[str, str], None],
+    st: os.stat_result | None = None,
+) -> str:
+    """
+    Return the path of the ``suffix`` artifact of ``source``, building it
+    first with ``build(source, tmp_path)`` if needed.
+
+    Concurrent callers, in this process or others sharing the store, wait
+    for a single build.
+    """
+    st   = st or os.stat(source)
+    path = artifact_path(source, st, suffix)
+    if _touch(path):
+        return path
+
+    with _build_locks_lock:
+        lock = _build_locks.setdefault(path, threading.Lock())
+    with lock:
+        if _touch(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with locked(f"{path}.lock", remove=True):
+            # Another process may have built it while this one waited
+            if _touch(path):
+                return path
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                build(source, tmp)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    logger.info("igv-streamlit: built %s", path)
+    trim(keep=path)
+    return path
+
+
+def build_in_background(
+    source: str,
+    suffix: str,
+    build: Callable[[str, str], None],
+    st: os.stat_result | None = None,
+) -> None:
+    """Queue :func:`get_or_build` on a background thread (once per artifact)."""
+    st  = st or os.stat(source)
+    key = artifact_path(source, st, suffix)
+    with _pending_lock:
+        if key in _pending or key in _failed:
+            return
+        _pending.add(key)
+
+    def run() -> None:
+        try:
+            get_or_build(source, suffix, build, st)
+        except Exception:
+            logger.exception("igv-streamlit: failed to build %s", key)
+            with _pending_lock:
+                _failed.add(key)
+        finally:
+            with _pending_lock:
+                _pending.discard(key)
+
+    _background.submit(run)
+
+
+# ── eviction ────────────────────────────────────────────────────────────────
+
+def _scan() -> tuple[list[tuple[int, int, str]], list[str]]:
+    """
+    Every artifact in the store, as ``(last use, size, path)``, and every
+    lock file.
+    """
+    artifacts: list[tuple[int, int, str]] = []
+    locks: list[str] = []
+    try:
+        shards = os.listdir(cache_dir())
+    except FileNotFoundError:
+        return artifacts, locks
+    for shard in shards:
+        directory = os.path.join(cache_dir(), shard)
+        if len(shard) != 2 or not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if not _DIGEST.fullmatch(shard + name.partition("-")[0]):
+                continue
+            path = os.path.join(directory, name)
+            if name.endswith(".lock"):
+                locks.append(path)
+                continue
+            if name.endswith(".tmp"):
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            artifacts.append((st.st_atime_ns, st.st_size, path))
+    return artifacts, locks
+
+
+def trim(keep: str | None = None) -> None:
+    """
+    Evict the least recently used artifacts other than ``keep`` if the
+    store is over ``_capacity``, and remove lock files no build holds, left
+    by one that died.  One process at a time trims; the others skip it.
+    """
+    if not os.path.isdir(cache_dir()) or not _trimming.acquire(blocking=False):
+        return
+    try:
+        fd = os.open(os.path.join(cache_dir(), "artifacts.lock"),
+                     os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if not lock_fd(fd, wait=False):
+                return                  # another process is at it
+            artifacts, locks = _scan()
+            for path in locks:
+                _remove_unheld(path)
+            total = sum(size for _, size, _ in artifacts)
+            if total <= _capacity:
+                return
+            for _, size, path in sorted(artifacts):
+                if total <= _capacity * _TRIM_TO:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:         # gone already, or open on Windows
+                    continue
+                total -= size
+                logger.info("igv-streamlit: evicted %s", path)
+        finally:
+            os.close(fd)
+    finally:
+        _trimming.release()
+
+
+def _remove_unheld(path: str) -> None:
+    # The lock file ``path``, if no build holds it (see :func:`locked`)
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return
+    try:
+        if lock_fd(fd, wait=False) and _same_file(fd, path):
+            os.remove(path)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
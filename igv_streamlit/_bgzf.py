@@ -0,0 +1,106 @@
+# igv_streamlit/_bgzf.py
+
+"""
+BGZF, the blocked gzip of BAM files and bgzipped feature tracks, following
+the SAMtools specifications (https://samtools.github.io/hts-specs/).
+
+:class:`BgzfWriter` writes it and reports virtual offsets for an index;
+:func:`iter_blocks` reads the blocks of a file and :func:`complete_blocks`
+the whole blocks at the start of a buffer, such as the first bytes of a
+remote BAM.
+"""
+
+from __future__ import annotations
+
+import io
+import struct
+import zlib
+from typing import Iterator
+
+_BLOCK_DATA = 0xff00                    # uncompressed bytes per block (as htslib)
+_MAX_BLOCK  = 0x10000
+_HEADER     = struct.Struct("<4BI2BH2BHH")
+_EOF = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def _block(data: bytes, level: int = 6) -> bytes:
+    deflate = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata   = deflate.compress(data) + deflate.flush()
+    bsize   = _HEADER.size + len(cdata) + 8
+    if bsize > _MAX_BLOCK:
+        raise ValueError("BGZF block overflow")
+    header = _HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, bsize - 1)
+    return header + cdata + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+def _block_size(header: bytes, offset: int = 0) -> int:
+    fields = _HEADER.unpack_from(header, offset)
+    if fields[:4] != (31, 139, 8, 4) or fields[8:10] != (66, 67):
+        raise ValueError("not a BGZF file")
+    return fields[11] + 1
+
+
+def _inflate(block: memoryview | bytes) -> bytes:
+    return zlib.decompress(block[_HEADER.size:-8], -15)
+
+
+class BgzfWriter:
+    """Minimal BGZF writer that reports virtual offsets via :meth:`tell`."""
+
+    def __init__(self, fileobj: io.BufferedIOBase):
+        self._out     = fileobj
+        self._buf     = bytearray()
+        self._coffset = 0
+
+    def tell(self) -> int:
+        return (self._coffset << 16) | len(self._buf)
+
+    def write(self, data: bytes) -> None:
+        self._buf += data
+        while len(self._buf) >= _BLOCK_DATA:
+            self._flush_block(_BLOCK_DATA)
+
+    def close(self) -> None:
+        while self._buf:
+            self._flush_block(min(len(self._buf), _BLOCK_DATA))
+        self._out.write(_EOF)
+
+    def _flush_block(self, n: int) -> None:
+        data = bytes(self._buf[:n])
+        try:
+            block = _block(data)
+        except ValueError:              # incompressible: split it
+            half = n // 2
+            self._flush_block(half)
+            self._flush_block(n - half)
+            return
+        self._out.write(block)
+        self._coffset += len(block)
+        del self._buf[:n]
+
+
+def iter_blocks(fileobj: io.BufferedIOBase) -> Iterator[tuple[int, bytes]]:
+    """Yield ``(compressed_offset, uncompressed_data)`` for each BGZF block."""
+    offset = 0
+    while True:
+        header = fileobj.read(_HEADER.size)
+        if not header:
+            return
+        bsize = _block_size(header)
+        yield offset, _inflate(header + fileobj.read(bsize - _HEADER.size))
+        offset += bsize
+
+
+def complete_blocks(data: bytes) -> Iterator[tuple[int, bytes]]:
+    """
+    Yield ``(end_offset, uncompressed_data)`` for each whole BGZF block at
+    the start of ``data``, stopping at the first one it holds only part of.
+    """
+    view, offset = memoryview(data), 0
+    while offset + _HEADER.size <= len(data):
+        bsize = _block_size(data, offset)
+        if offset + bsize > len(data):
+            return
+        yield offset + bsize, _inflate(view[offset:offset + bsize])
+        offset += bsize
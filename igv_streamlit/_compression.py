@@ -0,0 +1,111 @@
+# igv_streamlit/_compression.py
+
+"""
+``Content-Encoding`` for whole-file responses of compressible files.
+
+Plain-text tracks (GFF, BED, VCF, FASTA) and BAI/FAI indexes compress
+several-fold, and igv.js downloads non-indexed annotation files in full.
+When a request without ``Range`` accepts an encoding we have, the file is
+served from a pre-compressed variant in the artifact store.  Variants are
+built once per file identity in the background; until one is ready the
+file is served as-is.  Range requests are always served uncompressed, so
+byte offsets keep their meaning for igv.js.
+
+gzip is always available; ``br`` and ``zstd`` are used when the optional
+``brotli`` / ``zstandard`` packages are installed.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+from typing import Callable
+
+from . import _artifacts
+
+try:
+    import brotli
+except ImportError:                     # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:                     # optional
+    zstandard = None
+
+# Files smaller than this aren't worth a round trip through the cache
+_MIN_SIZE = 1024
+
+# Already-compressed binary formats (BAM, CRAM, BGZF indexes) are skipped
+_COMPRESSIBLE_SUFFIXES = (".bai", ".fai")
+
+
+def _gzip(src: str, dst: str) -> None:
+    with open(src, "rb") as fin, \
+         gzip.GzipFile(dst, "wb", compresslevel=6, mtime=0) as fout:
+        shutil.copyfileobj(fin, fout, 1 << 20)
+
+
+def _brotli(src: str, dst: str) -> None:
+    compressor = brotli.Compressor(quality=5)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while chunk := fin.read(1 << 20):
+            fout.write(compressor.process(chunk))
+        fout.write(compressor.finish())
+
+
+def _zstd(src: str, dst: str) -> None:
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        zstandard.ZstdCompressor(level=10).copy_stream(fin, fout)
+
+
+# Content-coding -> encoder, in order of preference when q-values tie
+ENCODERS: dict[str, Callable[[str, str], None]] = {}
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+ENCODERS["gzip"] = _gzip
+
+
+def is_compressible(path: str, mime_type: str, size: int) -> bool:
+    return size >= _MIN_SIZE and (
+        mime_type.startswith("text/") or path.endswith(_COMPRESSIBLE_SUFFIXES))
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """Pick the best available coding allowed by ``Accept-Encoding``."""
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.strip().split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for coding in ENCODERS:             # preference order breaks ties
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def encoded_variant(path: str, st: os.stat_result, coding: str) -> str | None:
+    """
+    Return the path of the ``coding``-compressed copy of ``path`` if it has
+    been built; otherwise queue the build and return ``None``.
+    """
+    suffix  = f".{coding}"
+    variant = _artifacts.lookup(path, st, suffix)
+    if variant is None:
+        _artifacts.build_in_background(path, suffix, ENCODERS[coding], st)
+    return variant
@@ -0,0 +1,103 @@
+# igv_streamlit/_fasta.py
+
+"""
+FASTA index (``.fai``) discovery and generation.
+
+Without an ``indexURL`` igv.js downloads the whole reference FASTA before it
+can show anything.  :func:`fai_for` returns an index for a local,
+uncompressed FASTA: an up-to-date ``<fasta>.fai`` next to it if there is
+one, otherwise one built by :func:`build_fai` into the artifact store.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+
+from . import _artifacts
+
+# Lines verified per slice of the file; keeps memory bounded on big contigs
+_LINES_PER_WINDOW = 16384
+
+
+def _sequence_length(mm: mmap.mmap, start: int, end: int, name: bytes
+                     ) -> tuple[int, int, int]:
+    """
+    Return ``(length, line_bases, line_width)`` of the sequence in
+    ``mm[start:end]``, checking every line but the last has the same width.
+    """
+    while end > start and mm[end - 1] in b"\r\n":
+        end -= 1
+    if end <= start:
+        return 0, 0, 0
+
+    first_nl = mm.find(b"\n", start, end)
+    if first_nl < 0:                    # a single line
+        eol = 2 if mm[end:end + 1] == b"\r" else 1
+        return end - start, end - start, end - start + eol
+
+    width = first_nl - start + 1
+    eol   = 2 if mm[first_nl - 1] == ord("\r") else 1
+    bases = width - eol
+    length, pos = 0, start
+    while pos < end:
+        chunk = mm[pos:min(pos + width * _LINES_PER_WINDOW, end)]
+        full  = len(chunk) // width
+        ok = (chunk.count(b"\n") == full
+              and chunk[width - 1::width] == b"\n" * full
+              and (eol == 1 or chunk[width - 2::width][:full] == b"\r" * full))
+        if not ok:
+            raise ValueError(
+                f"FASTA sequence {name.decode(errors='replace')!r} has lines "
+                f"of different lengths; it can't be indexed")
+        length += full * bases + (len(chunk) - full * width)
+        pos    += len(chunk)
+    return length, bases, width
+
+
+def build_fai(src: str, dst: str) -> None:
+    """Write a samtools-compatible ``.fai`` for the FASTA ``src`` to ``dst``."""
+    rows = []
+    with open(src, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{src} is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            pos  = 0 if mm[:1] == b">" else mm.find(b"\n>") + 1
+            while pos < size and mm[pos] == ord(">"):
+                header_end = mm.find(b"\n", pos)
+                if header_end < 0:
+                    header_end = size
+                name = (mm[pos + 1:header_end].split() or [b""])[0]
+                next_header = mm.find(b"\n>", header_end)
+                seq_end = size if next_header < 0 else next_header + 1
+                length, bases, width = _sequence_length(
+                    mm, header_end + 1, seq_end, name)
+                rows.append(b"%s\t%d\t%d\t%d\t%d\n"
+                            % (name, length, header_end + 1, bases, width))
+                pos = seq_end
+    if not rows:
+        raise ValueError(f"{src} has no FASTA records")
+    with open(dst, "wb") as out:
+        out.writelines(rows)
+
+
+def fai_for(path: str) -> str:
+    """
+    Return the path of a ``.fai`` index for the local FASTA ``path``.
+
+    Raises ``ValueError`` for compressed FASTA (those need a ``.gzi`` too) or
+    a file that isn't valid, indexable FASTA.
+    """
+    path = os.path.abspath(path)
+    if path.endswith((".gz", ".bgz")):
+        raise ValueError(f"Can't build an index for compressed FASTA {path}")
+
+    st      = os.stat(path)
+    sibling = path + ".fai"
+    try:
+        if os.stat(sibling).st_mtime_ns >= st.st_mtime_ns:
+            return sibling
+    except FileNotFoundError:
+        pass
+    return _artifacts.get_or_build(path, ".fai", build_fai, st)
@@ -0,0 +1,272 @@
+# igv_streamlit/_pin.py
+
+"""
+Pinning of remote tracks for offline use.
+
+:func:`pin` downloads what igv.js reads of remote tracks to show a list of
+loci: each track's index, whole, the header of its data file, and the byte
+ranges the index gives for every locus (widened by its own width on each
+side, so nearby pans and zooms stay offline too).  Everything is fetched
+through the caching proxy, several ranges at once, and pinned in its disk
+cache, where pinned blocks are never evicted and don't count toward
+``proxy_cache_size``.  An app serving the same tracks through the proxy
+(``proxy_remote=True``, lists of mirror URLs, or ``ftp://``) with the same
+``cache_dir`` then shows those loci with no network at all.
+
+BAM (BAI or CSI), CRAM (CRAI), tabix-indexed bgzipped feature files and FASTA
+references (``.fai``) can be pinned.  Loci are ``chrom:start-end`` or a
+whole ``chrom``; gene names need igv.js's search and can't be.
+
+Also run from the command line as ``igv-streamlit pin``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from . import _proxy, index as _index
+from . import server as _srv
+
+# Bytes of a data file read at first when looking for the end of its header
+_HEADER_GUESS = 0x10000
+
+
+class _File(NamedTuple):
+    urls:  tuple[str, ...]              # the file's mirrors
+    kind:  str                          # "bam", "cram", "tabix" or "fasta"
+    index: tuple[str, ...]
+
+
+def _urls(value) -> tuple[str, ...]:
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value or ())
+
+
+def _file_of(track: dict) -> _File:
+    """
+    The remote data file of a track or reference config, and its index:
+    the ``indexURL``, or the one igv.js guesses, which the app proxies too.
+    """
+    urls = _urls(track.get("fastaURL") or track.get("url"))
+    if not urls:
+        raise ValueError("no remote url")
+    kind = _proxy.index_kind(track)
+    if kind is None:
+        if "fastaURL" in track:
+            raise ValueError("can't pin bgzipped FASTA")
+        fmt = str(track.get("format", "")).lower()
+        raise ValueError(f"can't pin {fmt or os.path.basename(urlsplit(urls[0]).path)}: "
+                         f"only BAM, CRAM, FASTA and tabix-indexed files")
+    index = _urls(track.get("indexURL")) or _proxy.guessed_index(urls, kind)
+    return _File(urls, kind, index)
+
+
+def _parse_locus(locus: str) -> tuple[str, int, int]:
+    """``chrom:start-end`` (1-based, inclusive) as ``(chrom, beg, end)``, 0-based."""
+    name, sep, span = locus.strip().rpartition(":")
+    if not sep or not span.replace(",", "").replace("-", "").isdigit():
+        return locus.strip(), 0, 1 << 31
+    start, _, end = span.replace(",", "").partition("-")
+    return name, int(start) - 1, int(end or start)
+
+
+def _widen(beg: int, end: int) -> tuple[int, int]:
+    width = end - beg
+    return max(0, beg - width), end + width
+
+
+def _header(urls: tuple[str, ...], parse) -> tuple[list[str], int]:
+    """Read the start of a file until ``parse`` finds its header in it."""
+    n = _HEADER_GUESS
+    while True:
+        data  = _proxy.read(urls, 0, n)
+        found = parse(data)
+        if found is not None:
+            return found
+        if len(data) < n:
+            raise ValueError(f"{urls[0]}: header cut short")
+        n *= 4
+
+
+def _plan(file: _File, loci: list[tuple[str, int, int]]
+          ) -> tuple[int, list[tuple[int, int]], list[str]]:
+    """
+    Read ``file``'s index and header; return the index's size, the
+    ``(offset, length)`` spans of the data file igv.js reads for ``loci``,
+    and the loci on references the file doesn't have.
+    """
+    data = _proxy.read(file.index, 0, sys.maxsize)
+    names, header_end = None, 0
+    if file.kind == "bam":
+        names, header_end = _header(file.urls, _index.bam_references)
+    elif file.kind == "cram":
+        names, header_end = _header(file.urls, _index.cram_references)
+    index = _index.read_index(data, names)
+    if file.kind == "tabix":
+        header_end = index.header_end()
+
+    names   = set(index.names)
+    known   = [locus for locus in loci if locus[0] in names]
+    missing = [locus[0] for locus in loci if locus[0] not in names]
+    widened = [_widen(beg, end) for _, beg, end in known]
+    ranges  = _index.byte_ranges(index, [name for name, _, _ in known],
+                                 [beg for beg, _ in widened],
+                                 [end for _, end in widened], union=True)
+    if header_end:
+        ranges = _index.merge_ranges([(0, header_end), *ranges.tolist()])
+    return (len(data), [(start, end - start) for start, end in ranges.tolist()],
+            missing)
+
+
+def pin(tracks, loci, *, reference: dict | None = None,
+        workers: int = 8) -> dict[str, dict]:
+    """See :func:`igv_streamlit.pin`."""
+    if isinstance(tracks, dict):
+        tracks = [{"name": name, **track} for name, track in tracks.items()]
+    if isinstance(loci, dict):
+        loci = list(loci.values())
+    loci = [_parse_locus(locus) for locus in loci]
+
+    labelled = [("reference", reference)] if reference else []
+    labelled += [(track.get("name") or next(iter(_urls(track.get("url"))),
+                                            f"track {i + 1}"), track)
+                 for i, track in enumerate(tracks)]
+    report: dict[str, dict] = {}
+    files:  dict[str, _File] = {}
+    for label, track in labelled:
+        report[label] = {"bytes": 0, "blocks": 0, "pinned_blocks": 0,
+                         "complete": 0.0, "errors": []}
+        try:
+            files[label] = _file_of(track)
+        except ValueError as e:
+            report[label]["errors"].append(str(e))
+    unique = list(dict.fromkeys(files.values()))
+
+    def plan(file: _File):
+        try:
+            return _plan(file, loci)
+        except (_proxy.UpstreamError, ValueError, struct.error) as e:
+            return e
+
+    def fetch(job: tuple[tuple[str, ...], tuple[int, int]]):
+        try:
+            _proxy.pin(job[0], [job[1]])
+        except _proxy.UpstreamError:
+            pass                        # shows as incomplete below
+
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        plans = dict(zip(unique, pool.map(plan, unique)))
+        jobs  = [(file.index, (0, result[0])) for file, result in plans.items()
+                 if not isinstance(result, Exception)]
+        jobs += [(file.urls, span) for file, result in plans.items()
+                 if not isinstance(result, Exception) for span in result[1]]
+        # Big spans first, so no straggler starts last
+        jobs.sort(key=lambda job: -job[1][1])
+        list(pool.map(fetch, jobs))
+
+    for label, file in files.items():
+        entry, result = report[label], plans[file]
+        if isinstance(result, Exception):
+            entry["errors"].append(str(result))
+            continue
+        size, spans, missing = result
+        entry["errors"] += [f"{file.urls[0]} has no {name}" for name in missing]
+        for urls, parts in ((file.index, [(0, size)]), (file.urls, spans)):
+            try:
+                blocks, pinned, nbytes = _proxy.pin(urls, parts, fetch=False)
+            except _proxy.UpstreamError as e:
+                entry["errors"].append(str(e))
+                continue
+            entry["blocks"]        += blocks
+            entry["pinned_blocks"] += pinned
+            entry["bytes"]         += nbytes
+        if entry["blocks"]:
+            entry["complete"] = entry["pinned_blocks"] / entry["blocks"]
+    return report
+
+
+def unpin(tracks, *, reference: dict | None = None) -> int:
+    """See :func:`igv_streamlit.unpin`."""
+    if isinstance(tracks, dict):
+        tracks = list(tracks.values())
+    freed = 0
+    for track in [reference] * bool(reference) + list(tracks):
+        try:
+            file = _file_of(track)
+        except ValueError:
+            continue
+        freed += _proxy.unpin(file.index) + _proxy.unpin(file.urls)
+    return freed
+
+
+# ── command line ─────────────────────────────────────────────────────────────
+
+def _load_tracks(items: list[str]) -> list[dict]:
+    tracks: list[dict] = []
+    for item in items:
+        if urlsplit(item).scheme in _proxy.SCHEMES:
+            tracks.append({"name": os.path.basename(urlsplit(item).path), "url": item})
+            continue
+        with open(item) as f:
+            found = json.load(f)
+        if isinstance(found, dict):
+            found = [{"name": name, **track} for name, track in found.items()]
+        tracks += found
+    return tracks
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="igv-streamlit pin",
+        description="Download and pin what igv.js reads of remote tracks to "
+                    "show a list of loci, for browsing them offline.")
+    parser.add_argument("tracks", nargs="+",
+                        help="URLs of BAM/CRAM/tabix files (index next to them), "
+                             "or JSON files of igv.js track configs")
+    parser.add_argument("--locus", action="append", default=[],
+                        help="Locus to pin, e.g. chr1:1,000-2,000 (repeatable)")
+    parser.add_argument("--loci", help="File of loci to pin, one per line")
+    parser.add_argument("--reference", help="URL of the reference FASTA "
+                                            "(its .fai next to it)")
+    parser.add_argument("--cache-dir", help="Cache directory the app uses")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Ranges fetched at once (default: 8)")
+    parser.add_argument("--unpin", action="store_true",
+                        help="Unpin the tracks instead")
+    args = parser.parse_args(argv)
+
+    if args.cache_dir:
+        _srv.configure_server(cache_dir=args.cache_dir)
+    tracks    = _load_tracks(args.tracks)
+    reference = {"fastaURL": args.reference} if args.reference else None
+    if args.unpin:
+        freed = unpin(tracks, reference=reference)
+        print(f"unpinned {freed / 1e6:.1f} MB")
+        return 0
+
+    loci = list(args.locus)
+    if args.loci:
+        with open(args.loci) as f:
+            loci += [line.strip() for line in f if line.strip()]
+    if not loci:
+        parser.error("no loci: give --locus or --loci")
+
+    report = pin(tracks, loci, reference=reference, workers=args.workers)
+    width  = max(len(label) for label in report)
+    print(f"{'':<{width}} {'pinned MB':>10} {'blocks':>13} {'complete':>9}")
+    for label, entry in report.items():
+        blocks = f"{entry['pinned_blocks']}/{entry['blocks']}"
+        print(f"{label:<{width}} {entry['bytes'] / 1e6:>10.1f} {blocks:>13} "
+              f"{entry['complete']:>9.0%}")
+        for error in entry["errors"]:
+            print(f"  {error}", file=sys.stderr)
+    return 0 if all(entry["complete"] == 1 and not entry["errors"]
+                    for entry in report.values()) else 1
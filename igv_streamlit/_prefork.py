@@ -0,0 +1,345 @@
+# igv_streamlit/_prefork.py
+
+"""
+Pre-forked, multi-process file server.
+
+One process serving every byte range is bound by the GIL.  With
+``configure_server(workers=N)`` the app instead starts a master process
+that forks ``N`` workers, each running the usual engine on its own
+listening socket bound to the same port with ``SO_REUSEPORT``, so the
+kernel spreads connections across them.  The same master can be run by
+hand with ``igv-streamlit serve --workers 8 --port 8765 --registry reg.jsonl``.
+
+The token registry is replicated through an append-only registry file.
+The registering process appends one JSON line per new token,
+``[token, stable, size, mtime_ns, path]`` (``[token, urls]`` for remote
+files behind the caching proxy), and a worker asked for a token it doesn't
+know reads whatever was appended since it last looked before answering
+``404``.
+
+Each worker has its own block cache, descriptor pool and read-ahead state.
+Every ``_POLL_INTERVAL`` it writes its ``server_stats()`` next to the
+registry file, and :meth:`WorkerPool.worker_stats` reads them back for the
+app's ``server_stats()`` to add up.
+
+Needs ``SO_REUSEPORT`` and ``fork`` (Linux, the BSDs, macOS).
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from . import server as _srv
+
+_POLL_INTERVAL = 0.5       # seconds between the master's child/parent checks
+_STARTUP_TIMEOUT = 60      # seconds to wait for a new pool to report its port
+
+
+def supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT") and hasattr(os, "fork")
+
+
+# ── registry file ────────────────────────────────────────────────────────────
+
+def _stats_path(registry: str, pid: int) -> str:
+    return f"{registry}.{pid}.stats"
+
+
+def _publish_stats(registry: str, server) -> None:
+    """Write this worker's ``server_stats()`` for the app to read."""
+    path = _stats_path(registry, os.getpid())
+    with open(path + ".tmp", "w") as f:
+        json.dump(_srv._process_stats(server), f)
+    os.replace(path + ".tmp", path)
+
+
+def _drop_stats(registry: str, pid: int) -> None:
+    try:
+        os.unlink(_stats_path(registry, pid))
+    except FileNotFoundError:
+        pass
+
+
+class RegistryLog:
+    """Writer side of the registry file; lines are appended with one write."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Tokens are the only thing standing between a client and a file
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def append(self, token: str, record: _srv._FileRecord) -> None:
+        line = json.dumps([token, record.version is not None, record.size,
+                           record.mtime_ns, record.path]) + "\n"
+        os.write(self._fd, line.encode("utf-8", "surrogatepass"))
+
+    def append_remote(self, token: str, urls: tuple[str, ...]) -> None:
+        os.write(self._fd, (json.dumps([token, list(urls)]) + "\n").encode())
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class RegistryReader:
+    """
+    Worker side of the registry file: adopts tokens appended since the last
+    read into the worker's own registry.
+    """
+
+    def __init__(self, path: str):
+        self.path    = path
+        self._offset = 0
+        self._lock   = threading.Lock()
+
+    def lookup(self, token: str) -> _srv._FileRecord | None:
+        """Catch up with the file, then look ``token`` up again."""
+        with self._lock:
+            self._catch_up()
+        with _srv._registry_lock:
+            return _srv._file_registry.get(token)
+
+    def _catch_up(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Only whole lines; a line being appended is picked up next time
+        data = data[:data.rfind(b"\n") + 1]
+        self._offset += len(data)
+        for line in data.splitlines():
+            entry = json.loads(line.decode("utf-8", "surrogatepass"))
+            if len(entry) == 2:
+                token, urls = entry[0], tuple(entry[1])
+                with _srv._registry_lock:
+                    _srv._remote_registry[token] = urls
+                    _srv._url_tokens[urls]       = token
+                continue
+            token, stable, size, mtime_ns, path = entry
+            try:
+                st = _srv._stat_regular(path)
+            except FileNotFoundError:
+                continue
+            if stable and (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                continue                # that version is gone
+            with _srv._registry_lock:
+                _srv._file_registry[token] = _srv._FileRecord(path, st, stable)
+                _srv._path_tokens[path]    = token
+
+
+# ── controller, in the app's process ─────────────────────────────────────────
+
+class WorkerPool:
+    """
+    Runs a master process and its workers in the background.
+
+    Mirrors the parts of the engine servers that ``server._start_server``
+    uses.  The constructor returns once every worker is listening, and
+    raises ``OSError`` if the pool can't be started on ``port``.
+    :meth:`serve_forever` waits for the master to exit, and
+    :meth:`shutdown` stops it.
+    """
+
+    def __init__(self, port: int, workers: int, registry: str, config: dict):
+        if not supported():
+            raise RuntimeError(
+                "configure_server(workers=...) needs SO_REUSEPORT and fork")
+        self.workers  = workers
+        self.registry = RegistryLog(registry)
+        self._proc = subprocess.Popen(
+            [sys.executable, "-c",
+             "from igv_streamlit._prefork import main; main()",
+             "--port", str(port), "--workers", str(workers),
+             "--registry", registry, "--config", json.dumps(config),
+             "--parent-pid", str(os.getpid())],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        # The master prints its port once every worker is listening
+        timer = threading.Timer(_STARTUP_TIMEOUT, self._proc.kill)
+        timer.start()
+        try:
+            line = self._proc.stdout.readline()
+        finally:
+            timer.cancel()
+        if not line.strip().isdigit():
+            self._proc.kill()
+            self.shutdown()
+            error = self._proc.stderr.read().strip().splitlines()
+            raise OSError(f"file server workers failed to start: "
+                          f"{error[-1] if error else 'no output'}")
+        atexit.register(self.shutdown)
+        self.server_address = ("127.0.0.1", int(line))
+        # Nothing else is read from these; don't let a full pipe block
+        self._proc.stdout.close()
+        threading.Thread(target=self._proc.stderr.read, daemon=True).start()
+
+    def serve_forever(self) -> None:
+        self._proc.wait()
+
+    def shutdown(self) -> None:
+        if self._proc.poll() is None:
+            self._proc.terminate()
+        for path in [self.registry.path, *glob.glob(self.registry.path + ".*.stats")]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict[str, int]:
+        return {"workers": self.workers, "master_pid": self._proc.pid,
+                "running": int(self._proc.poll() is None)}
+
+    def worker_stats(self) -> list[dict]:
+        """The ``server_stats()`` each live worker last wrote."""
+        found = []
+        for path in glob.glob(self.registry.path + ".*.stats"):
+            try:
+                with open(path) as f:
+                    found.append(json.load(f))
+            except FileNotFoundError:
+                pass                    # its worker just died
+        return found
+
+
+# ── master and workers ───────────────────────────────────────────────────────
+
+def _reserve_port(port: int) -> socket.socket:
+    """
+    Bind (but don't listen on) ``port`` with ``SO_REUSEPORT`` to pick and
+    hold the port while the workers bind to it too.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.bind(("127.0.0.1", port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _fork_worker(port: int, registry: str, ready: int) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT,  signal.SIG_DFL)
+        _srv._registry_file = RegistryReader(registry)
+        try:
+            server = _srv._bind(port, reuse_port=True)
+        except BaseException:
+            os.write(ready, b"0")
+            raise
+        os.write(ready, b"1")
+        master = os.getppid()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # Don't outlive the master, however it ended
+        while os.getppid() == master:
+            _publish_stats(registry, server)
+            time.sleep(_POLL_INTERVAL)
+        status = 0
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        os._exit(status)
+
+
+def serve(port: int, workers: int, registry: str,
+          parent_pid: int | None = None) -> None:
+    """
+    Run a master process serving the tokens in ``registry`` on ``port`` with
+    ``workers`` processes, until it is sent ``SIGTERM``/``SIGINT`` or
+    ``parent_pid`` exits.  Prints the port once every worker is listening.
+    """
+    if not supported():
+        raise RuntimeError("the pre-forked server needs SO_REUSEPORT and fork")
+    reserved = _reserve_port(port)
+    port = reserved.getsockname()[1]
+
+    read_fd, ready = os.pipe()
+    children = {_fork_worker(port, registry, ready) for _ in range(workers)}
+    started = b"".join(os.read(read_fd, 1) for _ in range(workers))
+    reserved.close()
+    if started != b"1" * workers:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        raise OSError(f"a worker couldn't listen on port {port}")
+    print(port, flush=True)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT,  stop)
+    try:
+        while not stopping:
+            if parent_pid is not None and os.getppid() != parent_pid:
+                break
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid in children:
+                # Replace a worker that died; it would otherwise take its
+                # share of new connections with it
+                children.discard(pid)
+                _drop_stats(registry, pid)
+                children.add(_fork_worker(port, registry, ready))
+                continue
+            time.sleep(_POLL_INTERVAL)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            _drop_stats(registry, pid)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="igv-streamlit serve",
+        description="Serve registered files from several worker processes "
+                    "sharing one port.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument("--port", type=int, default=0,
+                        help="Port to listen on (default: any free port)")
+    parser.add_argument("--registry", required=True,
+                        help="Registry file that tokens are appended to")
+    parser.add_argument("--engine", choices=_srv._ENGINES,
+                        help="Engine each worker runs (default: threading)")
+    parser.add_argument("--cache-dir", help="Directory for derived files")
+    parser.add_argument("--config", default="{}",
+                        help="Further configure_server() arguments, as JSON")
+    parser.add_argument("--parent-pid", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    config = json.loads(args.config)
+    if args.engine:
+        config["engine"] = args.engine
+    if args.cache_dir:
+        config["cache_dir"] = args.cache_dir
+    _srv.configure_server(**config)
+    serve(args.port, args.workers, os.path.abspath(args.registry),
+          parent_pid=args.parent_pid)
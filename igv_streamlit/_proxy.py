@@ -0,0 +1,1847 @@
+# igv_streamlit/_proxy.py
+
+"""
+Caching proxy for remote tracks.
+
+With ``configure_server(proxy_remote=True)`` a track's remote ``url`` /
+``indexURL`` / ``fastaURL`` is rewritten to a ``/file/<token>/<name>`` URL
+on the local server.  Range requests for it are answered from a sparse,
+block-indexed copy of the remote file on disk, and only blocks not yet
+cached are fetched upstream, over keep-alive connections pooled per host.
+Repeat views of the same loci, in this session or after a restart, never
+leave the machine.
+
+Each remote file has a directory under ``<cache_dir>/proxy/``, with a
+``meta.json`` naming the URL, the size, ``ETag`` and ``Last-Modified`` the
+blocks were fetched under, and the generation directory holding them:
+
+* ``data``   -- a sparse file the size of the remote one; cached blocks are
+  written at their own offsets, so replies are ``sendfile``'d from it like
+  any registered file.
+* ``blocks`` -- one byte per ``BLOCK_SIZE`` block, non-zero once the block
+  is on disk.
+* ``pinned`` -- one byte per block, non-zero if :func:`pin` pinned it for
+  offline use.  Pinned blocks are never evicted and don't count toward
+  ``proxy_cache_size``.
+* ``atime``  -- when each block was last used.
+
+A remote file that changes is cached afresh in a new generation, and
+``meta.json`` is atomically replaced to name it.
+
+Blocks of every remote file share one LRU capped at ``proxy_cache_size``;
+evicted blocks are punched out of ``data`` (Linux ``fallocate``), or the
+whole file is dropped where that isn't supported.  Blocks that a request
+is reading are never evicted under it.
+
+Any number of processes on a host (Streamlit apps behind a load balancer,
+``workers=N``, ``igv-streamlit pin``) can share one ``cache_dir``: the
+block maps are mapped shared, so a block one process fetched is served
+from disk by all of them, and the LRU's totals are kept in a shared
+``usage`` file.  Locks on small files in each generation keep processes
+from fetching the same blocks twice, and from evicting blocks another is
+serving.  Without ``fcntl`` (Windows) only one process may use a cache.
+
+Upstreams must answer ``Range`` requests with ``206`` and a known size;
+requests for any other are redirected to the remote URL (``307``).
+
+``ftp://`` URLs, which browsers can't fetch at all, are always proxied
+unless a track says otherwise.  Ranges are read with ``REST`` + ``RETR``
+over logged-in control connections pooled per host and login, and the
+file's ``SIZE`` and ``MDTM`` stand in for ``Content-Length`` and
+``Last-Modified``.  An FTP server refusing ``REST`` is answered ``502``,
+there being nothing a browser could be redirected to.
+
+A track may give a list of equivalent mirror URLs of a file instead of
+one.  They share one cache entry, and each range is asked of the mirror
+with the best recent record first: healthy before failing, then fastest
+median response time.  If it hasn't answered within ``hedge_percentile``
+of its recent response times the next mirror is asked as well, and
+straight away if it fails; the first answer wins.  Response times and
+errors are kept per upstream server.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ftplib
+import hashlib
+import http.client
+import json
+import logging
+import math
+import os
+import mmap
+import re
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import unquote, urljoin, urlsplit
+
+from . import _artifacts
+from . import server as _srv
+from ._artifacts import lock_fd, lock_range, unlock_fd, unlock_range
+
+logger = logging.getLogger(__name__)
+
+SCHEMES = ("http", "https", "ftp")
+
+BLOCK_SIZE = 256 * 1024
+# Longest upstream request; longer runs of missing blocks are split so
+# waiting requests are answered as their part arrives
+_MAX_RUN = 64
+
+_UPSTREAM_TIMEOUT = 30.0
+# Seconds a remote file's size and validators are trusted before the next
+# request checks them again
+_REVALIDATE_INTERVAL = 300.0
+_MAX_IDLE_PER_HOST = 8
+_MAX_REDIRECTS = 5
+_USER_AGENT = "igv-streamlit"
+
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Threads the asyncio engine and the Streamlit mount build proxied replies
+# on, apart from the event loop's default executor that local files use
+_EXECUTOR_WORKERS = 16
+
+
+class UpstreamError(Exception):
+    """The remote file can't be served; ``status`` is what the client gets."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _Changed(Exception):
+    """The remote file changed while a request was being served."""
+
+
+class _NoRanges(Exception):
+    """The upstream doesn't answer range requests with a known size."""
+
+
+# Failures talking to an upstream, as opposed to answers from it
+_TRANSIENT = (OSError, EOFError, http.client.HTTPException, ftplib.Error)
+
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _counts_lock:
+        _counts[name] += n
+
+
+# ── upstream connections ─────────────────────────────────────────────────────
+
+class _Abort:
+    """
+    Lets another thread abort an upstream request in flight, by shutting
+    down its connection's socket, which wakes a read blocked on it.
+    """
+
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._sock: socket.socket | None = None
+        self.aborted = False
+
+    def watch(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._sock = sock
+            if not self.aborted:
+                return
+        self._shutdown(sock)
+
+    def abort(self) -> None:
+        with self._lock:
+            self.aborted = True
+            sock = self._sock
+        if sock is not None:
+            self._shutdown(sock)
+
+    @staticmethod
+    def _shutdown(sock: socket.socket) -> None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _Upstreams:
+    """Idle keep-alive connections to upstream servers, by scheme/host/port."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle: dict[tuple[str, str, int | None], list[http.client.HTTPConnection]] = {}
+
+    @contextmanager
+    def get(self, url: str, headers: dict[str, str], abort: _Abort | None = None):
+        """
+        ``GET url`` on a pooled connection and yield the response.  The
+        connection goes back to the pool if the body was read to the end,
+        and ``abort`` wasn't used on it.
+        """
+        parts  = urlsplit(url)
+        key    = (parts.scheme, parts.hostname or "", parts.port)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        headers = {"User-Agent": _USER_AGENT, **headers}
+
+        for attempt in range(2):
+            conn, reused = self._checkout(key, fresh=attempt > 0)
+            try:
+                if abort is not None:
+                    if conn.sock is None:
+                        conn.connect()
+                    abort.watch(conn.sock)
+                conn.request("GET", target, headers=headers)
+                response = conn.getresponse()
+            except (ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if reused and attempt == 0 and not (abort and abort.aborted):
+                    continue                # the server closed an idle one
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+        _count("upstream_requests")
+        _count("reused_connections", reused)
+
+        try:
+            yield response
+        except BaseException:
+            conn.close()
+            raise
+        if response.isclosed() and not response.will_close and \
+                not (abort and abort.aborted):
+            self._checkin(key, conn)
+        else:
+            conn.close()
+
+    def _checkout(self, key, fresh: bool = False
+                  ) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle and not fresh:
+                return idle.pop(), True
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" \
+              else http.client.HTTPConnection
+        return cls(host, port, timeout=_UPSTREAM_TIMEOUT), False
+
+    def _checkin(self, key, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < _MAX_IDLE_PER_HOST:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self) -> None:
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+_upstreams = _Upstreams()
+
+
+def _read_exact(response: http.client.HTTPResponse, n: int) -> bytes:
+    chunks, got = [], 0
+    while got < n:
+        chunk = response.read(n - got)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        got += len(chunk)
+    return b"".join(chunks)
+
+
+def _content_range(response: http.client.HTTPResponse) -> tuple[int | None, int]:
+    """``(first byte, total size)`` from a 206/416 ``Content-Range``."""
+    value = response.getheader("Content-Range", "")
+    unit, _, rest = value.partition(" ")
+    span, _, total = rest.partition("/")
+    if unit.lower() != "bytes" or not total.strip().isdigit():
+        raise _NoRanges(f"Content-Range {value!r}")
+    first = span.partition("-")[0].strip()
+    return (int(first) if first.isdigit() else None), int(total)
+
+
+class _Body:
+    """
+    Part of a remote file being received: bytes from the requested start
+    on, through :meth:`read`, and what the upstream said about the file.
+    ``url`` is where it was found, after redirects.
+    """
+
+    __slots__ = ("url", "mirror", "size", "etag", "last_modified", "_read")
+
+    def __init__(self, url: str, size: int, etag: str | None,
+                 last_modified: str | None, read=None):
+        self.url           = url
+        self.mirror        = url
+        self.size          = size
+        self.etag          = etag
+        self.last_modified = last_modified
+        self._read         = read
+
+    def read(self, n: int) -> bytes:
+        return self._read(n) if self._read is not None else b""
+
+
+@contextmanager
+def _open_range(url: str, start: int, end: int, known: tuple | None = None,
+                abort: _Abort | None = None):
+    """
+    Ask for bytes ``start``-``end`` of the remote file at ``url`` and yield
+    a :class:`_Body` (with nothing to read if ``start`` is past its end).
+    Where finding out the size and validators takes extra round trips
+    (FTP), the ``(size, etag, last_modified)`` the caller already ``known``
+    is taken as still true.  HTTP requests can be cut short with ``abort``;
+    FTP ones run to their answer.
+
+    Raises ``_NoRanges`` if the upstream can't serve the range, and
+    ``UpstreamError`` if it has no such file.
+    """
+    if urlsplit(url).scheme == "ftp":
+        with _ftp.retrieve(url, start, known) as body:
+            yield body
+        return
+
+    for _ in range(_MAX_REDIRECTS + 1):
+        with _upstreams.get(url, {"Range": f"bytes={start}-{end}"}, abort) as r:
+            if r.status in _REDIRECT_STATUSES and r.getheader("Location"):
+                r.read()
+                url = urljoin(url, r.getheader("Location"))
+                continue
+            if r.status in (404, 410):
+                r.read()
+                raise UpstreamError(404, f"{url}: {r.status}")
+            if r.status == 416:
+                r.read()
+                size, read = _content_range(r)[1], None
+            elif r.status == 206:
+                first, size = _content_range(r)
+                if first != start:
+                    raise _NoRanges(f"{url}: Content-Range starts at {first}")
+                read = lambda n: _read_exact(r, n)      # noqa: E731
+            elif r.status == 200:
+                raise _NoRanges(url)
+            else:
+                r.read()
+                raise UpstreamError(502, f"{url}: {r.status}")
+            yield _Body(url, size, r.getheader("ETag"),
+                        r.getheader("Last-Modified"), read)
+            return
+    raise UpstreamError(502, f"{url}: too many redirects")
+
+
+# ── FTP ──────────────────────────────────────────────────────────────────────
+
+class _FtpSessions:
+    """
+    Idle, logged-in FTP control connections, by host, port and user.
+
+    A range is read with ``REST <start>`` + ``RETR`` on a new passive data
+    connection, which is closed once the range is in.  The server's answer
+    to the cut-short transfer is then drained behind a ``NOOP``, so the
+    control connection can be reused.  FTP has no validators but the size
+    and ``MDTM`` modification time, which stands in for ``Last-Modified``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle: dict[tuple, list[ftplib.FTP]] = {}
+
+    @contextmanager
+    def retrieve(self, url: str, start: int, known: tuple | None = None):
+        parts = urlsplit(url)
+        key   = (parts.hostname or "", parts.port or ftplib.FTP_PORT,
+                 unquote(parts.username or "anonymous"),
+                 unquote(parts.password or "anonymous@"))
+        path  = unquote(parts.path)
+
+        for attempt in range(2):
+            ftp, reused = self._checkout(key, fresh=attempt > 0)
+            try:
+                if known is not None:
+                    size, _, modified = known
+                else:
+                    size     = ftp.size(path)
+                    modified = _mdtm(ftp, path) if size is not None else None
+                data = None if start >= (size or 0) else \
+                    ftp.transfercmd(f"RETR {path}", rest=start)
+            except ftplib.error_perm as e:
+                # 550: no such file.  Anything else permanent: no SIZE or REST
+                self._checkin(key, ftp)
+                if str(e).startswith("550"):
+                    raise UpstreamError(404, f"{url}: {e}") from e
+                raise _NoRanges(f"{url}: {e}") from e
+            except _TRANSIENT:
+                ftp.close()
+                if reused and attempt == 0:
+                    continue                # the server closed an idle one
+                raise
+            except BaseException:
+                ftp.close()
+                raise
+            break
+        _count("upstream_requests")
+        _count("reused_connections", reused)
+        if size is None:
+            self._checkin(key, ftp)
+            raise _NoRanges(f"{url}: no SIZE")
+
+        try:
+            stream = data.makefile("rb") if data is not None else None
+            try:
+                yield _Body(url, size, None, modified,
+                            stream.read if stream is not None else None)
+            finally:
+                if data is not None:
+                    stream.close()
+                    data.close()
+            if data is not None:
+                _drain(ftp)
+        except BaseException:
+            ftp.close()
+            raise
+        self._checkin(key, ftp)
+
+    def _checkout(self, key, fresh: bool = False) -> tuple[ftplib.FTP, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle and not fresh:
+                return idle.pop(), True
+        host, port, user, password = key
+        ftp = ftplib.FTP(timeout=_UPSTREAM_TIMEOUT)
+        try:
+            ftp.connect(host, port)
+            ftp.login(user, password)
+            ftp.voidcmd("TYPE I")           # SIZE and REST count bytes
+        except BaseException:
+            ftp.close()
+            raise
+        return ftp, False
+
+    def _checkin(self, key, ftp: ftplib.FTP) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < _MAX_IDLE_PER_HOST:
+                idle.append(ftp)
+                return
+        ftp.close()
+
+    def close_all(self) -> None:
+        with self._lock:
+            for idle in self._idle.values():
+                for ftp in idle:
+                    ftp.close()
+            self._idle.clear()
+
+
+_ftp = _FtpSessions()
+
+
+def _drain(ftp: ftplib.FTP) -> None:
+    """
+    Read the reply to a transfer whose data connection was closed, which is
+    ``226`` or ``426`` (or both) depending on the server and on how much of
+    the file was left, up to the answer to a ``NOOP`` sent after it.
+    """
+    ftp.putcmd("NOOP")
+    for _ in range(4):
+        if ftp.getmultiline().startswith("200"):
+            return
+    raise ftplib.error_proto("no reply to NOOP")
+
+
+def _mdtm(ftp: ftplib.FTP, path: str) -> str | None:
+    """``path``'s modification time as an HTTP date, if the server says."""
+    try:
+        reply = ftp.sendcmd(f"MDTM {path}")
+    except ftplib.error_perm:
+        return None
+    stamp = reply[4:].strip()[:14]
+    try:
+        when = datetime.strptime(stamp, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return formatdate(when.timestamp(), usegmt=True)
+
+
+# ── mirrors ──────────────────────────────────────────────────────────────────
+
+# Response times kept per upstream server, and how many there must be before
+# their percentile is trusted over _HEDGE_DELAY
+_LATENCY_WINDOW = 64
+_MIN_SAMPLES    = 8
+_HEDGE_DELAY    = 1.0
+# Seconds a failing server is passed over, doubling with each failure in a row
+_BACKOFF     = 1.0
+_MAX_BACKOFF = 60.0
+# Threads asking mirrors at once, across every hedged request
+_HEDGE_WORKERS = 32
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    port  = f":{parts.port}" if parts.port else ""
+    return f"{parts.scheme}://{parts.hostname or ''}{port}"
+
+
+def _percentile(samples, percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+
+class _Health:
+    __slots__ = ("latencies", "requests", "errors", "outpaced", "failures",
+                 "down_until")
+
+    def __init__(self):
+        self.latencies: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self.requests = self.errors = self.outpaced = self.failures = 0
+        self.down_until = 0.0
+
+
+class _Mirrors:
+    """
+    Response times and failures of upstream servers, by origin.  They decide
+    the order a file's mirrors are asked in, and how long one is waited on
+    before the next is asked too.
+    """
+
+    def __init__(self):
+        self._lock   = threading.Lock()
+        self._health: dict[str, _Health] = {}
+
+    def _get(self, url: str) -> _Health:
+        # Caller holds self._lock
+        origin = _origin(url)
+        health = self._health.get(origin)
+        if health is None:
+            health = self._health[origin] = _Health()
+        return health
+
+    def order(self, urls) -> list[str]:
+        """
+        ``urls`` healthy first, then fastest first by median response time.
+        Servers whose last request failed come last, those still backing off
+        after it behind the rest.  Servers not heard from yet count as
+        fastest, so they get measured; ties keep the listed order.
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = {url: self._get(url) for url in urls}
+            rank   = {url: (h.down_until > now, h.failures > 0,
+                            statistics.median(h.latencies) if h.latencies else 0.0)
+                      for url, h in health.items()}
+        return sorted(urls, key=rank.__getitem__)
+
+    def hedge_delay(self, url: str) -> float:
+        """Seconds to wait for ``url`` before asking the next mirror too."""
+        percent = _srv._hedge_percentile
+        if percent <= 0:
+            return 0.0
+        with self._lock:
+            samples = list(self._get(url).latencies)
+        if len(samples) < _MIN_SAMPLES:
+            return _HEDGE_DELAY
+        return _percentile(samples, percent)
+
+    def answered(self, url: str, seconds: float) -> None:
+        with self._lock:
+            health = self._get(url)
+            health.requests  += 1
+            health.failures   = 0
+            health.down_until = 0.0
+            health.latencies.append(seconds)
+
+    def outpaced(self, url: str, seconds: float) -> None:
+        """``url`` hadn't answered after ``seconds``, when another mirror had."""
+        with self._lock:
+            health = self._get(url)
+            health.requests += 1
+            health.outpaced += 1
+            health.latencies.append(seconds)
+
+    def failed(self, url: str) -> None:
+        with self._lock:
+            health = self._get(url)
+            health.requests += 1
+            health.errors   += 1
+            health.failures += 1
+            # capped before exponentiating: a mirror down for long enough
+            # fails more than 1024 times, and 2.0 ** 1024 overflows
+            health.down_until = time.monotonic() + min(
+                _BACKOFF * 2.0 ** min(health.failures - 1, 32), _MAX_BACKOFF)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        now = time.monotonic()
+        with self._lock:
+            return {origin: {
+                        "requests": health.requests,
+                        "errors":   health.errors,
+                        "outpaced": health.outpaced,
+                        "p50_ms":   round(_percentile(health.latencies, 50) * 1000)
+                                    if health.latencies else 0,
+                        "p95_ms":   round(_percentile(health.latencies, 95) * 1000)
+                                    if health.latencies else 0,
+                        "down":     int(health.down_until > now)}
+                    for origin, health in self._health.items()}
+
+
+_mirrors = _Mirrors()
+
+
+def _first_error(errors: list[BaseException]) -> BaseException:
+    """
+    What to raise when every mirror failed: a failure worth retrying over an
+    answer that the file can't be served.
+    """
+    for kind in (_TRANSIENT, UpstreamError, _NoRanges):
+        for error in errors:
+            if isinstance(error, kind):
+                return error
+    return errors[0]
+
+
+_hedge_pool = ThreadPoolExecutor(_HEDGE_WORKERS,
+                                 thread_name_prefix="igv-streamlit-hedge")
+
+
+class _Hedge:
+    """
+    One range asked of the mirrors of a file: of the best one first, and of
+    the next one as well whenever those asked so far have all failed or
+    taken longer than ``hedge_percentile`` of their usual response time.
+    Requests to several mirrors run on the bounded ``_hedge_pool``.  The
+    first answer is used; requests still waiting then are aborted (or
+    dropped, if not sent yet), and answers that come in anyway are closed.
+    """
+
+    def __init__(self, sources: dict[str, str], start: int, end: int,
+                 known: dict[str, tuple]):
+        self.sources = sources          # mirror -> where it was last found
+        self.start, self.end, self.known = start, end, known
+        self._cond    = threading.Condition()
+        self._pending: dict[str, float] = {}        # mirror -> when asked
+        self._aborts: dict[str, _Abort] = {}
+        self._futures = {}
+        self._winner  = None
+        self._errors: list[BaseException] = []
+
+    def run(self) -> tuple:
+        """Return ``(mirror, context manager, _Body)`` of the first answer."""
+        order = _mirrors.order(self.sources)
+        for i, mirror in enumerate(order):
+            with self._cond:
+                self._pending[mirror] = time.monotonic()
+                self._aborts[mirror]  = _Abort()
+            if len(order) == 1:
+                self._attempt(mirror)
+                break
+            self._futures[mirror] = _hedge_pool.submit(self._attempt, mirror)
+            if i == len(order) - 1:
+                break
+            deadline = time.monotonic() + _mirrors.hedge_delay(mirror)
+            with self._cond:
+                while self._winner is None and self._pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._winner is not None:
+                    break
+                if self._pending:
+                    _count("hedged")
+        with self._cond:
+            while self._winner is None and self._pending:
+                self._cond.wait()
+            if self._winner is None:
+                raise _first_error(self._errors)
+            now  = time.monotonic()
+            slow = self._pending
+            self._pending = {}
+        for mirror, asked in slow.items():
+            if self._futures[mirror].cancel():
+                continue                        # never sent
+            self._aborts[mirror].abort()
+            _mirrors.outpaced(mirror, now - asked)
+        if slow:
+            _count("hedges_aborted", len(slow))
+        return self._winner
+
+    def _attempt(self, mirror: str) -> None:
+        asked = time.monotonic()
+        abort = self._aborts[mirror]
+        cm = _open_range(self.sources[mirror], self.start, self.end,
+                         self.known.get(mirror), abort)
+        try:
+            body = cm.__enter__()
+        except BaseException as e:
+            if abort.aborted:
+                return                  # lost, and counted as outpaced
+            _mirrors.failed(mirror)
+            with self._cond:
+                self._pending.pop(mirror, None)
+                self._errors.append(e)
+                self._cond.notify_all()
+            return
+        with self._cond:
+            # Already counted as outpaced if no longer pending
+            timed = self._pending.pop(mirror, None) is not None
+            won   = self._winner is None
+            if won:
+                self._winner = (mirror, cm, body)
+                self._cond.notify_all()
+        if timed:
+            _mirrors.answered(mirror, time.monotonic() - asked)
+        if not won:
+            try:
+                cm.__exit__(None, None, None)
+            except Exception:
+                pass
+
+
+@contextmanager
+def _open_mirrored(sources: dict[str, str], start: int, end: int,
+                   known: dict[str, tuple]):
+    """
+    :func:`_open_range` over the mirrors of a file, ``sources`` mapping
+    each mirror's URL to where it was last found, with what is ``known``
+    about the file at each.  Yields the first :class:`_Body` to arrive,
+    its ``mirror`` set to the mirror that sent it.
+    """
+    mirror, cm, body = _Hedge(sources, start, end, known).run()
+    body.mirror = mirror
+    try:
+        yield body
+    except BaseException:
+        if not cm.__exit__(*sys.exc_info()):
+            raise
+    else:
+        cm.__exit__(None, None, None)
+
+
+# ── sparse files and block maps ──────────────────────────────────────────────
+
+_FALLOC_FL_KEEP_SIZE  = 0x01
+_FALLOC_FL_PUNCH_HOLE = 0x02
+
+
+def _load_fallocate():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate64
+    except (OSError, AttributeError):
+        return None
+    fallocate.argtypes = (ctypes.c_int, ctypes.c_int,
+                          ctypes.c_int64, ctypes.c_int64)
+    fallocate.restype  = ctypes.c_int
+    return fallocate
+
+
+_fallocate = _load_fallocate()
+
+
+def _punch_hole(fd: int, offset: int, length: int) -> bool:
+    """Free ``length`` bytes of ``fd`` at ``offset``, keeping its size."""
+    if _fallocate is None:
+        return False
+    return _fallocate(fd, _FALLOC_FL_PUNCH_HOLE | _FALLOC_FL_KEEP_SIZE,
+                      offset, length) == 0
+
+
+def _block_count(size: int) -> int:
+    return -(-size // BLOCK_SIZE)
+
+
+def _block_length(size: int, block: int) -> int:
+    return min(BLOCK_SIZE, size - block * BLOCK_SIZE)
+
+
+def _runs(blocks: list[int]) -> list[list[int]]:
+    """Sorted ``blocks`` as runs of consecutive ones, at most ``_MAX_RUN`` long."""
+    runs: list[list[int]] = []
+    for block in blocks:
+        if runs and block == runs[-1][-1] + 1 and len(runs[-1]) < _MAX_RUN:
+            runs[-1].append(block)
+        else:
+            runs.append([block])
+    return runs
+
+
+def _flagged(flags) -> list[int]:
+    """The blocks set in a block map."""
+    return [match.start() for match in re.finditer(rb"[^\0]", bytes(flags))]
+
+
+def _tally(size: int, present, pinned) -> tuple[int, int, int]:
+    """Bytes and blocks cached (not pinned), and bytes pinned, of an entry."""
+    cached = blocks = pinned_bytes = 0
+    for block in _flagged(present):
+        length = _block_length(size, block)
+        if block < len(pinned) and pinned[block]:
+            pinned_bytes += length
+        else:
+            cached += length
+            blocks += 1
+    return cached, blocks, pinned_bytes
+
+
+def _create(path: str, size: int) -> int:
+    """Replace ``path`` with an empty (sparse) file of ``size`` bytes."""
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    fd  = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        os.ftruncate(fd, size)
+        os.replace(tmp, path)
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp)
+        raise
+    return fd
+
+
+def _map(path: str, size: int):
+    """
+    Map the block map at ``path`` (created zero-filled, or grown, to
+    ``size`` bytes) shared, so every process sees every other one's
+    changes to it as they are made.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size) if size else bytearray()
+    finally:
+        os.close(fd)
+
+
+def _read_map(path: str) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return b""
+
+
+def _write_json(path: str, obj) -> None:
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _read_meta(entry: str) -> dict | None:
+    """
+    The entry's ``meta.json``, with the ``_id`` (inode, mtime) of the copy
+    read: a new generation replaces the file, and so changes it.
+    """
+    try:
+        with open(os.path.join(entry, "meta.json")) as f:
+            st   = os.fstat(f.fileno())
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(meta, dict) or meta.get("block_size") != BLOCK_SIZE:
+        return None
+    meta["_id"] = (st.st_ino, st.st_mtime_ns)
+    return meta
+
+
+def _same_version(a: tuple, b: tuple) -> bool:
+    """Whether two ``(size, ETag, Last-Modified)`` are the same remote file."""
+    (size_a, etag_a, modified_a), (size_b, etag_b, modified_b) = a, b
+    if size_a != size_b:
+        return False
+    # Some servers leave a validator off some responses
+    if etag_a and etag_b:
+        return etag_a == etag_b
+    if modified_a and modified_b:
+        return modified_a == modified_b
+    return True
+
+
+def _root() -> str:
+    return os.path.join(_artifacts.cache_dir(), "proxy")
+
+
+_GENERATION_FILES = ("data", "blocks", "pinned", "atime", "use", "fill")
+
+
+def _remove_generation(entry: str, meta: dict) -> None:
+    """
+    Delete the generation of an entry that ``meta`` names, and take its
+    blocks off the totals.  Processes still reading it keep their open
+    descriptors on it.
+    """
+    generation = meta.get("generation", "")
+    path = os.path.join(entry, generation)
+    with _lru.locked():
+        cached, blocks, pinned = _tally(
+            meta["size"], _read_map(os.path.join(path, "blocks")),
+            _read_map(os.path.join(path, "pinned")))
+        _lru.add(-cached, -blocks, -pinned)
+        for name in _GENERATION_FILES:
+            try:
+                os.unlink(os.path.join(path, name))
+            except OSError:
+                pass
+    if generation:
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+
+def _evict(key: str, generation: str, size: int, block: int) -> bool | None:
+    """
+    Drop ``block`` from a generation of entry ``key``; ``None`` if a reply
+    in any process is reading it, or it is pinned, ``False`` if the whole
+    entry had to go.
+    """
+    try:
+        gen = _hold_generation(os.path.join(_root(), key, generation))
+    except FileNotFoundError:
+        return True                     # that generation is gone
+    try:
+        with gen.lock:
+            if gen.readers[block] or \
+                    not lock_range(gen.use_fd, block, 1, wait=False):
+                return None
+            # Unlocking drops this process's read locks on the same bytes:
+            # there are none on the block, nor on any byte for the whole file
+            locked = (block, 1)
+            try:
+                bitmap = os.open(os.path.join(gen.path, "blocks"), os.O_RDWR)
+            except FileNotFoundError:
+                unlock_range(gen.use_fd, *locked)
+                return True
+            try:
+                with _lru.locked():
+                    present = os.pread(bitmap, _block_count(size), 0)
+                    pinned  = _read_map(os.path.join(gen.path, "pinned"))
+                    if block < len(pinned) and pinned[block]:
+                        return None
+                    if block >= len(present) or not present[block]:
+                        return True
+                    length = _block_length(size, block)
+                    if _punch_hole(gen.fd, block * BLOCK_SIZE, length):
+                        os.pwrite(bitmap, b"\0", block)
+                        _lru.add(-length, -1)
+                        return True
+                    # No holes here: empty the whole entry, if no block of
+                    # it is pinned or being read
+                    if any(pinned) or +gen.readers or \
+                            not lock_range(gen.use_fd, 0, 0, wait=False):
+                        return None
+                    locked = (0, 0)
+                    # Other processes map the block map: clear it, never shrink it
+                    os.pwrite(bitmap, bytes(len(present)), 0)
+                    os.ftruncate(gen.fd, 0)
+                    os.ftruncate(gen.fd, size)
+                    cached, blocks, _ = _tally(size, present, pinned)
+                    _lru.add(-cached, -blocks)
+                    return False
+            finally:
+                os.close(bitmap)
+                unlock_range(gen.use_fd, *locked)
+    finally:
+        _release_generation(gen)
+
+
+# ── LRU over every cached block, shared between processes ────────────────────
+
+# A trim evicts down to this fraction of proxy_cache_size, so a full cache
+# isn't scanned again for every block fetched
+_TRIM_TO = 0.9
+
+_STAMP = struct.Struct("<Q")            # last use of a block, ns since the epoch
+
+
+class _BlockLru:
+    """
+    Accounting and eviction for every cached block of every remote file,
+    shared by all the processes using the cache directory.
+
+    The totals -- ``cached`` bytes and blocks, pinned ones left out, and
+    ``pinned`` bytes -- live in the ``usage`` file, which each process
+    maps.  Every change to an entry's block or pin map is made under
+    :meth:`locked` together with the matching change to the totals, so
+    they stay exact however many processes fill and evict.  Recency is in
+    each entry's ``atime`` map.  When the totals go over
+    ``proxy_cache_size``, one process at a time scans the maps and evicts
+    the least recently used blocks, down to ``_TRIM_TO`` of it.  Pinned
+    blocks are never evicted, and don't count toward ``proxy_cache_size``.
+    """
+
+    _TOTALS = struct.Struct("<3q")
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._trimming = threading.Lock()
+        self._path: str | None = None
+        self._fd   = -1
+        self._map: mmap.mmap | None = None
+        self._loaded: str | None = None
+
+    def _open(self, create: bool = True) -> bool:
+        # Caller holds self._lock.  Follows the cache directory if it moved.
+        path = os.path.join(_root(), "usage")
+        if path == self._path:
+            return True
+        if not create and not os.path.exists(path):
+            return False
+        os.makedirs(_root(), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self._TOTALS.size:
+            os.ftruncate(fd, self._TOTALS.size)
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+        self._path, self._fd = path, fd
+        self._map = mmap.mmap(fd, self._TOTALS.size)
+        return True
+
+    @contextmanager
+    def locked(self):
+        """Hold the lock on the totals, against this process and others."""
+        with self._lock:
+            self._open()
+            lock_fd(self._fd)
+            try:
+                yield
+            finally:
+                unlock_fd(self._fd)
+
+    def add(self, cached: int = 0, blocks: int = 0, pinned: int = 0) -> None:
+        # Caller holds self.locked()
+        old = self._TOTALS.unpack_from(self._map)
+        self._TOTALS.pack_into(self._map, 0, old[0] + cached, old[1] + blocks,
+                               old[2] + pinned)
+
+    def totals(self) -> tuple[int, int, int]:
+        with self._lock:
+            if not self._open(create=False):
+                return 0, 0, 0
+            return self._TOTALS.unpack_from(self._map)
+
+    def load(self) -> None:
+        """Count the cache afresh once per process, in case one died mid-change."""
+        if self._loaded == _root():
+            return
+        with self.locked():
+            _, totals = self._scan()
+            self._TOTALS.pack_into(self._map, 0, *totals)
+            self._loaded = _root()
+
+    def _scan(self) -> tuple[list[tuple[int, str, str, int, int]],
+                             tuple[int, int, int]]:
+        """
+        Every evictable block, as ``(last use, entry key, generation, size,
+        block)``, and the totals.  Caller holds :meth:`locked`.
+        """
+        try:
+            keys = os.listdir(_root())
+        except FileNotFoundError:
+            return [], (0, 0, 0)
+        found:  list[tuple[int, str, str, int, int]] = []
+        totals = [0, 0, 0]
+        for key in keys:
+            entry = os.path.join(_root(), key)
+            meta  = _read_meta(entry)
+            if meta is None:
+                continue
+            generation, size = meta.get("generation", ""), meta["size"]
+            path    = os.path.join(entry, generation)
+            present = _read_map(os.path.join(path, "blocks"))
+            if len(present) != _block_count(size):
+                continue
+            pinned = _read_map(os.path.join(path, "pinned"))
+            atime  = _read_map(os.path.join(path, "atime"))
+            for i, n in enumerate(_tally(size, present, pinned)):
+                totals[i] += n
+            for block in _flagged(present):
+                if block < len(pinned) and pinned[block]:
+                    continue
+                used = _STAMP.unpack_from(atime, 8 * block)[0] \
+                    if 8 * block + 8 <= len(atime) else 0
+                found.append((used, key, generation, size, block))
+        return found, tuple(totals)
+
+    def trim(self) -> None:
+        """Evict least recently used blocks if over ``proxy_cache_size``."""
+        capacity = _srv._proxy_cache_size
+        if self.totals()[0] <= capacity:
+            return
+        if not self._trimming.acquire(blocking=False):
+            return
+        try:
+            fd = os.open(os.path.join(_root(), "trim.lock"),
+                         os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if not lock_fd(fd, wait=False):
+                    return              # another process is at it
+                with self.locked():
+                    found, totals = self._scan()
+                    self._TOTALS.pack_into(self._map, 0, *totals)
+                for _, key, generation, size, block in sorted(found):
+                    if self.totals()[0] <= capacity * _TRIM_TO:
+                        break
+                    # In use blocks are passed over, and tried again next time
+                    if _evict(key, generation, size, block) is not None:
+                        _count("evictions")
+            finally:
+                os.close(fd)
+        finally:
+            self._trimming.release()
+
+    def stats(self) -> dict[str, int]:
+        cached, blocks, pinned = self.totals()
+        return {"capacity":      _srv._proxy_cache_size,
+                "cached_bytes":  cached,
+                "cached_blocks": blocks,
+                "pinned_bytes":  pinned}
+
+
+_lru = _BlockLru()
+
+
+# ── remote files ─────────────────────────────────────────────────────────────
+
+# Tries at a read lock the kernel refuses as a deadlock (it sees processes,
+# not threads) before reading without one
+_LOCK_TRIES = 100
+
+
+class _Generation:
+    """
+    This process's hold on one generation of a cache entry: descriptors on
+    its ``data``, ``use`` and ``fill`` files, and how many of its replies
+    are reading each block.
+
+    A reply holds a shared ``lockf`` lock on the byte of ``use`` of each
+    block it reads, taken before it looks at the block map and kept until
+    it is released, and blocks are only evicted under an exclusive one, so
+    no process evicts a block another is serving.  Such locks belong to
+    the process, never conflict within it, and are all dropped when it
+    closes any descriptor on the file: so each process opens a generation
+    once, through :func:`_hold_generation`, counts its own readers here,
+    and closes the files when nothing holds them.  Fetches lock blocks of
+    ``fill`` the same way, so processes missing the same blocks don't all
+    fetch them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        fds: list[int] = []
+        try:
+            fds.append(os.open(os.path.join(path, "data"), os.O_RDWR))
+            for name in ("use", "fill"):
+                fds.append(os.open(os.path.join(path, name),
+                                   os.O_RDWR | os.O_CREAT, 0o600))
+            self.st = os.fstat(fds[0])
+        except BaseException:
+            for fd in fds:
+                os.close(fd)
+            raise
+        self.fd, self.use_fd, self.fill_fd = fds
+        self.lock    = threading.Lock()
+        self.readers: Counter[int] = Counter()
+        self.holders = 1
+
+    def hold(self, blocks: list[int]) -> None:
+        """Read-lock sorted ``blocks`` for one more reader each."""
+        with self.lock:
+            for run in _runs([b for b in blocks if not self.readers[b]]):
+                # Waits while another process evicts one of them
+                for _ in range(_LOCK_TRIES):
+                    if lock_range(self.use_fd, run[0], len(run), shared=True):
+                        break
+                    time.sleep(0.001)
+            self.readers.update(blocks)
+
+    def drop(self, blocks: list[int]) -> None:
+        """Undo :meth:`hold`."""
+        with self.lock:
+            self.readers.subtract(blocks)
+            last = [b for b in blocks if not self.readers[b]]
+            for block in last:
+                del self.readers[block]
+            for run in _runs(last):
+                unlock_range(self.use_fd, run[0], len(run))
+
+    def close(self) -> None:
+        for fd in (self.fd, self.use_fd, self.fill_fd):
+            os.close(fd)
+
+
+_generations: dict[str, _Generation] = {}
+_generations_lock = threading.Lock()
+
+
+def _hold_generation(path: str) -> _Generation:
+    """This process's :class:`_Generation` at ``path``, with a hold on it."""
+    with _generations_lock:
+        gen = _generations.get(path)
+        if gen is None:
+            gen = _generations[path] = _Generation(path)
+        else:
+            gen.holders += 1
+        return gen
+
+
+def _release_generation(gen: _Generation) -> None:
+    with _generations_lock:
+        gen.holders -= 1
+        if gen.holders == 0:
+            del _generations[gen.path]
+            gen.close()
+
+
+class _Lease(_srv._OpenFile):
+    """
+    A handle on a generation's ``data`` for one reply (or :func:`read`,
+    :func:`pin`), from :meth:`_Remote.open` until the file pool releases
+    it, with the remote file's validators and a hold on the generation.
+    It keeps the blocks it reads read-locked until then.
+    """
+
+    __slots__ = ("gen", "blocks")
+
+    def __init__(self, gen: _Generation, etag: str, last_modified: str | None):
+        super().__init__(gen.fd, gen.st, os.path.join(gen.path, "data"))
+        self.etag, self.last_modified = etag, last_modified
+        self.refs   = 1
+        self.gen    = gen
+        self.blocks: set[int] = set()
+
+    def hold(self, blocks: list[int]) -> None:
+        new = [b for b in blocks if b not in self.blocks]
+        self.gen.hold(new)
+        self.blocks.update(new)
+
+    def released(self, refs: int) -> None:
+        if refs == 0:
+            self.gen.drop(sorted(self.blocks))
+            self.blocks.clear()
+            _release_generation(self.gen)
+
+
+@contextmanager
+def _fill_lock(gen: _Generation, run: list[int]):
+    # Fetching without the lock only risks fetching twice
+    lock_range(gen.fill_fd, run[0], len(run))
+    try:
+        yield
+    finally:
+        unlock_range(gen.fill_fd, run[0], len(run))
+
+
+class _Remote:
+    """
+    One proxied file: its cache entry on disk, which blocks of it are there,
+    and the blocks being fetched right now.
+
+    An entry holds one generation of the file at a time, in a directory
+    that ``meta.json`` names; ``gen`` holds it open, and each reply gets a
+    :class:`_Lease` on it.  A remote file that changes gets a new
+    generation, while replies in flight finish reading the old one; other
+    processes notice the new ``meta.json`` and move over on their next
+    request.
+
+    A file with several mirror URLs is one entry.  Mirrors needn't agree
+    on validators, so each is checked against the ``(size, ETag,
+    Last-Modified)`` it last gave, and a mirror not heard from yet against
+    the size alone.
+    """
+
+    def __init__(self, urls: tuple[str, ...], key: str):
+        self.urls   = urls
+        self.url    = urls[0]
+        self.sources = {url: url for url in urls}      # after redirects
+        self.versions: dict[str, tuple] = {}           # mirror -> its validators
+        self.key    = key
+        self.entry  = os.path.join(_root(), key)
+        path = urlsplit(self.url).path
+        self.mime          = _srv._get_mime(path)
+        self.cache_control = _srv._get_cache_control(path)
+        self.lock   = threading.Lock()
+        self.gen: _Generation | None = None
+        self.meta_id: tuple | None = None
+        # Shared maps of the generation, one byte (atime: 8) per block
+        self.present = bytearray()
+        self.pinned  = bytearray()
+        self.atime   = bytearray()
+        self.size      = 0
+        self.etag: str | None          = None
+        self.last_modified: str | None = None
+        self.reply_etag = ""
+        self.mtime_ns  = 0
+        self.passthrough = False
+        self.checked   = 0.0
+        # Set while a request checks the remote file, and how that check
+        # failed, for requests waiting on it
+        self.probing: threading.Event | None = None
+        self.failure: UpstreamError | None = None
+        self.inflight: dict[int, threading.Event] = {}
+
+    # ── entry ────────────────────────────────────────────────────────────────
+
+    def open(self) -> _Lease:
+        """
+        Return a lease on the cache entry, for the file pool to release, checking
+        the remote file on first use and every ``_REVALIDATE_INTERVAL``.
+        Raises ``_NoRanges`` or ``UpstreamError`` if it can't be served
+        from the cache.
+
+        One request checks at a time, without holding ``self.lock``; others
+        are served the cached generation meanwhile, or wait for the check if
+        there is none yet.
+        """
+        probed = False
+        while True:
+            with self.lock:
+                if self.passthrough:
+                    raise _NoRanges(self.url)
+                if self.gen is None or not self._current():
+                    self._reload()
+                # Once checked, serve what the check left, however short the
+                # interval: checking again would only loop
+                if self.gen is not None and (probed or
+                        time.monotonic() - self.checked <= _REVALIDATE_INTERVAL):
+                    return _Lease(_hold_generation(self.gen.path), self.reply_etag,
+                                  self.last_modified)
+                waiting = self.probing
+                if waiting is None:
+                    self.probing = probe = threading.Event()
+                    self.failure = None
+                    self.checked = time.monotonic()
+                    cached  = self.gen is not None and self.present[:1] == b"\1"
+                    sources = dict(self.sources)
+            if waiting is not None:
+                waiting.wait()
+                with self.lock:
+                    if self.gen is None and self.failure is not None:
+                        raise self.failure
+                continue
+            failure = None
+            try:
+                self._probe(cached, sources)
+                probed = True
+            except UpstreamError as e:
+                failure = e
+                raise
+            finally:
+                with self.lock:
+                    self.probing = None
+                    self.failure = failure
+                probe.set()
+
+    def _current(self) -> bool:
+        # Caller holds self.lock.  Whether meta.json still names our generation.
+        try:
+            st = os.stat(os.path.join(self.entry, "meta.json"))
+        except OSError:
+            return True
+        return (st.st_ino, st.st_mtime_ns) == self.meta_id
+
+    def _reload(self) -> None:
+        # Caller holds self.lock.  Move to the generation another process made.
+        meta = _read_meta(self.entry)
+        if meta is not None and meta.get("url") == self.url:
+            self._load(meta)
+
+    def _probe(self, cached: bool, sources: dict[str, str]) -> None:
+        # Asks for block 0 (one byte of it if it is ``cached``), which tells
+        # the size and validators, then takes self.lock to (re)open the
+        # entry to match.
+        end = 0 if cached else BLOCK_SIZE - 1
+        try:
+            with _open_mirrored(sources, 0, end, {}) as body:
+                data    = body.read(min(end + 1, body.size)) if body.size else b""
+                mirror  = body.mirror
+                url     = body.url
+                size    = body.size
+                version = (size, body.etag, body.last_modified)
+        except _NoRanges:
+            with self.lock:
+                self.passthrough = True
+            raise
+        except (*_TRANSIENT, UpstreamError) as e:
+            with self.lock:
+                offline = self.gen is not None
+            if not offline:
+                if isinstance(e, UpstreamError):
+                    raise
+                raise UpstreamError(502, f"{self.url}: {e}") from e
+            if isinstance(e, UpstreamError) and e.status == 404:
+                raise
+            # Offline, or the server is failing: serve what is cached, as it was
+            logger.warning("igv-streamlit: %s unavailable (%s); serving cached "
+                           "blocks only", self.url, e)
+            return
+
+        _count("upstream_bytes", len(data))
+        with self.lock:
+            self.sources[mirror] = url
+            if self.gen is None:
+                self._reset(mirror, *version)
+            elif not _same_version(self.versions.get(mirror, (self.size, None, None)),
+                                   version):
+                logger.info("igv-streamlit: %s changed; caching it afresh", mirror)
+                self._reset(mirror, *version)
+            else:
+                self.versions[mirror] = version
+            if size and len(data) == _block_length(size, 0) and not self.present[0]:
+                os.pwrite(self.gen.fd, data, 0)
+                self._mark(0)
+                _count("misses")
+
+    def _load(self, meta: dict) -> bool:
+        # Caller holds self.lock.  Open the generation meta names.
+        path = os.path.join(self.entry, meta.get("generation", ""))
+        try:
+            gen = _hold_generation(path)
+        except OSError:
+            return False
+        try:
+            if gen.st.st_size != meta["size"] or \
+                    os.path.getsize(os.path.join(path, "blocks")) != \
+                    _block_count(meta["size"]):
+                raise FileNotFoundError(path)
+        except OSError:
+            _release_generation(gen)
+            return False
+        self._adopt(gen, meta["size"], meta["etag"], meta["last_modified"],
+                    meta["_id"])
+        self.versions = {meta.get("mirror", self.url):
+                         (meta["size"], meta["etag"], meta["last_modified"])}
+        return True
+
+    def _reset(self, mirror: str, size: int, etag: str | None,
+               last_modified: str | None) -> None:
+        # Caller holds self.lock.  Start an empty generation of the entry for
+        # this version, as told by mirror -- unless another process just did.
+        version = (size, etag, last_modified)
+        os.makedirs(self.entry, exist_ok=True)
+        with _artifacts.locked(os.path.join(self.entry, "lock")):
+            meta = _read_meta(self.entry)
+            if meta is not None and meta.get("url") == self.url and \
+                    meta["_id"] != self.meta_id:
+                known = (meta["size"], meta["etag"], meta["last_modified"]) \
+                    if meta.get("mirror") == mirror else (meta["size"], None, None)
+                if _same_version(known, version) and self._load(meta):
+                    self.versions[mirror] = version
+                    return
+
+            generation = uuid.uuid4().hex[:16]
+            path = os.path.join(self.entry, generation)
+            os.makedirs(path)
+            os.close(_create(os.path.join(path, "data"), size))
+            gen = _hold_generation(path)
+            meta_path = os.path.join(self.entry, "meta.json")
+            _write_json(meta_path,
+                        {"url": self.url, "mirror": mirror, "size": size,
+                         "etag": etag, "last_modified": last_modified,
+                         "block_size": BLOCK_SIZE, "generation": generation})
+            st = os.stat(meta_path)
+            self._adopt(gen, size, etag, last_modified, (st.st_ino, st.st_mtime_ns))
+            self.versions = {mirror: version}
+            if meta is not None:
+                _remove_generation(self.entry, meta)
+
+    def _adopt(self, gen: _Generation, size: int, etag: str | None,
+               last_modified: str | None, meta_id: tuple) -> None:
+        # Caller holds self.lock.  Takes over the caller's hold on gen.
+        count = _block_count(size)
+        try:
+            maps = (_map(os.path.join(gen.path, "blocks"), count),
+                    _map(os.path.join(gen.path, "pinned"), count),
+                    _map(os.path.join(gen.path, "atime"),  _STAMP.size * count))
+        except BaseException:
+            _release_generation(gen)
+            raise
+        if self.gen is not None:
+            # Replies still reading the old generation hold it open
+            _release_generation(self.gen)
+            for flags in (self.present, self.pinned, self.atime):
+                if isinstance(flags, mmap.mmap):
+                    flags.close()
+
+        # Validators of the remote file, not of the local copy
+        identity = f"{self.url}\0{size}\0{etag}\0{last_modified}"
+        self.reply_etag = '"%s"' % hashlib.sha256(identity.encode()).hexdigest()[:32]
+        try:
+            self.mtime_ns = int(parsedate_to_datetime(last_modified).timestamp()
+                                * 1_000_000_000)
+        except (TypeError, ValueError):
+            self.mtime_ns = time.time_ns()
+        self.gen     = gen
+        self.meta_id = meta_id
+        self.present, self.pinned, self.atime = maps
+        self.size, self.etag, self.last_modified = size, etag, last_modified
+
+    def _mark(self, block: int) -> None:
+        # Caller holds self.lock
+        with _lru.locked():
+            if not self.present[block]:
+                self.present[block] = 1
+                _lru.add(_block_length(self.size, block), 1)
+        self._stamp([block])
+
+    def _stamp(self, blocks) -> None:
+        # Caller holds self.lock.  Record the blocks' use, for the LRU.
+        now = time.time_ns()
+        for block in blocks:
+            _STAMP.pack_into(self.atime, _STAMP.size * block, now)
+
+    def pin(self, lease: _Lease,
+            spans: list[tuple[int, int]]) -> tuple[int, int, int]:
+        """
+        Pin the cached blocks under the ``(offset, length)`` spans of the
+        generation ``lease`` is on.  Returns how many blocks the spans cover, how many of
+        them are pinned, and their bytes.
+        """
+        blocks = _blocks_of(spans)
+        with self.lock:
+            if lease.gen is not self.gen:
+                raise _Changed(self.url)
+            with _lru.locked():
+                new = [b for b in blocks if self.present[b] and not self.pinned[b]]
+                for block in new:
+                    self.pinned[block] = 1
+                nbytes = sum(_block_length(self.size, b) for b in new)
+                _lru.add(-nbytes, -len(new), nbytes)
+            pinned = [b for b in blocks if self.pinned[b]]
+        return (len(blocks), len(pinned),
+                sum(_block_length(self.size, b) for b in pinned))
+
+    def unpin(self) -> int:
+        """
+        Unpin every block of the entry (opening it from disk if need be)
+        and return their bytes.
+        """
+        with self.lock:
+            if self.gen is None or not self._current():
+                self._reload()
+            if self.gen is None:
+                return 0
+            with _lru.locked():
+                blocks = _flagged(self.pinned)
+                for block in blocks:
+                    self.pinned[block] = 0
+                nbytes = sum(_block_length(self.size, b) for b in blocks)
+                _lru.add(nbytes, len(blocks), -nbytes)
+        return nbytes
+
+    # ── blocks ───────────────────────────────────────────────────────────────
+
+    def ensure(self, lease: _Lease,
+               spans: list[tuple[int, int]]) -> None:
+        """
+        Make sure the ``(offset, length)`` spans of the generation ``lease``
+        is on are on disk, and stay there until it is released, fetching
+        missing blocks upstream.  Blocks another request, in this process or
+        another, is already fetching are waited for rather than fetched
+        twice.
+        """
+        needed = _blocks_of(spans)
+        lease.hold(needed)
+        first = True
+        while True:
+            with self.lock:
+                if lease.gen is not self.gen:
+                    raise _Changed(self.url)
+                missing = [b for b in needed if not self.present[b]]
+                if first:
+                    _count("hits", len(needed) - len(missing))
+                    first = False
+                if not missing:
+                    self._stamp(needed)
+                    break
+                waits = {b: self.inflight[b] for b in missing if b in self.inflight}
+                mine  = {b: threading.Event() for b in missing if b not in waits}
+                self.inflight.update(mine)
+            if mine:
+                self._fetch(lease.gen, mine)
+            for event in waits.values():
+                event.wait()
+            _count("coalesced", len(waits))
+
+    def _fetch(self, gen: _Generation,
+               claimed: dict[int, threading.Event]) -> None:
+        try:
+            for run in _runs(sorted(claimed)):
+                with _fill_lock(gen, run):
+                    with self.lock:
+                        if gen is not self.gen:
+                            raise _Changed(self.url)
+                        # Fetched by another process while this one waited
+                        done = [b for b in run if self.present[b]]
+                        for block in done:
+                            self.inflight.pop(block).set()
+                    _count("coalesced", len(done))
+                    for part in _runs([b for b in run if b not in done]):
+                        self._fetch_run(gen, part)
+        except (*_TRANSIENT, _NoRanges) as e:
+            raise UpstreamError(502, f"{self.url}: {e}") from e
+        finally:
+            with self.lock:
+                for block, event in claimed.items():
+                    if self.inflight.get(block) is event:
+                        del self.inflight[block]
+                    event.set()
+            _lru.trim()
+
+    def _fetch_run(self, gen: _Generation, run: list[int]) -> None:
+        start = run[0] * BLOCK_SIZE
+        end   = min((run[-1] + 1) * BLOCK_SIZE, self.size) - 1
+        with self.lock:
+            sources, known = dict(self.sources), dict(self.versions)
+        with _open_mirrored(sources, start, end, known) as body:
+            version = (body.size, body.etag, body.last_modified)
+            with self.lock:
+                if gen is not self.gen:
+                    raise _Changed(self.url)
+                self.sources[body.mirror] = body.url
+                if not _same_version(
+                        self.versions.get(body.mirror, (self.size, None, None)),
+                        version):
+                    logger.info("igv-streamlit: %s changed; caching it afresh",
+                                body.mirror)
+                    self._reset(body.mirror, *version)
+                    raise _Changed(self.url)
+                self.versions.setdefault(body.mirror, version)
+            for block in run:
+                length = _block_length(self.size, block)
+                data   = body.read(length)
+                if len(data) < length:
+                    raise EOFError(f"{self.url} ended early")
+                os.pwrite(gen.fd, data, block * BLOCK_SIZE)
+                _count("upstream_bytes", length)
+                _count("misses")
+                with self.lock:
+                    if gen is not self.gen:
+                        raise _Changed(self.url)
+                    self._mark(block)
+                    self.inflight.pop(block).set()
+
+
+def _blocks_of(spans: list[tuple[int, int]]) -> list[int]:
+    return sorted({block for offset, length in spans if length
+                   for block in range(offset // BLOCK_SIZE,
+                                      (offset + length - 1) // BLOCK_SIZE + 1)})
+
+
+_remotes: dict[str, _Remote] = {}
+_remotes_lock = threading.Lock()
+
+
+def _remote_for(urls: tuple[str, ...]) -> _Remote:
+    identity = "\n".join(urls)
+    key = hashlib.sha256(identity.encode("utf-8", "surrogateescape")).hexdigest()[:32]
+    with _remotes_lock:
+        remote = _remotes.get(key)
+        if remote is None:
+            _lru.load()
+            remote = _remotes[key] = _Remote(urls, key)
+        return remote
+
+
+# ── track indexes ────────────────────────────────────────────────────────────
+
+# The index igv.js looks for next to an indexed file given no indexURL
+INDEX_SUFFIXES = {"bam": ".bai", "cram": ".crai", "tabix": ".tbi", "fasta": ".fai"}
+
+
+def index_kind(track: dict) -> str | None:
+    """
+    What indexed file a remote track or reference config points at:
+    ``"bam"``, ``"cram"``, ``"tabix"`` (bgzipped features) or ``"fasta"``.
+    ``None`` for anything else, including bgzipped FASTA, which needs a
+    ``.gzi`` as well.
+    """
+    value = track.get("fastaURL") or track.get("url")
+    url   = value if isinstance(value, str) else next(iter(value or ()), None)
+    if not isinstance(url, str):
+        return None
+    path = urlsplit(url).path.lower()
+    fmt  = str(track.get("format", "")).lower()
+    if "fastaURL" in track:
+        return None if path.endswith(".gz") else "fasta"
+    if fmt in ("bam", "cram"):
+        return fmt
+    if path.endswith((".bam", ".cram")):
+        return path.rsplit(".", 1)[1]
+    if path.endswith(".gz"):
+        return "tabix"
+    return None
+
+
+def guessed_index(urls: tuple[str, ...], kind: str) -> tuple[str, ...]:
+    """
+    The index URLs igv.js tries for a ``kind`` file at ``urls`` given no
+    ``indexURL``: the suffix goes on the path, before any query.
+    """
+    guessed = []
+    for url in urls:
+        base, sep, query = url.partition("?")
+        guessed.append(base + INDEX_SUFFIXES[kind] + sep + query)
+    return tuple(guessed)
+
+
+# ── replies ──────────────────────────────────────────────────────────────────
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    """
+    The bounded pool event-loop servers build proxied replies on, so
+    requests waiting on a slow upstream can't take every thread local
+    files are read on.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(_EXECUTOR_WORKERS,
+                                           thread_name_prefix="igv-proxy")
+        return _executor
+
+
+def build_reply(method: str, urls: tuple[str, ...], headers) -> _srv._Reply:
+    """Answer ``method`` for the proxied file at ``urls`` from the cache."""
+    remote = _remote_for(urls)
+    # Blocks being read are passed over, so a cache that overflowed while
+    # they were is trimmed here too
+    _lru.trim()
+    for _ in range(2):
+        try:
+            handle = remote.open()
+        except _NoRanges as e:
+            direct = [url for url in urls
+                      if urlsplit(url).scheme in ("http", "https")]
+            if not direct:
+                logger.warning("igv-streamlit: can't proxy %s", e)
+                return _srv._empty_reply(502)
+            _count("redirects")
+            return _srv._empty_reply(307, ("Location", direct[0]))
+        except UpstreamError as e:
+            logger.warning("igv-streamlit: can't proxy %s", e)
+            return _srv._empty_reply(e.status)
+        try:
+            validators = [("ETag", handle.etag)]
+            if handle.last_modified:
+                validators.append(("Last-Modified", handle.last_modified))
+            validators.append(("Cache-Control", remote.cache_control))
+            if _srv._not_modified(handle.etag, remote.mtime_ns, headers):
+                _srv._file_pool.release(handle)
+                return _srv._Reply(304, [*validators, *_srv._CORS_HEADERS])
+            reply = _srv._body_reply(handle, remote.mime, validators, headers)
+            if method == "GET" and reply.handle is not None:
+                remote.ensure(handle, [s for s in reply.segments
+                                       if not isinstance(s, bytes)])
+            return reply
+        except _Changed:
+            _srv._file_pool.release(handle)
+        except UpstreamError as e:
+            _srv._file_pool.release(handle)
+            logger.warning("igv-streamlit: can't proxy %s", e)
+            return _srv._empty_reply(e.status)
+        except BaseException:
+            _srv._file_pool.release(handle)
+            raise
+    return _srv._empty_reply(502)
+
+
+# ── pinning ──────────────────────────────────────────────────────────────────
+
+def _with_entry(urls: tuple[str, ...], work):
+    """
+    Run ``work(remote, lease)`` on the cache entry of the file at ``urls``,
+    again if the file changes meanwhile.  Any failure to get the file is
+    raised as ``UpstreamError``.
+    """
+    remote = _remote_for(urls)
+    for _ in range(2):
+        try:
+            handle = remote.open()
+        except _NoRanges as e:
+            raise UpstreamError(502, f"{e}: no range requests") from e
+        try:
+            return work(remote, handle)
+        except _Changed:
+            continue
+        except _TRANSIENT as e:
+            raise UpstreamError(502, f"{remote.url}: {e}") from e
+        finally:
+            _srv._file_pool.release(handle)
+    raise UpstreamError(502, f"{remote.url} keeps changing")
+
+
+def read(urls: tuple[str, ...], offset: int, length: int) -> bytes:
+    """
+    ``length`` bytes from ``offset`` of the file at ``urls`` (fewer at its
+    end), through the cache.
+    """
+    def work(remote: _Remote, lease: _Lease) -> bytes:
+        n = max(0, min(length, lease.size - offset))
+        remote.ensure(lease, [(offset, n)])
+        return _srv._pread(lease.fd, n, offset)
+    return _with_entry(urls, work)
+
+
+def pin(urls: tuple[str, ...], spans: list[tuple[int, int]],
+        fetch: bool = True) -> tuple[int, int, int]:
+    """
+    Pin the blocks of the file at ``urls`` under the ``(offset, length)``
+    spans, fetching those not cached yet unless ``fetch`` is false.  Returns
+    how many blocks the spans cover, how many of them are pinned, and their
+    bytes.
+    """
+    def work(remote: _Remote, lease: _Lease) -> tuple[int, int, int]:
+        inside = [(offset, min(length, lease.size - offset))
+                  for offset, length in spans if offset < lease.size]
+        if fetch:
+            remote.ensure(lease, inside)
+        return remote.pin(lease, inside)
+    return _with_entry(urls, work)
+
+
+def unpin(urls: tuple[str, ...]) -> int:
+    """Unpin the file at ``urls``; returns the bytes unpinned."""
+    return _remote_for(urls).unpin()
+
+
+def stats() -> dict:
+    with _counts_lock:
+        counts = dict(_counts)
+    with _remotes_lock:
+        remotes = len(_remotes)
+    return {"remotes": remotes, **_lru.stats(),
+            **{name: counts.get(name, 0)
+               for name in ("hits", "misses", "coalesced", "evictions",
+                            "upstream_requests", "reused_connections",
+                            "upstream_bytes", "redirects", "hedged",
+                            "hedges_aborted")},
+            "mirrors": _mirrors.stats()}
@@ -0,0 +1,284 @@
+# igv_streamlit/_streamlit_mount.py
+
+"""
+Serve registered files from Streamlit's own web server.
+
+The standalone server listens on a second 127.0.0.1 port, which a remote
+browser can't reach through a reverse proxy, which an HTTPS page may not
+load from (mixed content), and which makes every ``Range`` request a
+cross-origin one that needs a CORS preflight.  Mounting ``/file/<token>``
+on the Streamlit server itself gives igv.js same-origin URLs under
+``<baseUrlPath>/_igv_streamlit/``.
+
+The supported way in is Streamlit's own ``st.App``: an app started from
+``st.App(script, middleware=[igv_streamlit.file_middleware()])`` answers
+file requests in that middleware, before Streamlit's own (whose gzip layer
+would recompress every text response), streaming bodies through the event
+loop.
+
+Plain ``streamlit run script.py`` has no hook for extra routes, so there the
+running server is found with ``gc`` and patched, on the Streamlit releases
+in ``_PATCHABLE_VERSIONS`` only, and with a warning saying so:
+
+* Starlette/uvicorn: the application's private ``middleware_stack`` is
+  wrapped in the same middleware.
+* Tornado (older releases): a handler is added with ``add_handlers`` and
+  streams bodies with ``flush()`` back-pressure.
+
+Either way responses are planned by the shared ``server._build_reply``, and
+file reads run on the default executor (proxied replies on the proxy's
+own), so Streamlit's event loop never blocks on disk or upstream.  This
+is a property of the mount, not of proxying: the standalone server's
+threaded engine still holds a worker thread for a proxied request until
+its upstream fetch is done.
+
+:func:`mount` returns ``None`` when there is no server to serve from (e.g.
+outside ``streamlit run``) or it can't be patched, and the caller falls
+back to the standalone server.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import logging
+import threading
+
+from . import server as _srv
+from ._aioserver import _Headers
+
+logger = logging.getLogger(__name__)
+
+ROUTE = "_igv_streamlit"
+
+# Bytes read from disk per executor call while streaming a file slice
+_STREAM_CHUNK = 256 * 1024
+
+# Streamlit releases (first, past last) whose private server internals the
+# gc-and-patch fallback was written against
+_PATCHABLE_VERSIONS = ((1, 42), (1, 67))
+
+_mount_lock = threading.Lock()
+_mounted: str | None = None
+_attempted = False
+# Set once file_middleware() is part of a running st.App
+_middleware_installed = False
+
+
+def _base_url() -> str:
+    from streamlit import config
+    base = (config.get_option("server.baseUrlPath") or "").strip("/")
+    return f"/{base}" if base else ""
+
+
+def _streamlit_version() -> tuple[int, int]:
+    import streamlit
+    major, minor = streamlit.__version__.split(".")[:2]
+    return int(major), int(minor)
+
+
+def _is_streamlit_app(routes) -> bool:
+    return any(str(getattr(route, "path", route)).endswith("_stcore/health")
+               for route in routes)
+
+
+def mount() -> str | None:
+    """
+    Mount the file route on the running Streamlit server (once) and return
+    the URL prefix files are served under, e.g. ``/_igv_streamlit``, or
+    ``None`` if there is no Streamlit server in this process.
+    """
+    global _mounted, _attempted
+    with _mount_lock:
+        if _middleware_installed:
+            _mounted = _base_url() + "/" + ROUTE
+        elif not _attempted:
+            _attempted = True
+            _mounted = _patch(_base_url() + "/" + ROUTE)
+        return _mounted
+
+
+def _patch(prefix: str) -> str | None:
+    """Patch the file route into a server started by ``streamlit run``."""
+    first, past = _PATCHABLE_VERSIONS
+    if not first <= _streamlit_version() < past:
+        import streamlit
+        logger.warning(
+            "igv-streamlit: same_origin can't patch Streamlit %s; start the "
+            "app with st.App(script, middleware=[igv_streamlit."
+            "file_middleware()]) instead.  Using the standalone server.",
+            streamlit.__version__)
+        return None
+    try:
+        patched = _mount_starlette(prefix) or _mount_tornado(prefix)
+    except Exception:
+        logger.exception("igv-streamlit: failed to patch the file route into "
+                         "Streamlit; using the standalone server")
+        return None
+    if not patched:
+        logger.warning("igv-streamlit: no Streamlit server found to serve "
+                       "files from; using the standalone server")
+        return None
+    logger.warning(
+        "igv-streamlit: serving files from Streamlit at %s by patching its "
+        "private server internals; st.App(script, middleware=[igv_streamlit."
+        "file_middleware()]) does this without patching", prefix)
+    return prefix
+
+
+def file_middleware():
+    """
+    The Starlette middleware serving registered files at
+    ``<baseUrlPath>/_igv_streamlit/file/<token>``, for
+    ``st.App(script, middleware=[igv_streamlit.file_middleware()])``.
+
+    With it, ``configure_server(same_origin=True)`` serves local files from
+    the app's own server without patching Streamlit.
+    """
+    from starlette.middleware import Middleware
+    return Middleware(_FileRouteASGI)
+
+
+# ── Starlette / uvicorn ──────────────────────────────────────────────────────
+
+def _mount_starlette(prefix: str) -> bool:
+    try:
+        from starlette.applications import Starlette
+    except ImportError:
+        return False
+    for obj in gc.get_objects():
+        if isinstance(obj, Starlette) and _is_streamlit_app(obj.router.routes):
+            inner = obj.middleware_stack or obj.build_middleware_stack()
+            obj.middleware_stack = _FileRouteASGI(inner, prefix + "/file/")
+            return True
+    return False
+
+
+class _FileRouteASGI:
+    """
+    ASGI middleware answering ``<prefix><token>`` itself and passing on the
+    rest.  Without a ``prefix`` (as an ``st.App`` middleware) it is worked
+    out from ``baseUrlPath`` on the first request.
+    """
+
+    def __init__(self, app, prefix: str | None = None):
+        global _middleware_installed
+        self.app    = app
+        self.prefix = prefix
+        if prefix is None:
+            _middleware_installed = True
+
+    async def __call__(self, scope, receive, send) -> None:
+        if self.prefix is None:
+            self.prefix = _base_url() + "/" + ROUTE + "/file/"
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = _Headers()
+        for name, value in scope["headers"]:
+            headers[name.decode("latin-1").lower()] = value.decode("latin-1")
+        method = scope["method"]
+        target = "/file/" + path[len(self.prefix):]
+
+        loop  = asyncio.get_running_loop()
+        reply = await loop.run_in_executor(
+            _srv._reply_executor(target), _srv._build_reply, method, target, headers)
+        try:
+            await send({
+                "type":    "http.response.start",
+                "status":  reply.status,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                            for name, value in reply.headers],
+            })
+            if method != "HEAD":
+                for segment in reply.segments:
+                    if isinstance(segment, bytes):
+                        await send({"type": "http.response.body",
+                                    "body": segment, "more_body": True})
+                        continue
+                    offset, length = segment
+                    end = offset + length
+                    while offset < end:
+                        chunk = await loop.run_in_executor(
+                            None, _srv._pread, reply.handle.fd,
+                            min(_STREAM_CHUNK, end - offset), offset)
+                        if not chunk:
+                            # File shrank under us; uvicorn closes the
+                            # connection when Content-Length isn't met
+                            return
+                        await send({"type": "http.response.body",
+                                    "body": chunk, "more_body": True})
+                        offset += len(chunk)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            reply.close()
+
+
+# ── Tornado ──────────────────────────────────────────────────────────────────
+
+def _mount_tornado(prefix: str) -> bool:
+    try:
+        import tornado.web
+    except ImportError:
+        return False
+    for obj in gc.get_objects():
+        if isinstance(obj, tornado.web.Application) and _is_streamlit_app(
+                getattr(getattr(rule.matcher, "regex", None), "pattern", "").rstrip("$")
+                for rule in obj.wildcard_router.rules):
+            obj.add_handlers(r".*", [(prefix + r"/file/(.*)", _tornado_handler())])
+            return True
+    return False
+
+
+def _tornado_handler():
+    import tornado.web
+
+    class FileHandler(tornado.web.RequestHandler):
+        async def get(self, rest: str) -> None:
+            await self._serve(rest)
+
+        async def head(self, rest: str) -> None:
+            await self._serve(rest)
+
+        def compute_etag(self):
+            return None                 # file replies carry their own ETag
+
+        async def _serve(self, rest: str) -> None:
+            headers = _Headers()
+            for name, value in self.request.headers.get_all():
+                headers[name.lower()] = value
+            method = self.request.method
+            loop   = asyncio.get_running_loop()
+            target = "/file/" + rest
+            reply  = await loop.run_in_executor(
+                _srv._reply_executor(target), _srv._build_reply, method, target,
+                headers)
+            try:
+                self.set_status(reply.status)
+                self.clear_header("Content-Type")
+                for name, value in reply.headers:
+                    self.set_header(name, value)
+                if method == "HEAD":
+                    return
+                for segment in reply.segments:
+                    if isinstance(segment, bytes):
+                        self.write(segment)
+                        continue
+                    offset, length = segment
+                    end = offset + length
+                    while offset < end:
+                        chunk = await loop.run_in_executor(
+                            None, _srv._pread, reply.handle.fd,
+                            min(_STREAM_CHUNK, end - offset), offset)
+                        if not chunk:
+                            self.request.connection.close()
+                            return
+                        self.write(chunk)
+                        await self.flush()
+                        offset += len(chunk)
+            finally:
+                reply.close()
+
+    return FileHandler
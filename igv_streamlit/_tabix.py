@@ -0,0 +1,312 @@
+# igv_streamlit/_tabix.py
+
+"""
+Pure-Python bgzip + tabix for plain-text feature tracks.
+
+igv.js has to download and parse a plain GFF/GTF/BED/VCF in full before it
+can draw anything.  Given a BGZF-compressed copy and a tabix (``.tbi``)
+index it only fetches the blocks overlapping the visible region.
+
+:func:`sort_and_bgzip` writes a position-sorted BGZF copy of a text track
+and :func:`tabix_index` indexes a BGZF file, following the SAMtools
+specifications (https://samtools.github.io/hts-specs/).  Tracks bigger
+than ``_SORT_RUN_BYTES`` are sorted in runs spilled to temporary files and
+merged, so memory stays bounded whatever the track's size.
+"""
+
+from __future__ import annotations
+
+import heapq
+import io
+import os
+import struct
+import tempfile
+from typing import BinaryIO, Callable, Iterator, NamedTuple
+
+from . import _artifacts
+from ._bgzf import BgzfWriter, iter_blocks
+
+# ── presets ──────────────────────────────────────────────────────────────────
+
+class Preset(NamedTuple):
+    fmt: int          # 0 generic, 2 VCF; | 0x10000 for 0-based half-open
+    col_seq: int      # 1-based columns
+    col_beg: int
+    col_end: int      # 0 = derive (VCF: from REF / INFO END)
+    meta: str
+
+
+PRESETS: dict[str, Preset] = {
+    ".gff":  Preset(0,       1, 4, 5, "#"),
+    ".gff3": Preset(0,       1, 4, 5, "#"),
+    ".gtf":  Preset(0,       1, 4, 5, "#"),
+    ".bed":  Preset(0x10000, 1, 2, 3, "#"),
+    ".vcf":  Preset(2,       1, 2, 0, "#"),
+}
+
+# BED files may start with UCSC browser/track lines; keep them in the header
+_HEADER_PREFIXES = (b"browser", b"track")
+
+
+def _interval(fields: list[bytes], preset: Preset) -> tuple[bytes, int, int]:
+    """Return (sequence, 0-based begin, 0-based exclusive end) of a record."""
+    seq = fields[preset.col_seq - 1]
+    beg = int(fields[preset.col_beg - 1])
+    if not preset.fmt & 0x10000:
+        beg -= 1
+    if preset.col_end:
+        end = int(fields[preset.col_end - 1])
+    else:                               # VCF: POS + len(REF), or INFO END=
+        end = beg + len(fields[3])
+        for item in fields[7].split(b";") if len(fields) > 7 else ():
+            if item.startswith(b"END="):
+                end = int(item[4:])
+                break
+    return seq, beg, max(end, beg + 1)
+
+
+# ── sort + bgzip ─────────────────────────────────────────────────────────────
+
+# Bytes of record lines sorted in memory at once; a bigger track is sorted
+# in runs of this size, each spilled to a temporary file, which are merged.
+_SORT_RUN_BYTES = 64 * 1024 * 1024
+# A spilled record: sequence rank, begin and line length, then the line
+_RUN_RECORD = struct.Struct("<IqI")
+
+
+def _record_key(record: tuple[int, int, bytes]) -> tuple[int, int]:
+    return record[0], record[1]
+
+
+def _spill(run: list[tuple[int, int, bytes]], directory: str) -> BinaryIO:
+    """Sort ``run`` into a temporary file in ``directory``, rewound."""
+    run.sort(key=_record_key)
+    f = tempfile.TemporaryFile(dir=directory)
+    for rank, beg, line in run:
+        f.write(_RUN_RECORD.pack(rank, beg, len(line)))
+        f.write(line)
+    f.seek(0)
+    return f
+
+
+def _read_run(f: BinaryIO) -> Iterator[tuple[int, int, bytes]]:
+    while head := f.read(_RUN_RECORD.size):
+        rank, beg, length = _RUN_RECORD.unpack(head)
+        yield rank, beg, f.read(length)
+
+
+def sort_and_bgzip(src: str, dst: str, preset: Preset) -> None:
+    """
+    Write a BGZF copy of the text track ``src`` to ``dst`` with header lines
+    first and records grouped by sequence (in order of first appearance)
+    and sorted by start.  A GFF3 ``##FASTA`` section is dropped.
+    """
+    meta = preset.meta.encode()
+    header: list[bytes] = []
+    run:    list[tuple[int, int, bytes]] = []
+    runs:   list[BinaryIO] = []
+    run_bytes = 0
+    seq_order: dict[bytes, int] = {}
+
+    try:
+        with open(src, "rb") as f:
+            for line in f:
+                if line.startswith(b"##FASTA"):
+                    break
+                if not line.strip():
+                    continue
+                if not line.endswith(b"\n"):
+                    line += b"\n"
+                if line.startswith(meta) or line.startswith(_HEADER_PREFIXES):
+                    if not (run or runs):
+                        header.append(line)
+                    continue
+                fields = line.rstrip(b"\r\n").split(b"\t")
+                seq, beg, _ = _interval(fields, preset)
+                rank = seq_order.setdefault(seq, len(seq_order))
+                run.append((rank, beg, line))
+                run_bytes += len(line)
+                if run_bytes >= _SORT_RUN_BYTES:
+                    runs.append(_spill(run, os.path.dirname(os.path.abspath(dst))))
+                    run, run_bytes = [], 0
+
+        run.sort(key=_record_key)
+        # Ties keep file order: the sort is stable and merge() takes equal
+        # keys from earlier runs first
+        records = heapq.merge(*map(_read_run, runs), run, key=_record_key) \
+                  if runs else run
+        with open(dst, "wb") as out:
+            writer = BgzfWriter(out)
+            for line in header:
+                writer.write(line)
+            for _, _, line in records:
+                writer.write(line)
+            writer.close()
+    finally:
+        for f in runs:
+            f.close()
+
+
+# ── tabix ────────────────────────────────────────────────────────────────────
+
+_MIN_SHIFT = 14                         # 16 kb linear-index windows
+
+
+def _reg2bin(beg: int, end: int) -> int:
+    end -= 1
+    if beg >> 14 == end >> 14: return 4681 + (beg >> 14)
+    if beg >> 17 == end >> 17: return  585 + (beg >> 17)
+    if beg >> 20 == end >> 20: return   73 + (beg >> 20)
+    if beg >> 23 == end >> 23: return    9 + (beg >> 23)
+    if beg >> 26 == end >> 26: return    1 + (beg >> 26)
+    return 0
+
+
+class _RefIndex:
+    __slots__ = ("bins", "linear")
+
+    def __init__(self):
+        self.bins:   dict[int, list[list[int]]] = {}
+        self.linear: list[int] = []
+
+    def add(self, beg: int, end: int, vbeg: int, vend: int) -> None:
+        chunks = self.bins.setdefault(_reg2bin(beg, end), [])
+        if chunks and chunks[-1][1] == vbeg:
+            chunks[-1][1] = vend
+        else:
+            chunks.append([vbeg, vend])
+
+        first, last = beg >> _MIN_SHIFT, (end - 1) >> _MIN_SHIFT
+        if len(self.linear) <= last:
+            self.linear.extend([-1] * (last + 1 - len(self.linear)))
+        for w in range(first, last + 1):
+            if self.linear[w] < 0:
+                self.linear[w] = vbeg
+
+
+def _iter_lines(src: str):
+    """Yield ``(line, start_voffset, end_voffset)`` for each line of ``src``."""
+    pending, pending_start = b"", 0
+    with open(src, "rb") as f:
+        for coffset, data in iter_blocks(f):
+            pos = 0
+            while True:
+                nl = data.find(b"\n", pos)
+                if nl < 0:
+                    break
+                start = pending_start if pending else (coffset << 16) | pos
+                line  = pending + data[pos:nl]
+                pending = b""
+                end = nl + 1
+                yield line, start, (coffset << 16) | end
+                pos = end
+            if pos < len(data):
+                if not pending:
+                    pending_start = (coffset << 16) | pos
+                pending += data[pos:]
+    # A final line without a newline has no well-defined end offset in an
+    # index-aligned stream; sort_and_bgzip always terminates lines.
+
+
+def tabix_index(src: str, dst: str, preset: Preset) -> None:
+    """Write a tabix index of the sorted BGZF file ``src`` to ``dst``."""
+    meta  = preset.meta.encode()
+    names: list[bytes] = []
+    refs:  dict[bytes, _RefIndex] = {}
+    last: tuple[bytes, int] | None = None
+
+    for line, vbeg, vend in _iter_lines(src):
+        if not line or line.startswith(meta) or line.startswith(_HEADER_PREFIXES):
+            continue
+        seq, beg, end = _interval(line.rstrip(b"\r").split(b"\t"), preset)
+        if seq not in refs:
+            refs[seq] = _RefIndex()
+            names.append(seq)
+        elif last is not None and last[0] == seq and beg < last[1]:
+            raise ValueError(f"{src} is not sorted at {seq.decode()}:{beg + 1}")
+        last = (seq, beg)
+        refs[seq].add(beg, end, vbeg, vend)
+
+    out = io.BytesIO()
+    names_blob = b"".join(name + b"\0" for name in names)
+    out.write(b"TBI\1")
+    out.write(struct.pack("<8i", len(names), preset.fmt, preset.col_seq,
+                          preset.col_beg, preset.col_end, ord(preset.meta), 0,
+                          len(names_blob)))
+    out.write(names_blob)
+    for name in names:
+        ref = refs[name]
+        out.write(struct.pack("<i", len(ref.bins)))
+        for bin_id in sorted(ref.bins):
+            chunks = ref.bins[bin_id]
+            out.write(struct.pack("<Ii", bin_id, len(chunks)))
+            for vbeg, vend in chunks:
+                out.write(struct.pack("<QQ", vbeg, vend))
+        # Windows with no record starting in them inherit the previous offset
+        linear, prev = ref.linear, 0
+        for i, voffset in enumerate(linear):
+            if voffset < 0:
+                linear[i] = prev
+            else:
+                prev = voffset
+        out.write(struct.pack(f"<i{len(linear)}Q", len(linear), *linear))
+
+    with open(dst, "wb") as f:
+        writer = BgzfWriter(f)
+        writer.write(out.getvalue())
+        writer.close()
+
+
+# ── derived-artifact entry point ─────────────────────────────────────────────
+
+def preset_for(path: str) -> Preset | None:
+    lower = path.lower()
+    for ext, preset in PRESETS.items():
+        if lower.endswith(ext):
+            return preset
+    return None
+
+
+def _builders(path: str) -> tuple[os.stat_result, Callable, Callable]:
+    """``path``'s stat and the builds of its bgzipped copy and tabix index."""
+    preset = preset_for(path)
+    if preset is None:
+        raise ValueError(f"Don't know how to tabix-index {path}")
+    st = os.stat(path)
+
+    def build_gz(src: str, dst: str) -> None:
+        sort_and_bgzip(src, dst, preset)
+
+    def build_tbi(src: str, dst: str) -> None:
+        tabix_index(_artifacts.get_or_build(src, ".gz", build_gz, st), dst, preset)
+
+    return st, build_gz, build_tbi
+
+
+def indexed_copy(path: str) -> tuple[str, str]:
+    """
+    Return ``(bgzipped_path, tbi_path)`` for the plain-text track ``path``,
+    building both in the artifact store the first time this version of the
+    file is seen.
+    """
+    st, build_gz, build_tbi = _builders(path)
+    gz  = _artifacts.get_or_build(path, ".gz", build_gz, st)
+    tbi = _artifacts.get_or_build(path, ".gz.tbi", build_tbi, st)
+    return gz, tbi
+
+
+def built_indexed_copy(path: str) -> tuple[str, str] | None:
+    """
+    Return :func:`indexed_copy` of ``path`` if it has been built; otherwise
+    queue building it in the background and return ``None``.
+    """
+    st, build_gz, build_tbi = _builders(path)
+    gz  = _artifacts.lookup(path, st, ".gz")
+    tbi = _artifacts.lookup(path, st, ".gz.tbi")
+    if tbi is None:
+        _artifacts.build_in_background(path, ".gz.tbi", build_tbi, st)
+    elif gz is None:
+        _artifacts.build_in_background(path, ".gz", build_gz, st)
+    else:
+        return gz, tbi
+    return None
@@ -20,6 +20,8 @@ ref_index   = os.environ.get("SIGV_REF_INDEX", "")
 annotation  = os.environ.get("SIGV_ANNOTATION", "")
 init_locus  = os.environ.get("SIGV_LOCUS", "all")
 
+st_igv.configure_server(workers=int(os.environ.get("SIGV_SERVER_WORKERS", "1")))
+
 st.title(f"IGV — {Path(file_path).name}")
 
 # ── Sidebar ───────────────────────────────────────────────────────────────────
@@ -6,6 +6,8 @@ import subprocess
 import sys
 from pathlib import Path
 
+from . import _fasta
+
 _VIEWER = Path(__file__).parent / "_viewer_app.py"
 
 _FORMAT_DEFAULTS = {
@@ -16,21 +18,59 @@ _FORMAT_DEFAULTS = {
     ".bed":  "bed",
 }
 
-def main():
+_COMMANDS = ("view", "serve", "pin")
+
+
+def _parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="igv-streamlit",
         description="Quickly browse a genomic file in IGV via Streamlit.",
+        epilog="A bare FILE means 'view FILE'; for a file named like a "
+               "command, use 'view FILE' or '-- FILE'.",
     )
-    parser.add_argument("file", help="Path to BAM/CRAM/VCF/BED file")
-    parser.add_argument("--index",      help="Path to index file (auto-detected if omitted)")
-    parser.add_argument("--genome",     default="hg38",
-                        help="Built-in genome ID, e.g. hg38, hg19, mm10 (default: hg38)")
-    parser.add_argument("--ref",        help="Path or URL to reference FASTA (overrides --genome)")
-    parser.add_argument("--ref-index",  help="Path or URL to reference FASTA index (.fai)")
-    parser.add_argument("--annotation", help="Path or URL to annotation file (GFF/BED/GTF)")
-    parser.add_argument("--locus",      default="all", help="Initial locus (default: all)")
-    parser.add_argument("--port",       default="8501", help="Streamlit port (default: 8501)")
-    args = parser.parse_args()
+    commands = parser.add_subparsers(dest="command", metavar="{view,serve,pin}")
+    view = commands.add_parser("view", help="Browse a file (the default)")
+    view.add_argument("file", help="Path to BAM/CRAM/VCF/BED file")
+    view.add_argument("--index",      help="Path to index file (auto-detected if omitted)")
+    view.add_argument("--genome",     default="hg38",
+                      help="Built-in genome ID, e.g. hg38, hg19, mm10 (default: hg38)")
+    view.add_argument("--ref",        help="Path or URL to reference FASTA (overrides --genome)")
+    view.add_argument("--ref-index",  help="Path or URL to reference FASTA index (.fai)")
+    view.add_argument("--annotation", help="Path or URL to annotation file (GFF/BED/GTF)")
+    view.add_argument("--locus",      default="all", help="Initial locus (default: all)")
+    view.add_argument("--port",       default="8501", help="Streamlit port (default: 8501)")
+    view.add_argument("--server-workers", type=int, default=1,
+                      help="Processes serving the file's byte ranges (default: 1)")
+    # serve and pin parse their own arguments (and --help)
+    commands.add_parser("serve", add_help=False,
+                        help="Run a pre-forked file server by hand")
+    commands.add_parser("pin", add_help=False,
+                        help="Pin remote track regions for offline browsing")
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv[:1] == ["--"]:
+        argv = ["view", *argv[1:]]
+    elif argv and argv[0] not in _COMMANDS and argv[0] not in ("-h", "--help"):
+        argv = ["view", *argv]
+
+    parser = _parser()
+    args, rest = parser.parse_known_args(argv)
+    # Imported here, so viewing a file doesn't load the worker pool, the
+    # pinning code or numpy
+    if args.command == "serve":
+        from . import _prefork
+        _prefork.main(rest)
+        return
+    if args.command == "pin":
+        from . import _pin
+        sys.exit(_pin.main(rest))
+    if args.command is None:
+        parser.error("a file to view is required")
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
 
     file_path = str(Path(args.file).resolve())
     suffix = "".join(Path(args.file).suffixes).lower()
@@ -44,6 +84,14 @@ def main():
                 index_path = candidate
                 break
 
+    # Index a local reference so igv.js doesn't download the whole FASTA
+    ref_index = args.ref_index
+    if args.ref and not ref_index and Path(args.ref).is_file():
+        try:
+            ref_index = _fasta.fai_for(args.ref)
+        except (OSError, ValueError) as e:
+            print(f"igv-streamlit: not indexing {args.ref}: {e}", file=sys.stderr)
+
     env = {
         **os.environ,
         "SIGV_FILE":       file_path,
@@ -52,8 +100,9 @@ def main():
         "SIGV_LOCUS":      args.locus,
         "SIGV_INDEX":      index_path or "",
         "SIGV_REF":        args.ref or "",
-        "SIGV_REF_INDEX":  args.ref_index or "",
+        "SIGV_REF_INDEX":  ref_index or "",
         "SIGV_ANNOTATION": args.annotation or "",
+        "SIGV_SERVER_WORKERS": str(args.server_workers),
     }
 
     subprocess.run(
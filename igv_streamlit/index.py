@@ -0,0 +1,619 @@
+# igv_streamlit/index.py
+
+"""
+Readers for the indexes of alignment, feature and reference files -- BAI,
+CSI, tabix, CRAI and FASTA ``.fai`` -- and for the reference names in BAM
+and CRAM headers.  Together they tell which byte ranges of a file igv.js
+reads to show a region, following the SAMtools specifications
+(https://samtools.github.io/hts-specs/).
+
+An index is parsed into NumPy arrays, and :func:`byte_ranges` answers any
+number of regions in one vectorized call:
+
+>>> from igv_streamlit import index
+>>> bai = index.load_index("sample.bam.bai")      # names from sample.bam
+>>> index.byte_ranges(bai, "chr1", 1_000_000, 1_100_000)  # rows of start, end
+>>> index.byte_ranges(bai, chroms, starts, ends)  # rows of region, start, end
+
+Regions are 0-based and half-open; byte ranges are ``[start, end)`` of the
+data file, and run ``_TAIL`` bytes past the last offset the index gives,
+so they hold the whole BGZF block or CRAM container starting there.
+"""
+
+from __future__ import annotations
+
+import bz2
+import gzip
+import lzma
+import os
+import struct
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import numpy as np
+
+from . import _bgzf
+
+# Bytes read past the last offset an index gives for a range: BGZF blocks
+# and CRAM container headers that start there are at most this long
+_TAIL = 0x10000
+
+# Parsed indexes kept by load_index, most recently used last
+_CACHE_SIZE = 16
+
+
+def _expand(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """``concatenate([arange(s, s + n) for s, n in zip(starts, counts)])``."""
+    total = int(counts.sum())
+    if not total:
+        return np.zeros(0, np.int64)
+    skip = np.cumsum(counts) - counts
+    return np.arange(total) + np.repeat(starts - skip, counts)
+
+
+def _merge(region: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    Overlapping or touching ``[start, end)`` ranges of each region merged,
+    as rows of ``(region, start, end)`` sorted by region and start.
+    """
+    if not len(start):
+        return np.zeros((0, 3), np.int64)
+    order = np.lexsort((start, region))
+    region, start, end = region[order], start[order], end[order]
+    # A running maximum of the ends that restarts at each region: ranks of
+    # the offsets are small enough to lift each region's above the last's
+    values, ranks = np.unique(np.concatenate([start, end]), return_inverse=True)
+    lift  = region * len(values)
+    reach = np.maximum.accumulate(ranks[len(start):] + lift)
+    first = np.ones(len(start), bool)
+    first[1:] = (region[1:] != region[:-1]) | \
+        (ranks[1:len(start)] + lift[1:] > reach[:-1])
+    at = np.flatnonzero(first)
+    return np.column_stack([region[at], start[at], np.maximum.reduceat(end, at)])
+
+
+def merge_ranges(ranges) -> np.ndarray:
+    """Rows of ``(start, end)`` sorted, with overlapping or touching ones merged."""
+    ranges = np.asarray(ranges, np.int64).reshape(-1, 2)
+    return _merge(np.zeros(len(ranges), np.int64), ranges[:, 0], ranges[:, 1])[:, 1:]
+
+
+class _Index(ABC):
+    """What every index has: reference ``names`` (by id) and a query."""
+
+    kind = ""
+
+    def __init__(self, names: list[str] | None):
+        self.names = names
+        self._ids  = {name: ref for ref, name in enumerate(names or ())}
+
+    def ref_ids(self, chroms: np.ndarray) -> np.ndarray:
+        """Reference ids of ``chroms`` (names or ids); -1 for unknown names."""
+        if chroms.dtype.kind in "iu":
+            return chroms.astype(np.int64)
+        if self.names is None:
+            raise ValueError(f"{self.kind.upper()} index without reference names: "
+                             f"give ids, or the names from the file's header")
+        return np.array([self._ids.get(str(chrom), -1) for chrom in chroms],
+                        np.int64)
+
+    @abstractmethod
+    def query(self, refs: np.ndarray, begs: np.ndarray,
+              ends: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The unmerged byte ranges of every region, as arrays of region
+        number, start and end.
+        """
+
+
+# ── BAI, CSI and tabix ───────────────────────────────────────────────────────
+
+class BinningIndex(_Index):
+    """
+    A BAI, CSI or tabix index.  Chunks of every bin of every reference are
+    rows of ``keys`` (``ref << 32 | bin``, sorted) and ``beg``/``end``
+    (virtual offsets), so the chunks of a run of bins are a slice.  BAI and
+    tabix have the linear index of each reference in ``linear``, from
+    ``linear_start[ref]``; CSI has the ``loffset`` of each of its
+    ``bin_keys`` instead.
+    """
+
+    def __init__(self, kind: str, min_shift: int, depth: int,
+                 keys: np.ndarray, beg: np.ndarray, end: np.ndarray,
+                 n_refs: int, names: list[str] | None = None,
+                 linear: np.ndarray | None = None,
+                 linear_start: np.ndarray | None = None,
+                 bin_keys: np.ndarray | None = None,
+                 loffsets: np.ndarray | None = None):
+        super().__init__(names)
+        self.kind      = kind
+        self.min_shift = min_shift
+        self.depth     = depth
+        self.keys, self.beg, self.end = keys, beg, end
+        self.n_refs    = n_refs
+        self.linear, self.linear_start = linear, linear_start
+        self.bin_keys, self.loffsets   = bin_keys, loffsets
+        levels = np.arange(depth + 1)
+        self._first = ((1 << 3 * levels) - 1) // 7          # first bin of each level
+        self._shift = min_shift + 3 * (depth - levels)
+
+    def first_offset(self) -> int:
+        """File offset of the first indexed record: where the header ends."""
+        return int(self.beg.min() >> 16) if len(self.beg) else 0
+
+    def header_end(self) -> int:
+        """End of the byte range ``[0, end)`` that holds the whole header."""
+        return self.first_offset() + _TAIL
+
+    def _floor(self, refs: np.ndarray, begs: np.ndarray) -> np.ndarray:
+        # Chunks ending before the first record overlapping beg can't overlap
+        if self.linear is not None:
+            if not len(self.linear):
+                return np.zeros(len(refs), np.int64)
+            first = self.linear_start[refs]
+            n     = self.linear_start[refs + 1] - first
+            at    = np.clip(first + np.minimum(begs >> self.min_shift, n - 1),
+                            0, len(self.linear) - 1)
+            return np.where(n > 0, self.linear[at], 0)
+        # CSI: the loffset of the smallest bin holding beg
+        floor = np.zeros(len(refs), np.int64)
+        unset = np.ones(len(refs), bool)
+        for first, shift in zip(self._first[::-1], self._shift[::-1]):
+            key = (refs << 32) + first + (begs >> shift)
+            at  = np.minimum(np.searchsorted(self.bin_keys, key),
+                             len(self.bin_keys) - 1)
+            hit = unset & (self.bin_keys[at] == key) if len(self.bin_keys) else \
+                np.zeros(len(refs), bool)
+            floor[hit] = self.loffsets[at[hit]]
+            unset &= ~hit
+        return floor
+
+    def query(self, refs, begs, ends):
+        limit  = 1 << (self.min_shift + 3 * self.depth)
+        begs   = np.clip(begs, 0, limit - 1)
+        ends   = np.clip(ends, 1, limit)
+        region = np.flatnonzero((refs >= 0) & (refs < self.n_refs) & (begs < ends))
+        refs, begs, ends = refs[region], begs[region], ends[region] - 1
+
+        # Per region and level, its bins are a run of keys, their chunks a slice
+        base = (refs << 32)[:, None] + self._first
+        lo = np.searchsorted(self.keys, base + (begs[:, None] >> self._shift))
+        hi = np.searchsorted(self.keys, base + (ends[:, None] >> self._shift),
+                             side="right")
+        counts = (hi - lo).ravel()
+        rows   = _expand(lo.ravel(), counts)
+        owner  = np.repeat(np.arange(len(region)).repeat(self.depth + 1), counts)
+
+        keep  = self.end[rows] > self._floor(refs, begs)[owner]
+        rows  = rows[keep]
+        return (region[owner[keep]], self.beg[rows] >> 16,
+                (self.end[rows] >> 16) + _TAIL)
+
+
+def _pseudo_bin(depth: int) -> int:
+    """The bin holding per-reference metadata, not chunks."""
+    return ((1 << 3 * (depth + 1)) - 1) // 7 + 1
+
+
+def _read_bins(data: bytes, pos: int, n_ref: int, depth: int,
+               csi: bool) -> tuple[dict, int]:
+    """
+    The bins and chunks of ``n_ref`` references from ``pos``, as keyword
+    arguments of :class:`BinningIndex`, and where they end.  Bins are read
+    one by one, their chunks gathered in one go.
+    """
+    pseudo = _pseudo_bin(depth)
+    keys, loffsets, at, n_chunks = [], [], [], []
+    linear, linear_start = [], [0]
+    for ref in range(n_ref):
+        (n_bin,) = struct.unpack_from("<i", data, pos)
+        pos += 4
+        for _ in range(n_bin):
+            if csi:
+                bin_id, loffset, n_chunk = struct.unpack_from("<IQi", data, pos)
+                pos += 16
+            else:
+                bin_id, n_chunk = struct.unpack_from("<Ii", data, pos)
+                loffset = 0
+                pos += 8
+            if bin_id != pseudo:
+                keys.append(ref << 32 | bin_id)
+                loffsets.append(loffset)
+                at.append(pos)
+                n_chunks.append(n_chunk)
+            pos += 16 * n_chunk
+        if not csi:
+            (n_intv,) = struct.unpack_from("<i", data, pos)
+            pos += 4
+            linear.append(np.frombuffer(data, "<u8", n_intv, pos))
+            linear_start.append(linear_start[-1] + n_intv)
+            pos += 8 * n_intv
+
+    counts = np.array(n_chunks, np.int64)
+    starts = np.repeat(np.array(at, np.int64), counts) + \
+        16 * (_expand(np.zeros(len(counts), np.int64), counts))
+    raw    = np.frombuffer(data, np.uint8)
+    pairs  = raw[starts[:, None] + np.arange(16)].view("<u8").astype(np.int64) \
+        if len(starts) else np.zeros((0, 2), np.int64)
+    chunk_keys = np.repeat(np.array(keys, np.int64), counts)
+    order = np.argsort(chunk_keys, kind="stable")
+    bin_keys = np.array(keys, np.int64)
+    bin_order = np.argsort(bin_keys)
+    found = {"keys": chunk_keys[order], "beg": pairs[order, 0],
+             "end": pairs[order, 1], "n_refs": n_ref}
+    if csi:
+        found["bin_keys"] = bin_keys[bin_order]
+        found["loffsets"] = np.array(loffsets, np.int64)[bin_order]
+    else:
+        found["linear"] = np.concatenate(linear).astype(np.int64) if linear \
+            else np.zeros(0, np.int64)
+        found["linear_start"] = np.array(linear_start, np.int64)
+    return found, pos
+
+
+def _tabix_names(data: bytes, pos: int) -> tuple[list[str], int]:
+    """The sequence names of a tabix header at ``pos``, and where they end."""
+    (l_nm,) = struct.unpack_from("<i", data, pos + 24)
+    names = data[pos + 28:pos + 28 + l_nm].split(b"\0")
+    return [name.decode() for name in names if name], pos + 28 + l_nm
+
+
+def _read_bai(data: bytes, names: list[str] | None) -> BinningIndex:
+    (n_ref,) = struct.unpack_from("<i", data, 4)
+    found, _ = _read_bins(data, 8, n_ref, 5, csi=False)
+    return BinningIndex("bai", 14, 5, names=names, **found)
+
+
+def _read_tbi(data: bytes) -> BinningIndex:
+    (n_ref,) = struct.unpack_from("<i", data, 4)
+    names, pos = _tabix_names(data, 8)
+    found, _ = _read_bins(data, pos, n_ref, 5, csi=False)
+    return BinningIndex("tbi", 14, 5, names=names[:n_ref], **found)
+
+
+def _read_csi(data: bytes, names: list[str] | None) -> BinningIndex:
+    min_shift, depth, l_aux = struct.unpack_from("<3i", data, 4)
+    # Tabix's header as auxiliary data names the sequences
+    if l_aux >= 28:
+        names = _tabix_names(data, 16)[0]
+    (n_ref,) = struct.unpack_from("<i", data, 16 + l_aux)
+    found, _ = _read_bins(data, 20 + l_aux, n_ref, depth, csi=True)
+    return BinningIndex("csi", min_shift, depth, names=names, **found)
+
+
+# ── CRAI ─────────────────────────────────────────────────────────────────────
+
+class CramIndex(_Index):
+    """
+    A CRAI index: one row per slice of ``slices``, ``(ref, alignment start,
+    span, container offset, slice offset, slice length)``, sorted by
+    reference and start.
+    """
+
+    kind = "crai"
+
+    def __init__(self, slices: np.ndarray, names: list[str] | None = None):
+        super().__init__(names)
+        self.slices = slices[np.lexsort((slices[:, 1], slices[:, 0]))]
+        refs = self.slices[:, 0] + 2                          # unmapped: -1
+        self._keys = refs << 32 | np.clip(self.slices[:, 1], 0, 0xFFFFFFFF)
+        self._max_span = np.zeros(int(refs.max(initial=0)) + 1, np.int64)
+        np.maximum.at(self._max_span, refs, self.slices[:, 2])
+
+    def query(self, refs, begs, ends):
+        region = np.flatnonzero((refs >= 0) & (refs + 2 < len(self._max_span)) &
+                                (begs < ends))
+        refs, begs, ends = refs[region], begs[region], ends[region]
+        base = (refs + 2) << 32
+        # Slices starting (1-based) after end can't overlap, nor can those
+        # starting so far before beg that even the longest ends before it
+        lo = np.searchsorted(self._keys, base + np.clip(
+            begs - self._max_span[refs + 2] + 1, 0, 0xFFFFFFFF))
+        hi = np.searchsorted(self._keys, base + np.minimum(ends, 0xFFFFFFFF),
+                             side="right")
+        rows  = _expand(lo, hi - lo)
+        owner = np.repeat(np.arange(len(region)), hi - lo)
+        ref, start, span, container, offset, length = self.slices[rows].T
+        keep  = (start - 1 + span > begs[owner]) & (ref == refs[owner])
+        # Slice offsets count from the end of the container header
+        return (region[owner[keep]], container[keep],
+                (container + offset + length)[keep] + _TAIL)
+
+
+def _read_crai(text: bytes, names: list[str] | None) -> CramIndex:
+    rows = [fields for fields in (line.split() for line in text.splitlines())
+            if len(fields) == 6]
+    slices = np.array(rows, np.bytes_).astype(np.int64) if rows \
+        else np.zeros((0, 6), np.int64)
+    return CramIndex(slices, names)
+
+
+# ── FASTA ────────────────────────────────────────────────────────────────────
+
+class FastaIndex(_Index):
+    """
+    A ``.fai``: for each sequence, its ``length``, ``offset`` and line
+    layout (``line_bases``, ``line_width``).
+    """
+
+    kind = "fai"
+
+    def __init__(self, names: list[str], table: np.ndarray):
+        super().__init__(names)
+        self.length, self.offset, self.line_bases, self.line_width = \
+            table.reshape(-1, 4).T
+
+    def query(self, refs, begs, ends):
+        known = (refs >= 0) & (refs < len(self.length))
+        refs  = np.where(known, refs, 0)
+        begs  = np.maximum(begs, 0)
+        ends  = np.minimum(ends, self.length[refs]) if len(self.length) else ends
+        region = np.flatnonzero(known & (begs < ends))
+        refs, begs, ends = refs[region], begs[region], ends[region]
+        bases, width = self.line_bases[refs], self.line_width[refs]
+
+        def at(pos: np.ndarray) -> np.ndarray:
+            return self.offset[refs] + pos // bases * width + pos % bases
+
+        return region, at(begs), at(ends - 1) + 1
+
+
+def _read_fai(text: bytes) -> FastaIndex:
+    names, table = [], []
+    for line in text.decode().splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 5:
+            names.append(fields[0])
+            table.append(fields[1:5])
+    return FastaIndex(names, np.array(table, np.int64).reshape(-1, 4))
+
+
+# ── loading and queries ──────────────────────────────────────────────────────
+
+def read_index(data: bytes, names: list[str] | None = None) -> _Index:
+    """
+    Parse an index from its bytes, telling BAI, CSI, tabix, CRAI (plain or
+    gzipped) and ``.fai`` apart by their contents.
+
+    Parameters
+    ----------
+    data : bytes
+        The whole index file.
+    names : list of str, optional
+        Reference names by id, from the header of the BAM or CRAM file:
+        BAI, CRAI and most CSI indexes don't name references themselves.
+
+    Returns
+    -------
+    BinningIndex, CramIndex or FastaIndex
+    """
+    if data[:4] == b"BAI\1":
+        return _read_bai(data, names)
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+        if data[:4] == b"TBI\1":
+            return _read_tbi(data)
+        if data[:4] == b"CSI\1":
+            return _read_csi(data, names)
+        return _read_crai(data, names)
+    first = data.split(b"\n", 1)[0].split()
+    if len(first) == 6 and all(field.lstrip(b"-").isdigit() for field in first):
+        return _read_crai(data, names)
+    if b"\t" in data[:4096]:
+        return _read_fai(data)
+    raise ValueError("not a BAI, CSI, tabix, CRAI or FASTA index")
+
+
+_cache: OrderedDict[tuple, _Index] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_index(path: str, names: list[str] | None = None) -> _Index:
+    """
+    Parse the index at ``path``, or return it as parsed before if the file
+    is unchanged (same inode, size and mtime).
+
+    Without ``names``, a BAI, CSI or CRAI next to its BAM or CRAM file
+    (``x.bam.bai`` or ``x.bai`` by ``x.bam``) takes them from its header.
+    See :func:`read_index`.
+    """
+    st  = os.stat(path)
+    key = (os.path.abspath(path), st.st_dev, st.st_ino, st.st_size,
+           st.st_mtime_ns, tuple(names) if names else None)
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+    with open(path, "rb") as f:
+        data = f.read()
+    index = read_index(data, names)
+    if index.names is None:
+        data_file = _data_file(path)
+        if data_file is not None:
+            index = read_index(data, _read_names(data_file))
+    with _cache_lock:
+        _cache[key] = index
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def byte_ranges(index: _Index, chrom, start, end, *,
+                union: bool = False) -> np.ndarray:
+    """
+    The byte ranges of the data file holding regions, in one call for any
+    number of them.
+
+    Parameters
+    ----------
+    index : BinningIndex, CramIndex or FastaIndex
+        From :func:`load_index` or :func:`read_index`.
+    chrom : str, int or array-like
+        Reference names, or ids.  Unknown names have no ranges.
+    start, end : int or array-like
+        0-based, half-open coordinates; broadcast against ``chrom``.
+    union : bool, optional
+        Merge the ranges of all regions into one list.
+
+    Returns
+    -------
+    numpy.ndarray
+        For a single region, or with ``union``, rows of ``(start, end)``,
+        sorted and merged.  Otherwise rows of ``(region, start, end)``:
+        the ranges of each region (its position in the arrays), merged and
+        sorted by region and start.
+    """
+    single = not union and all(np.ndim(x) == 0 for x in (chrom, start, end))
+    chroms, starts, ends = np.broadcast_arrays(
+        np.atleast_1d(chrom), np.atleast_1d(start), np.atleast_1d(end))
+    region, lo, hi = index.query(index.ref_ids(chroms), starts.astype(np.int64),
+                                 ends.astype(np.int64))
+    if single or union:
+        return _merge(np.zeros(len(lo), np.int64), lo, hi)[:, 1:]
+    return _merge(region, lo, hi)
+
+
+# ── reference names from file headers ────────────────────────────────────────
+
+def _data_file(path: str) -> str | None:
+    """The BAM or CRAM file an index at ``path`` is next to, if any."""
+    root, ext = os.path.splitext(path)
+    for candidate in (root, root + {".bai": ".bam", ".csi": ".bam",
+                                    ".crai": ".cram"}.get(ext, "")):
+        if candidate.endswith((".bam", ".cram")) and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _read_names(path: str) -> list[str] | None:
+    """Reference names from the header of the BAM or CRAM file at ``path``."""
+    parse = cram_references if path.endswith(".cram") else bam_references
+    n = 0x10000
+    with open(path, "rb") as f:
+        while True:
+            data  = os.pread(f.fileno(), n, 0)
+            found = parse(data)
+            if found is not None:
+                return found[0]
+            if len(data) < n:
+                return None
+            n *= 4
+
+
+def bam_references(data: bytes) -> tuple[list[str], int] | None:
+    """
+    Reference names from the header at the start of a BAM file, and the
+    file offset of the BGZF block after the header; ``None`` if ``data``
+    ends before the header does.
+    """
+    text = bytearray()
+    for end, block in _bgzf.complete_blocks(data):
+        text += block
+        names = _bam_names(text)
+        if names is not None:
+            return names, end
+    return None
+
+
+def _bam_names(text: bytes) -> list[str] | None:
+    if len(text) < 12:
+        return None
+    if text[:4] != b"BAM\1":
+        raise ValueError("not a BAM file")
+    pos = 8 + struct.unpack_from("<i", text, 4)[0]
+    if pos + 4 > len(text):
+        return None
+    (n_ref,) = struct.unpack_from("<i", text, pos)
+    pos += 4
+    names = []
+    for _ in range(n_ref):
+        if pos + 4 > len(text):
+            return None
+        (l_name,) = struct.unpack_from("<i", text, pos)
+        if pos + 8 + l_name > len(text):
+            return None
+        names.append(text[pos + 4:pos + 3 + l_name].decode())
+        pos += 8 + l_name
+    return names
+
+
+def _itf8(data: bytes, pos: int) -> tuple[int, int]:
+    """CRAM's variable-length int32 at ``pos``, and the position after it."""
+    b0 = data[pos]
+    if b0 < 0x80:
+        return b0, pos + 1
+    if b0 < 0xC0:
+        return (b0 & 0x3F) << 8 | data[pos + 1], pos + 2
+    if b0 < 0xE0:
+        return (b0 & 0x1F) << 16 | int.from_bytes(data[pos + 1:pos + 3], "big"), pos + 3
+    if b0 < 0xF0:
+        return (b0 & 0x0F) << 24 | int.from_bytes(data[pos + 1:pos + 4], "big"), pos + 4
+    value = (b0 & 0x0F) << 28 | int.from_bytes(data[pos + 1:pos + 4], "big") << 4 \
+        | data[pos + 4] & 0x0F
+    return value - (1 << 32) if value & 0x80000000 else value, pos + 5
+
+
+def _ltf8(data: bytes, pos: int) -> tuple[int, int]:
+    """CRAM's variable-length int64 at ``pos``, and the position after it."""
+    b0, more = data[pos], 0
+    while more < 8 and b0 & (0x80 >> more):
+        more += 1
+    value = b0 & (0xFF >> (more + 1)) if more < 8 else 0
+    return (value << 8 * more | int.from_bytes(data[pos + 1:pos + 1 + more], "big"),
+            pos + 1 + more)
+
+
+_CRAM_CODECS = {0: bytes, 1: gzip.decompress, 2: bz2.decompress, 3: lzma.decompress}
+
+
+def cram_references(data: bytes) -> tuple[list[str], int] | None:
+    """
+    Reference names from the header container at the start of a CRAM file,
+    and the file offset where that container ends; ``None`` if ``data``
+    ends before it does.
+    """
+    if data[:4] != b"CRAM":
+        raise ValueError("not a CRAM file")
+    major = data[4]
+    if major < 2:
+        raise ValueError(f"CRAM {major}.x is not supported")
+    pos   = 26                          # past the file definition
+    if len(data) < pos + 64:
+        return None
+    try:
+        (length,) = struct.unpack_from("<i", data, pos)
+        pos += 4
+        for _ in range(4):              # reference, start, span, records
+            _, pos = _itf8(data, pos)
+        # Record counter (itf8 before 3.0), bases
+        _, pos = _ltf8(data, pos) if major >= 3 else _itf8(data, pos)
+        _, pos = _ltf8(data, pos)
+        _, pos = _itf8(data, pos)       # blocks
+        n_landmarks, pos = _itf8(data, pos)
+        for _ in range(n_landmarks):
+            _, pos = _itf8(data, pos)
+    except IndexError:
+        return None
+    if major >= 3:
+        pos += 4                        # CRC32
+    end = pos + length
+    if end > len(data):
+        return None
+
+    method = data[pos]
+    _, block = _itf8(data, pos + 2)     # past method and content type
+    size, block = _itf8(data, block)
+    _, block = _itf8(data, block)       # uncompressed size
+    if method not in _CRAM_CODECS:
+        raise ValueError(f"CRAM header compressed with unsupported method {method}")
+    header = _CRAM_CODECS[method](data[block:block + size])
+    (l_text,) = struct.unpack_from("<i", header, 0)
+    names = []
+    for line in header[4:4 + l_text].decode().splitlines():
+        if line.startswith("@SQ"):
+            for field in line.split("\t")[1:]:
+                if field.startswith("SN:"):
+                    names.append(field[3:])
+    return names, end
@@ -12,23 +12,89 @@ For cloud deployments, use remote URLs (url/indexURL) instead of local paths.
 
 from __future__ import annotations
 
+import asyncio
+import errno
+import hashlib
+import heapq
+import hmac
+import itertools
 import logging
 import mimetypes
 import os
+import queue
+import selectors
 import socket
+import ssl
+import stat
 import threading
+import time
 import uuid
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import TYPE_CHECKING
+from urllib.parse import quote, unquote, urlsplit
+
+from . import _artifacts, _compression
+
+if TYPE_CHECKING:
+    from . import _prefork
+    from ._aioserver import AsyncFileServer
 
 logger = logging.getLogger(__name__)
 
-_file_registry: dict[str, str] = {}
+_file_registry: dict[str, _FileRecord] = {}
+_path_tokens:   dict[str, str] = {}      # reverse index: absolute path -> token
 _registry_lock  = threading.Lock()
 
-_standalone_server: ThreadingHTTPServer | None = None
+# Remote files served through the caching proxy (see igv_streamlit._proxy):
+# token -> the file's URLs (its mirrors, best known first), and the reverse
+# index.
+_remote_registry: dict[str, tuple[str, ...]] = {}
+_url_tokens:      dict[tuple[str, ...], str] = {}
+
+_standalone_server: _PooledHTTPServer | AsyncFileServer | _prefork.WorkerPool | None = None
 _standalone_thread: threading.Thread    | None = None
 _standalone_port:   int | None = None
 
+# Fixed port for the file server (None = any free port) and whether tokens
+# are derived from each file's path, size and mtime instead of being random.
+# Together they keep URLs stable across restarts, so browser caches hit.
+_fixed_port:    int | None = None
+_stable_tokens: bool = False
+_token_key:     bytes | None = None
+
+# Serve files from Streamlit's own server (same origin as the app) instead
+# of the standalone one, when running under ``streamlit run``.
+_same_origin = False
+
+# Whether remote url/indexURL/fastaURL are served through the caching proxy,
+# and how many bytes of them it keeps on disk.
+_proxy_remote     = False
+_proxy_cache_size = 1024 * 1024 * 1024
+# Percentile of a mirror's recent response times after which the same range
+# is asked of the next mirror too (0 asks every mirror at once).
+_hedge_percentile = 95.0
+
+# Plain-text tracks (GFF/GTF/BED/VCF) at least this big are bgzipped and
+# tabix-indexed before being served (see igv_streamlit._tabix).
+_auto_index          = True
+_auto_index_min_size = 2 * 1024 * 1024
+
+# Worker processes serving files (see igv_streamlit._prefork); 1 serves them
+# from this process.  With several, tokens registered here are appended to
+# _registry_log, and a worker catches up from _registry_file on a miss.
+_workers = 1
+_registry_log:  _prefork.RegistryLog    | None = None
+_registry_file: _prefork.RegistryReader | None = None
+
+# "threading": _PooledHTTPServer, a bounded pool of OS threads.
+# "asyncio":   _aioserver.AsyncFileServer, every connection on one event loop.
+_ENGINES = ("threading", "asyncio")
+_engine  = "threading"
+
 _EXTRA_TYPES = {
     ".bam": "application/octet-stream", ".bai": "application/octet-stream",
     ".cram":"application/octet-stream", ".crai":"application/octet-stream",
@@ -39,6 +105,55 @@ _EXTRA_TYPES = {
     ".fai": "text/plain", ".gz":  "application/gzip",
 }
 
+_CHUNK_SIZE = 65536
+
+# Seconds an idle keep-alive connection is kept before the server closes it,
+# a new connection may take to send its first request head, and a response
+# write may stall before the client is given up on.
+_KEEPALIVE_TIMEOUT = 30.0
+_READ_TIMEOUT      = 30.0
+_WRITE_TIMEOUT     = 60.0
+
+# Connections served at once (threaded engine: worker threads) and accepted
+# connections allowed to wait for one.  Past both, clients get a 503 with
+# Retry-After.  The asyncio engine serves up to both at once.
+_max_workers = 64
+_max_queue   = 1024
+_RETRY_AFTER = 1
+
+# os.sendfile moves bytes from the page cache straight into the socket; the
+# read/write loop is only used where it is unavailable (e.g. Windows) or the
+# socket/file rejects it.  Module-level so it can be switched off for testing.
+_USE_SENDFILE = hasattr(os, "sendfile")
+
+# errno values meaning "this fd pair can't do sendfile", not "the client left"
+_SENDFILE_UNSUPPORTED = {
+    errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK,
+    getattr(errno, "EOPNOTSUPP", errno.EINVAL),
+    getattr(errno, "ENOTSUP",    errno.EINVAL),
+}
+
+# Cache-Control for file responses, by extension ("" = everything else).
+# Indexes, reference sequence and annotation are re-fetched every time a
+# rerun recreates the browser, so the browser may reuse them for a while;
+# bulk alignment data is always revalidated (a cheap 304 when unchanged).
+_CACHE_CONTROL: dict[str, str] = {
+    ".bai":  "max-age=300", ".crai": "max-age=300", ".csi":   "max-age=300",
+    ".tbi":  "max-age=300", ".fai":  "max-age=300", ".fasta": "max-age=300",
+    ".fa":   "max-age=300", ".gff":  "max-age=300", ".gff3":  "max-age=300",
+    ".gtf":  "max-age=300", ".bed":  "max-age=300",
+    "":      "no-cache",
+}
+
+# Content-addressed URLs never change meaning, so they can be cached forever
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _get_cache_control(path: str) -> str:
+    for ext in sorted(_CACHE_CONTROL, key=len, reverse=True):
+        if path.endswith(ext):
+            return _CACHE_CONTROL[ext]
+    return "no-cache"
+
 def _get_mime(path: str) -> str:
     for ext, mime in _EXTRA_TYPES.items():
         if path.endswith(ext):
@@ -47,111 +162,2049 @@ def _get_mime(path: str) -> str:
     return guessed or "application/octet-stream"
 
 
+def _sendfile(sock: socket.socket, fd: int, offset: int, count: int) -> int:
+    """
+    Send ``count`` bytes of ``fd`` from ``offset`` with ``os.sendfile``.
+
+    Returns the number of bytes sent, which is short of ``count`` if the
+    socket or file turns out not to support sendfile; the caller copies the
+    rest by hand.
+    """
+    out_fd  = sock.fileno()
+    sent    = 0
+    while sent < count:
+        try:
+            n = os.sendfile(out_fd, fd, offset + sent, count - sent)
+        except BlockingIOError:
+            # Sockets with a timeout are non-blocking under the hood
+            _wait_writable(sock)
+            continue
+        except OSError as e:
+            if e.errno in _SENDFILE_UNSUPPORTED:
+                break
+            raise
+        if n == 0:              # file shorter than expected (truncated)
+            break
+        sent += n
+    return sent
+
+
+def _wait_writable(sock: socket.socket) -> None:
+    with selectors.DefaultSelector() as sel:
+        sel.register(sock.fileno(), selectors.EVENT_WRITE)
+        if not sel.select(sock.gettimeout()):
+            raise TimeoutError("timed out sending file")
+
+
+if hasattr(os, "pread"):
+    _pread = os.pread
+else:                                   # Windows
+    _seek_lock = threading.Lock()
+
+    def _pread(fd: int, n: int, offset: int) -> bytes:
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, n)
+
+
+# ── registry records ─────────────────────────────────────────────────────────
+
+# A pooled descriptor is trusted for this long before the path is stat'ed
+# again to see whether the file was replaced.
+_RESTAT_INTERVAL = 1.0
+
+
+class _FileRecord:
+    """
+    A registered file: its path, what it is served as, and the identity it
+    had when last checked.
+
+    Everything derived from the path is worked out once at registration, so
+    the request path does no string scans, and the stat behind the staleness
+    check is skipped while the last one is less than ``_RESTAT_INTERVAL`` old.
+    """
+
+    __slots__ = ("path", "mime", "cache_control", "pinned", "version",
+                 "dev", "ino", "size", "mtime_ns", "checked")
+
+    def __init__(self, path: str, st: os.stat_result, stable: bool = False):
+        self.path    = path
+        self.mime    = _get_mime(path)
+        self.pinned  = path.endswith(_PINNED_SUFFIXES)
+        # (size, mtime) a content-addressed token was derived from; None
+        # for random tokens, which follow the file as it changes
+        self.version = (st.st_size, st.st_mtime_ns) if stable else None
+        self.cache_control = _IMMUTABLE_CACHE_CONTROL if stable \
+                             else _get_cache_control(path)
+        self.update(st)
+
+    def update(self, st: os.stat_result) -> None:
+        self.dev      = st.st_dev
+        self.ino      = st.st_ino
+        self.size     = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.checked  = time.monotonic()
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.checked < _RESTAT_INTERVAL
+
+
+# ── pooled file descriptors ──────────────────────────────────────────────────
+
+class _OpenFile:
+    """An open descriptor plus the path and identity of the file it was opened on."""
+
+    __slots__ = ("fd", "path", "st", "dev", "ino", "size", "mtime_ns", "etag",
+                 "last_modified", "refs", "evicted")
+
+    def __init__(self, fd: int, st: os.stat_result, path: str):
+        self.fd       = fd
+        self.path     = path
+        self.st       = st
+        self.dev      = st.st_dev
+        self.ino      = st.st_ino
+        self.size     = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        # Strong validators: any change of inode, size or mtime changes them
+        self.etag          = f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.refs     = 0
+        self.evicted  = False
+
+    def matches(self, st: os.stat_result) -> bool:
+        return (self.ino, self.dev, self.size, self.mtime_ns) == \
+               (st.st_ino, st.st_dev, st.st_size, st.st_mtime_ns)
+
+    def released(self, refs: int) -> None:
+        """Called by :meth:`_FilePool.release` with the references left."""
+
+
+class _FilePool:
+    """
+    Bounded LRU pool of read-only descriptors, keyed by registry token.
+
+    Handles are reference-counted: :meth:`acquire` hands one out, and every
+    acquire must be paired with :meth:`release`.  A descriptor that is evicted
+    (LRU overflow, or the file at its path was replaced) is closed once the
+    last request using it releases it.  All reads go through ``os.pread`` /
+    ``os.sendfile`` with explicit offsets, so any number of threads can share
+    a descriptor without seeking.
+    """
+
+    def __init__(self, max_open: int = 64):
+        self.max_open = max_open
+        self._lock    = threading.Lock()
+        self._handles: OrderedDict[str, _OpenFile] = OrderedDict()
+
+    def acquire(self, token: str, path: str,
+                record: _FileRecord | None = None) -> _OpenFile:
+        """
+        Return an open handle for ``path``, reopening it if the file at
+        ``path`` is no longer the one the pooled descriptor points at
+        (different inode, size or mtime).
+
+        With a ``record`` that was checked recently, the pooled descriptor
+        is reused without a ``stat``; otherwise the record is refreshed.
+
+        Raises ``FileNotFoundError`` if ``path`` is not a regular file.
+        """
+        if record is not None and record.is_fresh():
+            with self._lock:
+                handle = self._handles.get(token)
+                if handle is not None and \
+                        (handle.ino, handle.dev, handle.size, handle.mtime_ns) == \
+                        (record.ino, record.dev, record.size, record.mtime_ns):
+                    self._handles.move_to_end(token)
+                    handle.refs += 1
+                    return handle
+
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(path)
+        if record is not None:
+            record.update(st)
+
+        with self._lock:
+            handle = self._handles.get(token)
+            if handle is not None and handle.matches(st):
+                self._handles.move_to_end(token)
+                handle.refs += 1
+                return handle
+
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        fresh = _OpenFile(fd, os.fstat(fd), path)
+        fresh.refs = 1
+
+        with self._lock:
+            stale = self._handles.pop(token, None)
+            if stale is not None:
+                self._discard(stale)
+            self._handles[token] = fresh
+            while len(self._handles) > self.max_open:
+                _, oldest = self._handles.popitem(last=False)
+                self._discard(oldest)
+        return fresh
+
+    def retain(self, handle: _OpenFile) -> bool:
+        """Take another reference on ``handle``; ``False`` if already closed."""
+        with self._lock:
+            if handle.evicted and handle.refs == 0:
+                return False
+            handle.refs += 1
+            return True
+
+    def release(self, handle: _OpenFile) -> None:
+        with self._lock:
+            handle.refs -= 1
+            refs = handle.refs
+            if handle.evicted and refs == 0:
+                os.close(handle.fd)
+        handle.released(refs)
+
+    def close_all(self) -> None:
+        with self._lock:
+            for handle in self._handles.values():
+                self._discard(handle)
+            self._handles.clear()
+
+    def _discard(self, handle: _OpenFile) -> None:
+        # Caller holds self._lock
+        handle.evicted = True
+        if handle.refs == 0:
+            os.close(handle.fd)
+
+
+_file_pool = _FilePool()
+
+
+# ── block cache ──────────────────────────────────────────────────────────────
+
+# Small responses (index, header and reference reads) are read through the
+# block cache instead of sendfile'd.  Copying through Python costs more CPU
+# the bigger the body (benchmarks/bench_server.py cachedread, page-cached
+# disk: 1.5x sendfile's CPU per GB at 256 KiB, 2.8x at 1 MiB, 5x at 4 MiB),
+# and bigger ones are bulk transfers that would only churn the cache.
+_CACHED_READ_MAX = 256 * 1024
+
+# Whole index files are pinned (kept out of LRU eviction) as long as pinned
+# blocks stay within half the cache.
+_PINNED_SUFFIXES = (".bai", ".crai", ".csi", ".tbi", ".fai", ".gzi")
+
+
+class _Inflight:
+    """A block being read by one thread that others are waiting for."""
+
+    __slots__ = ("done", "data", "error")
+
+    def __init__(self):
+        self.done  = threading.Event()
+        self.data  = b""
+        self.error: BaseException | None = None
+
+
+class _BlockCache:
+    """
+    Memory-bounded LRU of fixed-size, block-aligned file blocks.
+
+    Blocks are keyed by file identity (device, inode, size, mtime) and block
+    number, so every token serving the same file shares them and a changed
+    file simply misses.  Concurrent misses on one block are coalesced into a
+    single read.  Blocks of files read with ``pin_as`` are kept out of LRU
+    eviction; pinning a new version of the same path unpins the old one.
+    """
+
+    def __init__(self, capacity: int = 64 * 1024 * 1024, block_size: int = 65536):
+        self.capacity   = capacity
+        self.block_size = block_size
+        self._lock      = threading.Lock()
+        self._lru:    OrderedDict[tuple, bytes] = OrderedDict()
+        self._pinned: dict[tuple, bytes] = {}
+        self._pinned_paths: dict[str, tuple] = {}
+        self._inflight: dict[tuple, _Inflight] = {}
+        self._lru_bytes = self._pinned_bytes = 0
+        self.hits = self.misses = self.coalesced = 0
+        self.evictions = self.bytes_saved = 0
+
+    def read(self, handle: _OpenFile, offset: int, length: int,
+             pin_as: str | None = None) -> bytes:
+        """
+        Return ``length`` bytes of ``handle`` from ``offset`` -- fewer if the
+        file ended early.
+        """
+        if length <= 0:
+            return b""
+        identity = (handle.dev, handle.ino, handle.size, handle.mtime_ns)
+        bs    = self.block_size
+        first = offset // bs
+        parts = []
+        for index in range(first, (offset + length - 1) // bs + 1):
+            block = self._block(handle.fd, identity, index, pin_as)
+            parts.append(block)
+            if len(block) < bs:
+                break
+        skip = offset - first * bs
+        data = parts[0] if len(parts) == 1 else b"".join(parts)
+        return data[skip:skip + length]
+
+    def _block(self, fd: int, identity: tuple, index: int,
+               pin_as: str | None) -> bytes:
+        key = (*identity, index)
+        with self._lock:
+            block = self._pinned.get(key)
+            if block is None:
+                block = self._lru.get(key)
+                if block is not None:
+                    self._lru.move_to_end(key)
+            if block is not None:
+                self.hits        += 1
+                self.bytes_saved += len(block)
+                return block
+            waiter = self._inflight.get(key)
+            leader = waiter is None
+            if leader:
+                waiter = self._inflight[key] = _Inflight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            waiter.done.wait()
+            if waiter.error is not None:
+                raise waiter.error
+            with self._lock:
+                self.bytes_saved += len(waiter.data)
+            return waiter.data
+
+        try:
+            block = waiter.data = _pread(fd, self.block_size, index * self.block_size)
+        except BaseException as e:
+            waiter.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                # A short block means the file changed under us: don't keep it
+                expected = min(self.block_size, identity[2] - index * self.block_size)
+                if waiter.error is None and len(waiter.data) == expected:
+                    self._store(key, waiter.data, pin_as)
+            waiter.done.set()
+        return block
+
+    def _store(self, key: tuple, block: bytes, pin_as: str | None) -> None:
+        # Caller holds self._lock
+        if key in self._pinned or key in self._lru:
+            return
+        if pin_as is not None and \
+                self._pinned_bytes + len(block) <= self.capacity // 2:
+            identity = key[:-1]
+            previous = self._pinned_paths.get(pin_as)
+            if previous != identity:
+                if previous is not None:
+                    self._unpin(previous)
+                self._pinned_paths[pin_as] = identity
+            self._pinned[key]   = block
+            self._pinned_bytes += len(block)
+        else:
+            self._lru[key]   = block
+            self._lru_bytes += len(block)
+        self._trim()
+
+    def _unpin(self, identity: tuple) -> None:
+        # Caller holds self._lock
+        for key in [k for k in self._pinned if k[:-1] == identity]:
+            self._pinned_bytes -= len(self._pinned.pop(key))
+
+    def _trim(self) -> None:
+        # Caller holds self._lock
+        while self._lru and self._lru_bytes + self._pinned_bytes > self.capacity:
+            _, block = self._lru.popitem(last=False)
+            self._lru_bytes -= len(block)
+            self.evictions  += 1
+
+    def resize(self, capacity: int) -> None:
+        with self._lock:
+            self.capacity = capacity
+            if capacity <= 0:
+                self._lru.clear()
+                self._pinned.clear()
+                self._pinned_paths.clear()
+                self._lru_bytes = self._pinned_bytes = 0
+            self._trim()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "capacity":     self.capacity,
+                "block_size":   self.block_size,
+                "cached_bytes": self._lru_bytes + self._pinned_bytes,
+                "pinned_bytes": self._pinned_bytes,
+                "hits":         self.hits,
+                "misses":       self.misses,
+                "coalesced":    self.coalesced,
+                "evictions":    self.evictions,
+                "bytes_saved":  self.bytes_saved,
+            }
+
+
+_block_cache = _BlockCache()
+
+
+# ── sequential read-ahead ────────────────────────────────────────────────────
+
+# Panning in igv.js turns into a run of nearly contiguous range requests.
+# When a request on a token continues the previous one (forwards or
+# backwards), the region the next request will probably ask for is read
+# ahead.  Where posix_fadvise is available it is WILLNEED'd, so the kernel
+# fetches it asynchronously; elsewhere it is read into the block cache in
+# the background.
+# The window doubles on every sequential hit and collapses on a random one.
+_READAHEAD_MIN = 256 * 1024
+_READAHEAD_MAX = 8 * 1024 * 1024
+_SEQUENTIAL_GAP = 256 * 1024         # still "sequential" across a gap this big
+_READAHEAD_TOKENS = 1024             # access patterns remembered (LRU)
+
+_readahead_enabled = True
+
+
+class _AccessPattern:
+    __slots__ = ("start", "end", "window", "ahead_lo", "ahead_hi")
+
+    def __init__(self, start: int, end: int):
+        self.start    = start
+        self.end      = end
+        self.window   = 0
+        self.ahead_lo = self.ahead_hi = 0   # region already read ahead
+
+
+class _ReadAhead:
+    """Per-token sequential access detection and read-ahead."""
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._patterns: OrderedDict[str, _AccessPattern] = OrderedDict()
+        self._pool: ThreadPoolExecutor | None = None
+        self.sequential = self.random = self.issued = self.bytes_issued = 0
+
+    def observe(self, token: str, handle: _OpenFile, start: int, end: int) -> None:
+        """Record a read of ``[start, end)`` and read ahead if it continues a run."""
+        with self._lock:
+            pattern = self._patterns.get(token)
+            if pattern is None:
+                self._patterns[token] = _AccessPattern(start, end)
+                while len(self._patterns) > _READAHEAD_TOKENS:
+                    self._patterns.popitem(last=False)
+                return
+            self._patterns.move_to_end(token)
+
+            forward  = abs(start - pattern.end) <= _SEQUENTIAL_GAP \
+                       and end > pattern.end
+            backward = abs(end - pattern.start) <= _SEQUENTIAL_GAP \
+                       and start < pattern.start
+            pattern.start, pattern.end = start, end
+            if not (forward or backward):
+                pattern.window   = 0
+                pattern.ahead_lo = pattern.ahead_hi = 0
+                self.random += 1
+                return
+            self.sequential += 1
+            pattern.window = min(_READAHEAD_MAX, max(_READAHEAD_MIN, pattern.window * 2))
+
+            if forward:
+                lo, hi = end, min(handle.size, end + pattern.window)
+            else:
+                lo, hi = max(0, start - pattern.window), start
+            # Only the part not already read ahead, and only once less than
+            # half a window of it is left, so reads are issued in batches
+            if pattern.ahead_lo <= lo < pattern.ahead_hi:
+                lo = pattern.ahead_hi
+            if pattern.ahead_lo < hi <= pattern.ahead_hi:
+                hi = pattern.ahead_lo
+            if hi <= lo or (hi - lo < pattern.window // 2
+                            and 0 < lo and hi < handle.size):
+                return
+            if hi < pattern.ahead_lo or lo > pattern.ahead_hi:
+                pattern.ahead_lo, pattern.ahead_hi = lo, hi
+            else:
+                pattern.ahead_lo = min(pattern.ahead_lo, lo)
+                pattern.ahead_hi = max(pattern.ahead_hi, hi)
+            self.issued       += 1
+            self.bytes_issued += hi - lo
+        self._prefetch(handle, lo, hi - lo)
+
+    def _prefetch(self, handle: _OpenFile, offset: int, length: int) -> None:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(handle.fd, offset, length, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+            return
+        # Keep the descriptor open until the background read is done
+        if not _file_pool.retain(handle):
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=2,
+                                            thread_name_prefix="igv-readahead")
+
+        def run() -> None:
+            try:
+                if _block_cache.capacity > 0:
+                    _block_cache.read(handle, offset, length)
+                else:
+                    _pread(handle.fd, length, offset)
+            except OSError:
+                pass
+            finally:
+                _file_pool.release(handle)
+
+        self._pool.submit(run)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"sequential":   self.sequential,
+                    "random":       self.random,
+                    "issued":       self.issued,
+                    "bytes_issued": self.bytes_issued}
+
+
+_readahead = _ReadAhead()
+
+
+# ── Fair scheduling of bulk bodies ───────────────────────────────────────────
+
+# Bodies up to this size, and index files, are never queued: indexes,
+# headers and FASTA slices go straight out while bulk alignment ranges
+# take turns.
+_SMALL_BODY = 256 * 1024
+# Bulk bodies are read and sent in slices of this size, one turn each
+_FAIR_SLICE = 256 * 1024
+# Charged per slice on top of its bytes, so sessions share disk reads as
+# well as bandwidth
+_FAIR_IO_COST = 16 * 1024
+# Bulk slices being read and sent at once while sessions compete; few
+# enough that the order they are let through in decides the shares
+_FAIR_SLOTS = 2
+# Query parameter the component adds to the URLs of local and proxied track
+# data (see igv_streamlit._resolve_local_paths).  A query parameter, not a
+# header, so range requests stay free of extra preflights.  Requests without
+# it count as a session of their own connection.
+_SESSION_PARAM  = "igv_session"
+_MSG_DONTWAIT   = getattr(socket, "MSG_DONTWAIT", None)
+
+_fair_share   = True
+_session_rate: float | None = None      # bytes/s per session; None = no cap
+
+
+class _Session:
+    __slots__ = ("finish", "transfers", "tokens", "refilled")
+
+    def __init__(self, vtime: float):
+        self.finish    = vtime          # virtual finish tag of its last slice
+        self.transfers = 0              # bulk bodies being sent now
+        self.tokens    = 0.0            # session_rate token bucket
+        self.refilled  = time.monotonic()
+
+
+class _FairScheduler:
+    """
+    Start-time fair queuing of bulk bodies across sessions.
+
+    While one session at most is sending bulk bodies, its slices go
+    straight out (with sendfile where available).  Once several are, each
+    slice waits for a :meth:`turn`: it is tagged with its session's
+    previous finish tag (or the virtual clock, if the session had fallen
+    behind) and the lowest tag goes next, ``slots`` at a time.  Every
+    competing session so gets an equal share of disk reads and bytes,
+    however many connections it has open.
+    With ``session_rate`` set, each session's bulk bytes are also capped by
+    a token bucket holding one second's worth.
+    """
+
+    _MAX_IDLE_SESSIONS = 1024
+
+    def __init__(self, slots: int = _FAIR_SLOTS):
+        self.slots = slots
+        self._cond = threading.Condition()
+        self._sessions: dict[str, _Session] = {}
+        self._waiting: list[tuple[float, int]] = []     # heap of (tag, seq)
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._busy = self._active = 0
+        self._vtime = 0.0
+        self.bulk = self.queued = self.throttled = 0
+        self.queued_seconds = self.throttled_seconds = 0.0
+
+    def begin(self, key: str) -> None:
+        with self._cond:
+            session = self._sessions.get(key)
+            if session is None:
+                if len(self._sessions) >= self._MAX_IDLE_SESSIONS:
+                    self._prune()
+                session = self._sessions[key] = _Session(self._vtime)
+                session.tokens = _session_rate or 0.0
+            if not session.transfers:
+                self._active += 1
+            session.transfers += 1
+            self.bulk += 1
+
+    def end(self, key: str) -> None:
+        with self._cond:
+            session = self._sessions[key]
+            session.transfers -= 1
+            if not session.transfers:
+                self._active -= 1
+
+    def _prune(self) -> None:
+        # Caller holds _cond.  Idle sessions that aren't ahead of the clock
+        # would be recreated in the same state.
+        for key, session in list(self._sessions.items()):
+            if not session.transfers and session.finish <= self._vtime:
+                del self._sessions[key]
+
+    def contended(self) -> bool:
+        return self._active > 1
+
+    def throttle(self, key: str, nbytes: int) -> None:
+        """Wait until ``key`` may send ``nbytes`` more under ``session_rate``."""
+        delay = self._charge(key, nbytes)
+        if delay:
+            time.sleep(delay)
+
+    async def throttle_async(self, key: str, nbytes: int) -> None:
+        """:meth:`throttle` for the asyncio engine."""
+        delay = self._charge(key, nbytes)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _charge(self, key: str, nbytes: int) -> float:
+        """Take ``nbytes`` from ``key``'s bucket; return how long to wait."""
+        rate = _session_rate
+        if not rate:
+            return 0.0
+        with self._cond:
+            session = self._sessions[key]
+            now = time.monotonic()
+            session.tokens = min(rate, session.tokens + (now - session.refilled) * rate)
+            session.refilled = now
+            session.tokens  -= nbytes
+            delay = -session.tokens / rate if session.tokens < 0 else 0.0
+            if delay:
+                self.throttled += 1
+                self.throttled_seconds += delay
+        return delay
+
+    @contextmanager
+    def turn(self, key: str, nbytes: int):
+        """Hold one of the slots, once it is ``key``'s turn to send ``nbytes``."""
+        t0 = time.monotonic()
+        with self._cond:
+            entry  = self._enqueue(key, nbytes)
+            queued = False
+            while not self._ready(entry):
+                queued = True
+                self._cond.wait()
+            self._admit(entry, t0, queued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def turn_async(self, key: str, nbytes: int):
+        """:meth:`turn` for the asyncio engine, waiting on its event loop."""
+        t0   = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            entry = self._enqueue(key, nbytes)
+        queued = False
+        while True:
+            with self._cond:
+                if self._ready(entry):
+                    self._admit(entry, t0, queued)
+                    break
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            queued = True
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._wake()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _enqueue(self, key: str, nbytes: int) -> tuple[float, int]:
+        # Caller holds _cond
+        session = self._sessions[key]
+        start   = max(self._vtime, session.finish)
+        session.finish = start + nbytes + _FAIR_IO_COST
+        entry = (start, next(self._seq))
+        heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _ready(self, entry: tuple[float, int]) -> bool:
+        # Caller holds _cond
+        return self._busy < self.slots and self._waiting[0] is entry
+
+    def _admit(self, entry: tuple[float, int], t0: float, queued: bool) -> None:
+        # Caller holds _cond
+        heapq.heappop(self._waiting)
+        self._busy += 1
+        self._vtime = entry[0]
+        if queued:
+            self.queued += 1
+            self.queued_seconds += time.monotonic() - t0
+        # The next in line may be let through by a free slot too
+        self._wake()
+
+    def _release(self) -> None:
+        with self._cond:
+            self._busy -= 1
+            self._wake()
+
+    def _wake(self) -> None:
+        # Caller holds _cond.  Every waiter checks whether it is next.
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_set_done, waiter)
+
+    def stats(self) -> dict[str, int | float]:
+        with self._cond:
+            return {"sessions":          self._active,
+                    "bulk_bodies":       self.bulk,
+                    "queued":            self.queued,
+                    "queued_seconds":    round(self.queued_seconds, 3),
+                    "throttled":         self.throttled,
+                    "throttled_seconds": round(self.throttled_seconds, 3)}
+
+
+def _set_done(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _session_key(target: str, client_address: tuple) -> str:
+    """The session a request for ``target`` counts toward under fair sharing."""
+    query = target.partition("?")[2]
+    for param in query.split("&"):
+        name, _, value = param.partition("=")
+        if name == _SESSION_PARAM and value:
+            return value
+    return f"{client_address[0]}:{client_address[1]}"
+
+
+_scheduler = _FairScheduler()
+
+
+# ── Range handling (RFC 7233) ────────────────────────────────────────────────
+
+# More ranges than this in one request is treated as abuse and the Range
+# header is ignored (RFC 7233 §6.1 allows this).
+_MAX_RANGES = 256
+
+
+def _parse_range(header: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse a ``Range`` header into sorted, coalesced, inclusive byte ranges.
+
+    Supports ``a-b``, open-ended ``a-`` and suffix ``-n`` specs, separated by
+    commas.  Returns ``None`` if the header is malformed or uses a unit other
+    than bytes (the caller then ignores it and sends the whole file), and an
+    empty list if it is well-formed but no range overlaps the file (416).
+    """
+    unit, sep, spec_list = header.partition("=")
+    if not sep or unit.strip().lower() != "bytes":
+        return None
+
+    specs = [spec.strip() for spec in spec_list.split(",") if spec.strip()]
+    if not specs or len(specs) > _MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or not (first or last):
+            return None
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+
+        if not first:                               # suffix: last N bytes
+            n = int(last)
+            if n and size:
+                ranges.append((max(0, size - n), size - 1))
+            continue
+
+        start = int(first)
+        end   = int(last) if last else size - 1
+        if last and end < start:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    ranges.sort()
+    merged: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _multipart_body(
+    ranges: list[tuple[int, int]], size: int, mime_type: str, boundary: str,
+) -> tuple[list[bytes | tuple[int, int]], int]:
+    """
+    Lay out a ``multipart/byteranges`` body.
+
+    Returns the body as a list of segments -- literal ``bytes`` for part
+    headers and ``(offset, length)`` slices of the file -- together with the
+    total body length for ``Content-Length``.
+    """
+    segments: list[bytes | tuple[int, int]] = []
+    total = 0
+    for start, end in ranges:
+        head = (f"\r\n--{boundary}\r\n"
+                f"Content-Type: {mime_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+        segments += [head, (start, end - start + 1)]
+        total += len(head) + end - start + 1
+    tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    segments.append(tail)
+    return segments, total + len(tail)
+
+
+# ── Request handling (shared by every server engine) ─────────────────────────
+
+_CORS_HEADERS = [
+    ("Access-Control-Allow-Origin",   "*"),
+    ("Access-Control-Allow-Methods",  "GET, HEAD, OPTIONS"),
+    ("Access-Control-Allow-Headers",  "Range, Content-Type"),
+    ("Access-Control-Expose-Headers", "Content-Range, Content-Length, Accept-Ranges"),
+]
+
+# igv.js sends a Range header with every request, so each one is preceded by
+# a preflight unless the browser may cache the answer.  Browsers clamp this
+# (Chrome to 2 hours, Firefox to 24), after which each file URL is
+# preflighted once more rather than before every range request.
+_PREFLIGHT_MAX_AGE = 86400
+
+# Preflights don't depend on the file asked about, so the whole answer but
+# the Date header is encoded once and written without a registry lookup.
+_PREFLIGHT_HEADERS = [("Access-Control-Allow-Origin",  "*"),
+                      ("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS"),
+                      ("Access-Control-Allow-Headers", "Range, Content-Type"),
+                      ("Access-Control-Max-Age",       str(_PREFLIGHT_MAX_AGE)),
+                      ("Content-Length",               "0")]
+_PREFLIGHT_HEAD = "".join(f"{name}: {value}\r\n"
+                          for name, value in _PREFLIGHT_HEADERS).encode("latin-1")
+
+
+class _RequestCounts:
+    """Preflight and GET/HEAD request counters, for ``server_stats``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.preflights = self.requests = self.cross_origin = 0
+
+    def preflight(self) -> None:
+        with self._lock:
+            self.preflights += 1
+
+    def request(self, headers) -> None:
+        cross_origin = headers.get("Origin") is not None
+        with self._lock:
+            self.requests     += 1
+            self.cross_origin += cross_origin
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"preflights":   self.preflights,
+                    "requests":     self.requests,
+                    "cross_origin": self.cross_origin}
+
+
+_request_counts = _RequestCounts()
+
+
+def _preflight_response(keep_alive: bool) -> bytes:
+    """The complete response to an ``OPTIONS`` request; it has no body."""
+    _request_counts.preflight()
+    return b"".join((b"HTTP/1.1 204 No Content\r\n",
+                     f"Date: {formatdate(usegmt=True)}\r\n".encode("latin-1"),
+                     b"" if keep_alive else b"Connection: close\r\n",
+                     _PREFLIGHT_HEAD, b"\r\n"))
+
+
+class _Reply:
+    """
+    Everything needed to answer one request, independent of the engine.
+
+    ``segments`` is the body as literal ``bytes`` and ``(offset, length)``
+    slices of ``handle.fd``.  The engine writes the status line, ``headers``
+    and (unless the request was HEAD) the segments in order, then calls
+    :meth:`close` to hand the pooled descriptor back.  ``bulk`` bodies are
+    big enough to take turns under ``_FairScheduler``.
+    """
+
+    __slots__ = ("status", "headers", "segments", "handle", "bulk")
+
+    def __init__(self, status: int, headers: list[tuple[str, str]],
+                 segments: list[bytes | tuple[int, int]] | None = None,
+                 handle: _OpenFile | None = None):
+        self.status   = status
+        self.headers  = headers
+        self.segments = segments or []
+        self.handle   = handle
+        self.bulk     = False
+
+    def close(self) -> None:
+        if self.handle is not None:
+            _file_pool.release(self.handle)
+            self.handle = None
+
+
+def _empty_reply(status: int, *headers: tuple[str, str]) -> _Reply:
+    return _Reply(status, [*headers, ("Content-Length", "0"), *_CORS_HEADERS])
+
+
+def _reply_executor(path: str):
+    """
+    The executor an event-loop server should run ``_build_reply(...,
+    path, ...)`` on: the proxy's own for proxied files, else the loop's
+    default (``None``).
+    """
+    parts = path.split("?")[0].strip("/").split("/")
+    with _registry_lock:
+        remote = len(parts) in (2, 3) and parts[0] == "file" and \
+            parts[1] in _remote_registry
+    if not remote:
+        return None
+    from . import _proxy
+    return _proxy.executor()
+
+
+def _build_reply(method: str, path: str, headers) -> _Reply:
+    """
+    Work out the response to ``method path``.
+
+    ``headers`` is anything with a case-insensitive ``get`` -- the threaded
+    handler's ``email.message.Message`` or the asyncio engine's header dict.
+    """
+    if method == "OPTIONS":
+        # The engines answer preflights with _preflight_response() before
+        # getting here; this serves any other caller
+        _request_counts.preflight()
+        return _Reply(204, list(_PREFLIGHT_HEADERS))
+    if method not in ("GET", "HEAD"):
+        return _empty_reply(405, ("Allow", "GET, HEAD, OPTIONS"))
+    _request_counts.request(headers)
+
+    # /file/<token>, optionally followed by /<filename> that lets igv.js
+    # infer the format from the URL.  The name must be the file's own: an
+    # index igv.js guesses by appending .bai or .fai must not get the data.
+    parts = path.split("?")[0].strip("/").split("/")
+    if len(parts) not in (2, 3) or parts[0] != "file":
+        return _empty_reply(404)
+    name = unquote(parts[2]) if len(parts) == 3 else None
+
+    token = parts[1]
+    with _registry_lock:
+        record = _file_registry.get(token)
+    if record is None and _registry_file is not None:
+        record = _registry_file.lookup(token)
+
+    if record is None:
+        with _registry_lock:
+            urls = _remote_registry.get(token)
+        if urls is None or \
+                name not in (None, os.path.basename(urlsplit(urls[0]).path)):
+            return _empty_reply(404)
+        from . import _proxy
+        reply = _proxy.build_reply(method, urls, headers)
+        reply.bulk = method == "GET" and _body_size(reply) > _SMALL_BODY and \
+            not urls[0].split("?")[0].endswith(_PINNED_SUFFIXES)
+        return reply
+    if name not in (None, _artifacts.display_name(record.path)):
+        return _empty_reply(404)
+    try:
+        handle = _file_pool.acquire(token, record.path, record)
+    except OSError:
+        return _empty_reply(404)
+    if record.version is not None and record.version != (handle.size, handle.mtime_ns):
+        # A content-addressed URL must never serve other bytes
+        _file_pool.release(handle)
+        return _empty_reply(404)
+
+    try:
+        reply = _file_reply(token, handle, record, headers)
+    except BaseException:
+        _file_pool.release(handle)
+        raise
+    if method == "GET":
+        if _readahead_enabled and reply.status == 206 and len(reply.segments) == 1:
+            offset, length = reply.segments[0]
+            _readahead.observe(token, reply.handle, offset, offset + length)
+        reply.bulk = not record.pinned and _body_size(reply) > _SMALL_BODY
+        # Bulk bodies are read a slice at a time when it is their turn;
+        # reading one into the cache here would skip the turns
+        if not (reply.bulk and _fair_share):
+            _read_through_cache(reply, record)
+    return reply
+
+
+def _body_size(reply: _Reply) -> int:
+    return sum(len(segment) if isinstance(segment, bytes) else segment[1]
+               for segment in reply.segments)
+
+
+def _read_through_cache(reply: _Reply, record: _FileRecord) -> None:
+    """
+    Replace the file slices of a small response with bytes from the block
+    cache.  Large bodies, and any read that comes up short, are left to the
+    engine's sendfile path.
+    """
+    if reply.handle is None or _block_cache.capacity <= 0:
+        return
+    pin    = record.pinned
+    limit  = _block_cache.capacity // 2 if pin else _CACHED_READ_MAX
+    slices = [s for s in reply.segments if not isinstance(s, bytes)]
+    if sum(length for _, length in slices) > limit:
+        return
+
+    segments: list[bytes | tuple[int, int]] = []
+    for segment in reply.segments:
+        if not isinstance(segment, bytes):
+            offset, length = segment
+            try:
+                # Keyed by the file read, which is a compressed variant of
+                # the record's for an encoded reply
+                data = _block_cache.read(reply.handle, offset, length,
+                                         reply.handle.path if pin else None)
+            except OSError:
+                return
+            if len(data) < length:
+                return
+            segment = data
+        segments.append(segment)
+    reply.segments = segments
+
+
+def _encoded_handle(token: str, handle: _OpenFile, record: _FileRecord,
+                    request_headers) -> tuple[str, _OpenFile] | None:
+    """
+    Return ``(coding, handle)`` for a ready compressed variant of the file,
+    or ``None`` to serve it as-is.  Range requests are never encoded.
+    """
+    if request_headers.get("range"):
+        return None
+    coding = _compression.negotiate(request_headers.get("accept-encoding"))
+    if coding is None:
+        return None
+    variant = _compression.encoded_variant(record.path, handle.st, coding)
+    if variant is None:
+        return None
+    try:
+        encoded = _file_pool.acquire(f"{token}.{coding}", variant)
+    except OSError:                     # removed from the cache underneath us
+        return None
+    return coding, encoded
+
+
+def _not_modified(etag: str, mtime_ns: int, headers) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since (RFC 7232 §6)."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+        return etag in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return mtime_ns // 1_000_000_000 <= since
+    return False
+
+
+def _if_range_holds(handle: _OpenFile, headers) -> bool:
+    """True unless an If-Range validator says the client's copy is stale."""
+    if_range = headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == handle.etag
+    if if_range.startswith("W/"):           # weak tags never match If-Range
+        return False
+    return if_range == handle.last_modified
+
+
+def _file_reply(token: str, handle: _OpenFile, record: _FileRecord,
+                request_headers) -> _Reply:
+    mime_type  = record.mime
+    # Validators always describe the source file, whichever encoding is sent
+    etag, mtime_ns, last_modified = handle.etag, handle.mtime_ns, handle.last_modified
+    validators = []
+
+    if _compression.is_compressible(record.path, mime_type, handle.size):
+        validators.append(("Vary", "Accept-Encoding"))
+        encoded = _encoded_handle(token, handle, record, request_headers)
+        if encoded is not None:
+            coding, encoded_handle = encoded
+            _file_pool.release(handle)
+            handle = encoded_handle
+            etag   = f'{etag[:-1]}-{coding}"'
+            validators.append(("Content-Encoding", coding))
+
+    validators += [("ETag",          etag),
+                   ("Last-Modified", last_modified),
+                   ("Cache-Control", record.cache_control)]
+
+    if _not_modified(etag, mtime_ns, request_headers):
+        _file_pool.release(handle)
+        return _Reply(304, [*validators, *_CORS_HEADERS])
+    return _body_reply(handle, mime_type, validators, request_headers)
+
+
+def _body_reply(handle: _OpenFile, mime_type: str,
+                validators: list[tuple[str, str]], request_headers) -> _Reply:
+    """
+    The 200, 206 or 416 reply for ``handle``, whichever the ``Range`` and
+    ``If-Range`` headers ask for.  Releases ``handle`` unless the reply
+    holds it.
+    """
+    file_size    = handle.size
+    range_header = request_headers.get("range")
+    ranges = None
+    if range_header and _if_range_holds(handle, request_headers):
+        ranges = _parse_range(range_header, file_size)
+
+    if ranges == []:
+        _file_pool.release(handle)
+        return _empty_reply(416, ("Content-Range", f"bytes */{file_size}"))
+
+    if ranges is None:
+        status   = 200
+        headers  = [("Content-Type", mime_type)]
+        segments = [(0, file_size)]
+        length   = file_size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        status   = 206
+        headers  = [("Content-Type",  mime_type),
+                    ("Content-Range", f"bytes {start}-{end}/{file_size}")]
+        segments = [(start, end - start + 1)]
+        length   = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        status   = 206
+        headers  = [("Content-Type", f"multipart/byteranges; boundary={boundary}")]
+        segments, length = _multipart_body(ranges, file_size, mime_type, boundary)
+
+    headers += [("Content-Length", str(length)),
+                ("Accept-Ranges",  "bytes"),
+                *validators,
+                *_CORS_HEADERS]
+    return _Reply(status, headers, segments, handle)
+
+
+def _has_request_body(headers) -> bool:
+    """True if the request carries a body, which this server never reads."""
+    return bool(headers.get("transfer-encoding")) or \
+           headers.get("content-length", "0").strip() not in ("", "0")
+
+
+# ── threaded engine ──────────────────────────────────────────────────────────
+
 class _CORSHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so browsers reuse one connection for the burst of index,
+    # header and data range requests behind each locus jump.  The socket
+    # timeout is switched between the read and write timeouts below; idle
+    # keep-alive connections wait in the server's idle selector instead.
+    protocol_version = "HTTP/1.1"
+    timeout          = _READ_TIMEOUT
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # next response on a kept-alive connection waits on a delayed ACK.
+    disable_nagle_algorithm = True
+
     def log_message(self, format, *args): pass
 
-    def _cors(self):
-        self.send_header("Access-Control-Allow-Origin",   "*")
-        self.send_header("Access-Control-Allow-Methods",  "GET, HEAD, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers",  "Range, Content-Type")
-        self.send_header("Access-Control-Expose-Headers",
-                         "Content-Range, Content-Length, Accept-Ranges")
+    def setup(self):
+        super().setup()
+        # Why the worker is handing the open connection back to the server:
+        # "idle" (no next request yet) or "ready" (one is, but others wait)
+        self.parked: str | None = None
+
+    def handle(self):
+        # Requests are served while the client has the next one on its way;
+        # after that the worker moves on and the server watches the
+        # connection instead.  A worker others are waiting for is given up
+        # after each request too.
+        self.parked = None
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self._readable():
+                self.parked = "idle"
+            elif self.server.has_waiting():
+                self.parked = "ready"
+            if self.parked:
+                return
+            self.handle_one_request()
+
+    def resume(self):
+        """Serve a parked connection whose next request has arrived."""
+        try:
+            self.handle()
+        finally:
+            self.finish()
+
+    def finish(self):
+        if not self.parked:
+            super().finish()
+
+    def handle_one_request(self):
+        self.connection.settimeout(_READ_TIMEOUT)
+        super().handle_one_request()
+
+    def _readable(self) -> bool:
+        """Whether the next request (or EOF) is ready to read, without waiting."""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        except OSError:
+            return True             # handle_one_request will see it too
+        finally:
+            self.connection.settimeout(_READ_TIMEOUT)
+
+    def _must_close(self) -> bool:
+        # An unread request body would be parsed as the next request, so the
+        # client is told before the response
+        return self.close_connection or _has_request_body(self.headers)
+
+    def do_HEAD(self):    self._handle()
+    def do_GET(self):     self._handle()
+    # Other methods get the same 405 as on the asyncio engine, not a 501
+    do_POST = do_PUT = do_PATCH = do_DELETE = do_GET
 
     def do_OPTIONS(self):
-        self.send_response(200); self._cors(); self.end_headers()
+        self.close_connection = self._must_close()
+        self.connection.settimeout(_WRITE_TIMEOUT)
+        try:
+            self.wfile.write(_preflight_response(not self.close_connection))
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError,
+                TimeoutError):
+            self.close_connection = True
 
-    def do_HEAD(self): self._handle(head_only=True)
-    def do_GET(self):  self._handle(head_only=False)
+    def _handle(self):
+        reply = _build_reply(self.command, self.path, self.headers)
+        self.connection.settimeout(_WRITE_TIMEOUT)
+        try:
+            self.close_connection = self._must_close()
+            self.send_response(reply.status)
+            for name, value in reply.headers:
+                self.send_header(name, value)
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
 
-    def _handle(self, head_only: bool):
-        parts = self.path.split("?")[0].strip("/").split("/")
-        if len(parts) != 2 or parts[0] != "file":
-            self.send_error(404); return
+            if self.command == "HEAD":
+                return
+            if _fair_share and reply.bulk:
+                session = _session_key(self.path, self.client_address)
+                _scheduler.begin(session)
+            else:
+                session = None
+            try:
+                for segment in reply.segments:
+                    if isinstance(segment, bytes):
+                        if session:
+                            _scheduler.throttle(session, len(segment))
+                        self.wfile.write(segment)
+                    elif not (self._send_fair(session, reply.handle.fd, *segment)
+                              if session else
+                              self._send_body(reply.handle.fd, *segment)):
+                        # File shrank under us: we can't honour
+                        # Content-Length, so the connection can't be reused
+                        self.close_connection = True
+                        return
+            finally:
+                if session:
+                    _scheduler.end(session)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError,
+                TimeoutError):
+            self.close_connection = True
+        finally:
+            reply.close()
 
-        token = parts[1]
-        with _registry_lock:
-            file_path = _file_registry.get(token)
+    def _send_fair(self, session: str, fd: int, start: int, length: int) -> bool:
+        """:meth:`_send_body` a slice at a time, taking turns with other sessions."""
+        end = start + length
+        while start < end:
+            n = min(_FAIR_SLICE, end - start)
+            _scheduler.throttle(session, n)
+            if not _scheduler.contended():
+                if not self._send_body(fd, start, n):
+                    return False
+            else:
+                with _scheduler.turn(session, n):
+                    chunk = memoryview(_pread(fd, n, start))
+                    sent  = self._send_now(chunk)
+                # Whatever a slow client can't take yet is sent without
+                # holding up other sessions
+                self.wfile.write(chunk[sent:])
+                if len(chunk) < n:
+                    return False
+            start += n
+        return True
+
+    def _send_now(self, data: memoryview) -> int:
+        """Send what the socket buffer takes without blocking; return its size."""
+        if _MSG_DONTWAIT is None or isinstance(self.connection, ssl.SSLSocket):
+            self.wfile.write(data)
+            return len(data)
+        try:
+            return self.connection.send(data, _MSG_DONTWAIT)
+        except BlockingIOError:
+            return 0
+
+    def _send_body(self, fd: int, start: int, length: int) -> bool:
+        """
+        Write ``length`` bytes of ``fd`` starting at ``start`` to the client.
+
+        Returns ``False`` if the file ended before ``length`` bytes were sent.
+        """
+        # sendfile would bypass TLS, so wrapped sockets always take the loop
+        if _USE_SENDFILE and not isinstance(self.connection, ssl.SSLSocket):
+            sent = _sendfile(self.connection, fd, start, length)
+            start, length = start + sent, length - sent
+
+        end = start + length
+        while start < end:
+            chunk = _pread(fd, min(_CHUNK_SIZE, end - start), start)
+            if not chunk:
+                return False
+            self.wfile.write(chunk)
+            start += len(chunk)
+        return True
+
+
+class _PooledHTTPServer(HTTPServer):
+    """
+    ``HTTPServer`` that serves connections on a fixed set of worker threads.
 
-        if file_path is None or not os.path.isfile(file_path):
-            self.send_error(404); return
+    Accepted connections wait in a bounded queue for a worker; when the
+    queue is full they are answered ``503`` with ``Retry-After`` straight
+    from the accept loop and closed.  Idle keep-alive connections hold no
+    worker: one thread watches them all with a selector, queues each again
+    once its next request arrives and closes it after ``_KEEPALIVE_TIMEOUT``.
+    """
 
-        file_size = os.path.getsize(file_path)
-        mime_type = _get_mime(file_path)
-        start, end, partial = 0, file_size - 1, False
+    request_queue_size = 1024          # listen backlog
 
-        range_header = self.headers.get("Range")
-        if range_header:
+    def __init__(self, address: tuple[str, int], max_workers: int, max_queue: int,
+                 reuse_port: bool = False):
+        self.allow_reuse_port = reuse_port
+        super().__init__(address, _CORSHandler)
+        self.max_workers = max_workers
+        self.max_queue   = max_queue
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._lock       = threading.Lock()
+        self.active = self.peak_queue = self.rejected = self.accepted = 0
+        self.resumed = self.expired = 0
+        # Connections handed over by workers, registered by the idle thread
+        self._parking: list[tuple[_CORSHandler, float]] = []
+        self._idle: OrderedDict[_CORSHandler, float] = OrderedDict()
+        self._closing = False
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._workers = [threading.Thread(target=self._work, daemon=True,
+                                          name=f"igv-file-server-{i}")
+                         for i in range(max_workers)]
+        self._watcher = threading.Thread(target=self._watch_idle, daemon=True,
+                                         name="igv-file-server-idle")
+        for worker in (*self._workers, self._watcher):
+            worker.start()
+
+    def has_waiting(self) -> bool:
+        """Whether a queued connection has no idle worker to pick it up."""
+        return self._queue.qsize() > self.max_workers - self.active
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            self._reject(request)
+            return
+        with self._lock:
+            self.accepted  += 1
+            self.peak_queue = max(self.peak_queue, self._queue.qsize())
+
+    def _hand_over(self, handler: _CORSHandler) -> bool:
+        """
+        Pass on a kept-alive connection its worker is done with: queue it
+        again if its next request is already here, or have the idle thread
+        watch it.  False if it is to be closed instead.
+        """
+        while handler.parked == "ready":
             try:
-                spec = range_header.strip().removeprefix("bytes=")
-                s, _, e = spec.partition("-")
-                start = int(s) if s.strip() else 0
-                end   = int(e) if e.strip() else file_size - 1
-                start = max(0, min(start, file_size - 1))
-                end   = max(start, min(end, file_size - 1))
-                partial = True
-            except Exception:
-                self.send_error(400); return
-
-        content_length = end - start + 1
-        self.send_response(206 if partial else 200)
-        self.send_header("Content-Type",   mime_type)
-        self.send_header("Content-Length", str(content_length))
-        self.send_header("Accept-Ranges",  "bytes")
-        if partial:
-            self.send_header("Content-Range",
-                f"bytes {start}-{end}/{file_size}")
-        self._cors()
-        self.end_headers()
-
-        if head_only:
+                self._queue.put_nowait(handler)
+                return True
+            except queue.Full:
+                handler.resume()        # nobody to pass it to: serve it here
+        if handler.parked == "idle":
+            with self._lock:
+                closing = self._closing
+                if not closing:
+                    self._parking.append(
+                        (handler, time.monotonic() + _KEEPALIVE_TIMEOUT))
+            if not closing:
+                self._wake()
+                return True
+            handler.parked = None
+            handler.finish()
+        return False
+
+    def _wake(self) -> None:
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:         # already woken
+            pass
+
+    def _watch_idle(self) -> None:
+        with selectors.DefaultSelector() as sel:
+            sel.register(self._wake_r, selectors.EVENT_READ)
+            while True:
+                timeout = None
+                if self._idle:
+                    deadline = next(iter(self._idle.values()))
+                    timeout  = max(0.0, deadline - time.monotonic())
+                for key, _ in sel.select(timeout):
+                    if key.fileobj is self._wake_r:
+                        continue
+                    handler = key.data
+                    sel.unregister(handler.connection)
+                    del self._idle[handler]
+                    self._resume(handler)
+
+                try:
+                    while self._wake_r.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                with self._lock:
+                    parking, self._parking = self._parking, []
+                    closing = self._closing
+                for handler, deadline in parking:
+                    sel.register(handler.connection, selectors.EVENT_READ, handler)
+                    self._idle[handler] = deadline
+                # Deadlines are handed out in order, so the oldest come first
+                now = time.monotonic()
+                while self._idle and (closing or next(iter(self._idle.values())) <= now):
+                    handler, _ = self._idle.popitem(last=False)
+                    sel.unregister(handler.connection)
+                    self.expired += not closing
+                    self._close_idle(handler)
+                if closing:
+                    return
+
+    def _resume(self, handler: _CORSHandler) -> None:
+        try:
+            self._queue.put_nowait(handler)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            handler.parked = None
+            handler.finish()
+            self._reject(handler.connection)
             return
+        with self._lock:
+            self.resumed   += 1
+            self.peak_queue = max(self.peak_queue, self._queue.qsize())
+
+    def _close_idle(self, handler: _CORSHandler) -> None:
+        handler.parked = None
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.connection)
 
+    def _reject(self, request: socket.socket) -> None:
+        reply = _empty_reply(503, ("Retry-After", str(_RETRY_AFTER)))
+        head  = ["HTTP/1.1 503 Service Unavailable", "Connection: close",
+                 *(f"{name}: {value}" for name, value in reply.headers), "", ""]
         try:
-            with open(file_path, "rb") as f:
-                f.seek(start)
-                remaining = content_length
-                while remaining > 0:
-                    chunk = f.read(min(65536, remaining))
-                    if not chunk:
-                        break
-                    self.wfile.write(chunk)
-                    remaining -= len(chunk)
-        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            request.setblocking(False)
+            try:
+                request.recv(65536)     # don't reset a client mid-request
+            except BlockingIOError:
+                pass
+            request.send("\r\n".join(head).encode("latin-1"))
+        except OSError:
             pass
+        self.shutdown_request(request)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            with self._lock:
+                self.active += 1
+            if isinstance(item, tuple):
+                request, client_address = item
+                handler = None
+            else:
+                handler = item
+                request, client_address = handler.connection, handler.client_address
+            try:
+                if handler is None:
+                    handler = self.RequestHandlerClass(request, client_address, self)
+                else:
+                    handler.resume()
+                if self._hand_over(handler):
+                    request = None
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if request is not None:
+                    self.shutdown_request(request)
+                with self._lock:
+                    self.active -= 1
+
+    def server_close(self):
+        super().server_close()
+        with self._lock:
+            self._closing = True
+        self._wake()
+        self._watcher.join()
+        self._wake_r.close()
+        self._wake_w.close()
+        for _ in self._workers:
+            self._queue.put(None)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"max_workers": self.max_workers,
+                    "max_queue":   self.max_queue,
+                    "active":      self.active,
+                    "queued":      self._queue.qsize(),
+                    "peak_queue":  self.peak_queue,
+                    "accepted":    self.accepted,
+                    "rejected":    self.rejected,
+                    "idle":        len(self._idle),
+                    "resumed":     self.resumed,
+                    "expired":     self.expired}
+
+
+def configure_server(
+    *,
+    engine: str | None = None,
+    cache_control: dict[str, str] | None = None,
+    cache_dir: str | None = None,
+    artifact_cache_size: int | None = None,
+    auto_index: bool | None = None,
+    auto_index_min_size: int | None = None,
+    block_cache_size: int | None = None,
+    readahead: bool | None = None,
+    port: int | None = None,
+    stable_tokens: bool | None = None,
+    max_workers: int | None = None,
+    max_queue: int | None = None,
+    read_timeout: float | None = None,
+    write_timeout: float | None = None,
+    idle_timeout: float | None = None,
+    same_origin: bool | None = None,
+    workers: int | None = None,
+    fair_share: bool | None = None,
+    session_rate: float | None = None,
+    proxy_remote: bool | None = None,
+    proxy_cache_size: int | None = None,
+    hedge_percentile: float | None = None,
+) -> None:
+    """
+    Configure the local file server.
+
+    Must be called before the first local file is registered, i.e. before the
+    first ``browser(...)`` call that uses ``path``-style properties.
+
+    Parameters
+    ----------
+    engine : {"threading", "asyncio"}, optional
+        ``"threading"`` (default) serves each connection on one of
+        ``max_workers`` OS threads.  ``"asyncio"`` serves every connection
+        from a single event loop, which keeps thread count and memory flat
+        when many browsers are connected at once.
+    cache_control : dict, optional
+        ``Cache-Control`` values by file extension, merged into the defaults,
+        e.g. ``{".bam": "max-age=60", "": "no-store"}``.  The ``""`` key
+        applies to any file without a more specific entry.  Every file
+        response also carries ``ETag`` / ``Last-Modified`` validators, so
+        ``no-cache`` files are revalidated with a cheap ``304``.
+    cache_dir : str, optional
+        Where derived files (compressed variants, ...) are stored.  Defaults
+        to ``$IGV_STREAMLIT_CACHE_DIR`` or ``~/.cache/igv-streamlit``.
+    artifact_cache_size : int, optional
+        Bytes of disk the derived files in ``cache_dir`` may use (default
+        4 GiB); least recently used ones are evicted beyond that, and built
+        again if needed.
+    auto_index : bool, optional
+        Whether local GFF/GTF/BED/VCF tracks without an index are sorted,
+        bgzipped and tabix-indexed into ``cache_dir`` so igv.js only fetches
+        the visible region (default ``True``).  The indexed copy is built in
+        the background, with bounded memory, and the track is served as-is
+        until it is ready.  A track's own ``"autoIndex": True/False`` always
+        wins.
+    auto_index_min_size : int, optional
+        Smallest file, in bytes, that is indexed automatically (default
+        2 MiB); smaller files load quickly enough as they are.
+    block_cache_size : int, optional
+        Bytes of memory for the block cache shared by all files (default
+        64 MiB, ``0`` disables it).  Index files and small range reads are
+        served from it instead of being re-read from disk; see
+        :func:`server_stats` to size it.
+    readahead : bool, optional
+        Whether runs of nearly contiguous range requests (panning) read the
+        next region of the file ahead of time (default ``True``).  Helps
+        most on network filesystems.
+    port : int, optional
+        Serve local files on this port instead of a random free one.  If it
+        is taken when the server starts, a free port is used instead (with a
+        warning).  Must be set before the server starts.
+    stable_tokens : bool, optional
+        Derive each file's URL token from its path, size and mtime (keyed
+        with a secret kept in ``cache_dir``) instead of at random, and serve
+        it with ``Cache-Control: immutable``.  Combined with ``port``, URLs
+        survive restarts, so reopened sessions load indexes and reference
+        slices from the browser cache.  Once a file changes, its old URL
+        returns 404 and re-registering it gives a new one.
+    max_workers : int, optional
+        Connections served at once (default 64).  The threaded engine runs
+        this many worker threads; idle keep-alive connections don't hold
+        one, and a connection others are waiting for gives its worker up
+        after each request.
+    max_queue : int, optional
+        Accepted connections that may wait for a worker (default 1024).
+        Beyond that, requests are answered ``503`` with ``Retry-After``.
+        The asyncio engine serves up to ``max_workers + max_queue``
+        requests at once and rejects the rest the same way.
+    read_timeout, write_timeout, idle_timeout : float, optional
+        Seconds a new connection may take to send its request (default 30),
+        a response write may stall (default 60), and an idle keep-alive
+        connection is kept open (default 30).
+    same_origin : bool, optional
+        Serve local files from the Streamlit server itself, under
+        ``<baseUrlPath>/_igv_streamlit/``, instead of a second port on
+        127.0.0.1 (default ``False``).  Works behind a reverse proxy and
+        over HTTPS, and igv.js requests need no CORS preflight.  Pass
+        :func:`igv_streamlit.file_middleware` to ``st.App(middleware=...)``;
+        under a plain ``streamlit run`` the server is patched on tested
+        Streamlit releases only.  Otherwise falls back to the standalone
+        server.  The engine, port and worker settings don't apply to files
+        served this way.
+    workers : int, optional
+        Serve local files from this many processes sharing the port with
+        ``SO_REUSEPORT`` (default 1, this process), for hosts where one
+        process can't keep up with the range requests.  Each worker runs
+        ``engine`` with its own ``max_workers`` and block cache.  Needs
+        ``fork`` and ``SO_REUSEPORT`` (not Windows).  Must be set before the
+        server starts.
+    fair_share : bool, optional
+        Whether sessions take turns reading large response bodies once
+        several are downloading at the same time (default ``True``), so one
+        whole-chromosome view can't starve everyone else.  Bodies up to
+        256 KiB and index files are never queued.  Sessions are told apart
+        by the ``igv_session`` query parameter the component adds to the
+        URLs of BAM and CRAM tracks; any other request, which browsers can
+        then cache across sessions, counts as a session of its own
+        connection.  Each worker process (see ``workers``) schedules
+        its own connections.
+    session_rate : float, optional
+        Cap each session's large response bodies at this many bytes per
+        second (default: no cap; ``0`` removes a cap).  Needs
+        ``fair_share``.
+    proxy_remote : bool, optional
+        Serve remote ``url`` / ``indexURL`` / ``fastaURL`` (http and https)
+        through the local server, which keeps the byte ranges it fetches in
+        a block cache in ``cache_dir`` (default ``False``).  Repeat views of
+        the same loci, even after a restart, are then served from disk.  A
+        track's own ``"proxy": True/False`` always wins.  Requests for
+        files on servers without range support are redirected to them.
+        ``ftp://`` URLs, which igv.js can't fetch, are always proxied.
+    proxy_cache_size : int, optional
+        Bytes of disk the proxy's block cache may use (default 1 GiB);
+        least recently used blocks are evicted beyond that.
+    hedge_percentile : float, optional
+        For tracks listing several mirror URLs of a file: once a mirror has
+        taken longer than this percentile of its recent response times
+        (default ``95``), the same range is asked of the next mirror too,
+        and whichever answers first is used.  ``0`` asks every mirror at
+        once.
+    """
+    global _engine, _auto_index, _auto_index_min_size, _readahead_enabled
+    global _fixed_port, _stable_tokens, _max_workers, _max_queue
+    global _READ_TIMEOUT, _WRITE_TIMEOUT, _KEEPALIVE_TIMEOUT, _same_origin
+    global _workers, _fair_share, _session_rate, _proxy_remote, _proxy_cache_size
+    global _hedge_percentile
+    if engine is not None:
+        if engine not in _ENGINES:
+            raise ValueError(
+                f"engine must be one of {', '.join(_ENGINES)}, not {engine!r}")
+        if _standalone_server and engine != _engine:
+            raise RuntimeError(
+                "configure_server(engine=...) must be called before the file "
+                "server starts")
+        _engine = engine
+    if cache_control is not None:
+        _CACHE_CONTROL.update(cache_control)
+        with _registry_lock:
+            for record in _file_registry.values():
+                if record.version is None:
+                    record.cache_control = _get_cache_control(record.path)
+    if cache_dir is not None:
+        _artifacts.set_cache_dir(cache_dir)
+    if artifact_cache_size is not None:
+        _artifacts.set_capacity(artifact_cache_size)
+    if auto_index is not None:
+        _auto_index = auto_index
+    if auto_index_min_size is not None:
+        _auto_index_min_size = auto_index_min_size
+    if block_cache_size is not None:
+        _block_cache.resize(block_cache_size)
+    if readahead is not None:
+        _readahead_enabled = readahead
+    if port is not None:
+        if _standalone_server and port != _standalone_port:
+            raise RuntimeError(
+                "configure_server(port=...) must be called before the file "
+                "server starts")
+        _fixed_port = port
+    if stable_tokens is not None:
+        _stable_tokens = stable_tokens
+    if (max_workers is not None or max_queue is not None) and _standalone_server:
+        raise RuntimeError(
+            "configure_server(max_workers=..., max_queue=...) must be called "
+            "before the file server starts")
+    if max_workers is not None:
+        _max_workers = max_workers
+    if max_queue is not None:
+        _max_queue = max_queue
+    if read_timeout is not None:
+        _READ_TIMEOUT = read_timeout
+    if write_timeout is not None:
+        _WRITE_TIMEOUT = write_timeout
+    if idle_timeout is not None:
+        _KEEPALIVE_TIMEOUT = idle_timeout
+    if same_origin is not None:
+        _same_origin = same_origin
+    if workers is not None:
+        if _standalone_server and workers != _workers:
+            raise RuntimeError(
+                "configure_server(workers=...) must be called before the file "
+                "server starts")
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, not {workers}")
+        _workers = workers
+    if fair_share is not None:
+        _fair_share = fair_share
+    if session_rate is not None:
+        _session_rate = session_rate or None
+    if proxy_remote is not None:
+        _proxy_remote = proxy_remote
+    if proxy_cache_size is not None:
+        from . import _proxy
+        _proxy_cache_size = proxy_cache_size
+        _proxy._lru.trim()
+    if hedge_percentile is not None:
+        if not 0 <= hedge_percentile <= 100:
+            raise ValueError(f"hedge_percentile must be between 0 and 100, "
+                             f"not {hedge_percentile}")
+        _hedge_percentile = hedge_percentile
+
+
+def _worker_config() -> dict:
+    """The ``configure_server`` arguments worker processes are started with."""
+    return {"engine":              _engine,
+            "cache_control":       dict(_CACHE_CONTROL),
+            "cache_dir":           _artifacts.cache_dir(),
+            "artifact_cache_size": _artifacts._capacity,
+            "block_cache_size":    _block_cache.capacity,
+            "readahead":           _readahead_enabled,
+            "max_workers":         _max_workers,
+            "max_queue":           _max_queue,
+            "read_timeout":        _READ_TIMEOUT,
+            "write_timeout":       _WRITE_TIMEOUT,
+            "idle_timeout":        _KEEPALIVE_TIMEOUT,
+            "fair_share":          _fair_share,
+            "session_rate":        _session_rate or 0,
+            "proxy_cache_size":    _proxy_cache_size,
+            "hedge_percentile":    _hedge_percentile}
+
+
+def _bind(port: int, reuse_port: bool = False
+          ) -> _PooledHTTPServer | AsyncFileServer | _prefork.WorkerPool:
+    if _workers > 1:
+        from ._prefork import WorkerPool
+        registry = os.path.join(_artifacts.cache_dir(), "registry",
+                                f"{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+        return WorkerPool(port, _workers, registry, _worker_config())
+    if _engine == "asyncio":
+        from ._aioserver import AsyncFileServer
+        return AsyncFileServer(("127.0.0.1", port), _max_workers + _max_queue,
+                               reuse_port)
+    return _PooledHTTPServer(("127.0.0.1", port), _max_workers, _max_queue,
+                             reuse_port)
 
 
 def _start_server() -> int:
-    global _standalone_server, _standalone_thread, _standalone_port
+    global _standalone_server, _standalone_thread, _standalone_port, _registry_log
     if _standalone_server:
         return _standalone_port
-    with socket.socket() as s:
-        s.bind(("", 0))
-        port = s.getsockname()[1]
-    _standalone_server = ThreadingHTTPServer(("127.0.0.1", port), _CORSHandler)
-    _standalone_port   = port
+    server = None
+    if _fixed_port:
+        try:
+            server = _bind(_fixed_port)
+        except OSError as e:
+            logger.warning("igv-streamlit: port %d unavailable (%s); using "
+                           "a random port", _fixed_port, e)
+    if server is None:
+        server = _bind(0)
+    if _workers > 1:
+        with _registry_lock:
+            _registry_log = server.registry
+            for token, record in _file_registry.items():
+                _registry_log.append(token, record)
+            for token, urls in _remote_registry.items():
+                _registry_log.append_remote(token, urls)
+    _standalone_server = server
+    _standalone_port   = server.server_address[1]
     _standalone_thread = threading.Thread(
         target=_standalone_server.serve_forever, daemon=True)
     _standalone_thread.start()
-    logger.info("igv-streamlit: file server started on port %d", port)
-    return port
+    logger.info("igv-streamlit: %s file server started on port %d",
+                _engine, _standalone_port)
+    return _standalone_port
+
+
+def _url_prefix() -> str:
+    """Start the file server if need be and return the URL files live under."""
+    if _same_origin:
+        from . import _streamlit_mount
+        prefix = _streamlit_mount.mount()
+        if prefix is not None:
+            return f"{prefix}/file/"
+    return f"http://127.0.0.1:{_start_server()}/file/"
+
+
+def _stable_token(file_path: str, st: os.stat_result) -> str:
+    """Token for this version of ``file_path``, the same in every process."""
+    global _token_key
+    if _token_key is None:
+        _token_key = _load_token_key()
+    identity = f"{file_path}\0{st.st_size}\0{st.st_mtime_ns}"
+    return hmac.new(_token_key, identity.encode("utf-8", "surrogateescape"),
+                    hashlib.sha256).hexdigest()[:32]
+
+
+def _load_token_key() -> bytes:
+    """
+    Read the secret behind stable tokens from ``cache_dir``, creating it on
+    first use, so tokens can't be computed by anyone who knows a path.
+    """
+    path = os.path.join(_artifacts.cache_dir(), "token.key")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            key = f.read()
+        if len(key) == 32:
+            return key
+        raise RuntimeError(f"{path} is corrupt; delete it to make a new one")
+    key = os.urandom(32)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _stat_regular(file_path: str) -> os.stat_result:
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    return st
+
+
+def _register(file_path: str, st: os.stat_result) -> str:
+    # Caller holds _registry_lock
+    token = _path_tokens.get(file_path)
+    if token is not None:
+        record  = _file_registry[token]
+        version = (st.st_size, st.st_mtime_ns) if _stable_tokens else None
+        if record.version == version:
+            record.update(st)
+            return token
+        del _file_registry[token]           # a new version, a new token
+    token  = _stable_token(file_path, st) if _stable_tokens else uuid.uuid4().hex
+    record = _FileRecord(file_path, st, stable=_stable_tokens)
+    _file_registry[token]   = record
+    _path_tokens[file_path] = token
+    if _registry_log is not None:
+        _registry_log.append(token, record)
+    return token
 
 
 def register_file(file_path: str) -> str:
     file_path = os.path.abspath(file_path)
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
+    st     = _stat_regular(file_path)
+    prefix = _url_prefix()
+
+    with _registry_lock:
+        token = _register(file_path, st)
+
+    return prefix + token
 
-    port = _start_server()
+
+def register_files(file_paths: list[str]) -> list[str]:
+    """
+    Register many files at once and return their URLs, in order.
+
+    Every file is stat'ed before the registry is locked, once, so a whole
+    cohort's BAM/BAI list costs one lock acquisition.  Raises
+    ``FileNotFoundError`` (registering nothing) if any path is not a file.
+    """
+    file_paths = [os.path.abspath(p) for p in file_paths]
+    stats  = [_stat_regular(p) for p in file_paths]
+    prefix = _url_prefix()
 
     with _registry_lock:
-        for token, rp in _file_registry.items():
-            if rp == file_path:
-                return f"http://127.0.0.1:{port}/file/{token}"
-        token = uuid.uuid4().hex
-        _file_registry[token] = file_path
+        tokens = [_register(p, st) for p, st in zip(file_paths, stats)]
+
+    return [prefix + token for token in tokens]
 
-    return f"http://127.0.0.1:{port}/file/{token}"
+
+def register_remote(url: str | list[str]) -> str:
+    """
+    Register a remote file with the caching proxy and return its URL on the
+    local server.  ``url`` may be a list of equivalent mirror URLs of the
+    file, the preferred one first.  The file name is kept at the end of the
+    URL, so igv.js can still infer the format from it.
+    """
+    urls   = (url,) if isinstance(url, str) else tuple(url)
+    prefix = _url_prefix()
+    with _registry_lock:
+        token = _url_tokens.get(urls)
+        if token is None:
+            token = uuid.uuid4().hex
+            _remote_registry[token] = urls
+            _url_tokens[urls]       = token
+            if _registry_log is not None:
+                _registry_log.append_remote(token, urls)
+    name = os.path.basename(urlsplit(urls[0]).path)
+    return f"{prefix}{token}/{quote(name)}" if name else prefix + token
 
 
 def get_server_port() -> int | None:
-    return _standalone_port
\ No newline at end of file
+    return _standalone_port
+
+
+def server_stats() -> dict[str, dict[str, int]]:
+    """
+    Counters of the local file server, for capacity planning and sizing its
+    caches.
+
+    ``server`` (once started) reports how many connections (threaded
+    engine) or requests (asyncio) were ``accepted`` and ``rejected`` with a
+    503, and how many are ``active`` now.  The threaded engine adds its
+    ``max_workers`` / ``max_queue``, the connections ``queued`` now and the
+    ``peak_queue`` depth, keep-alive connections ``idle`` now and how many
+    were ``resumed`` by a new request or ``expired``; asyncio its
+    ``max_requests``, open ``connections`` and ``peak_active``.
+
+    ``block_cache`` reports its ``capacity``, ``cached_bytes`` and
+    ``pinned_bytes``, block ``hits`` / ``misses``, ``coalesced`` reads
+    (misses that waited on another request's read of the same block),
+    ``evictions`` and ``bytes_saved`` (bytes served without a disk read).
+    ``readahead`` counts ``sequential`` and ``random`` range requests and
+    the read-aheads ``issued`` (``bytes_issued`` in total).
+
+    ``requests`` counts CORS ``preflights`` and the GET/HEAD ``requests``
+    they precede, of which ``cross_origin`` came from another origin; with
+    preflight caching working there are far fewer preflights than
+    cross-origin requests.
+
+    ``scheduler`` reports the ``sessions`` sending large bodies now, how
+    many ``bulk_bodies`` there have been, how many slices were ``queued``
+    behind other sessions (``queued_seconds`` in total) and how often
+    ``session_rate`` ``throttled`` a session (``throttled_seconds``).
+
+    ``proxy`` reports the ``remotes`` proxied, the ``capacity`` of its disk
+    cache and the ``cached_bytes`` / ``cached_blocks`` in it (of which
+    ``pinned_bytes`` were pinned for offline use), blocks served from disk
+    (``hits``) and fetched upstream (``misses``, ``upstream_bytes`` in
+    total), ``coalesced`` blocks that waited on another request's fetch,
+    ``evictions``, ``upstream_requests`` (of which ``reused_connections``
+    went over a pooled connection), ``redirects`` to upstreams that can't
+    be cached and ranges ``hedged`` (asked of one more mirror while others
+    were still pending), and ``hedges_aborted``, requests to slower mirrors
+    cut short once another answered.  Its ``mirrors`` report, per upstream
+    server, the ``requests`` and ``errors``, how often it was ``outpaced``
+    by a hedge, its recent ``p50_ms`` / ``p95_ms`` response times and
+    whether it is passed over as ``down`` after failing.
+
+    With ``workers=N`` the figures are added up over this process and the
+    workers, as each worker last wrote them (every half second).  ``server``
+    then also reports the number of ``workers``, the ``master_pid`` and
+    whether the pool is ``running``.  Counters of a worker that died are
+    dropped with it.
+    """
+    stats = _process_stats(_standalone_server)
+    for worker in getattr(_standalone_server, "worker_stats", list)():
+        _add_stats(stats, worker)
+    return stats
+
+
+def _process_stats(server) -> dict[str, dict[str, int]]:
+    """:func:`server_stats` of this process alone, ``server`` serving it."""
+    from . import _proxy
+    return {"server":      server.stats() if server else {},
+            "requests":    _request_counts.stats(),
+            "scheduler":   _scheduler.stats(),
+            "block_cache": _block_cache.stats(),
+            "readahead":   _readahead.stats(),
+            "proxy":       _proxy.stats()}
+
+
+# Figures every process reads off the proxy's shared disk cache, or that
+# don't add up across processes; the largest is kept
+_MAX_STATS = {("proxy", "remotes"), ("proxy", "capacity"), ("proxy", "cached_bytes"),
+              ("proxy", "cached_blocks"), ("proxy", "pinned_bytes")}
+
+
+def _add_stats(total: dict, more: dict, path: tuple[str, ...] = ()) -> None:
+    """Add another process's :func:`server_stats` into ``total``."""
+    for key, value in more.items():
+        if isinstance(value, dict):
+            _add_stats(total.setdefault(key, {}), value, (*path, key))
+        elif (*path, key) in _MAX_STATS or key == "down" or key.endswith("_ms"):
+            total[key] = max(total.get(key, 0), value)
+        else:
+            total[key] = total.get(key, 0) + value
@@ -0,0 +1,74 @@
+# tests/conftest.py
+
+from __future__ import annotations
+
+import http.client
+import os
+import threading
+
+import pytest
+
+from igv_streamlit import _artifacts, server
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Give every test its own artifact store."""
+    path = tmp_path / "cache"
+    monkeypatch.setattr(_artifacts, "_cache_dir", str(path))
+    return path
+
+
+@pytest.fixture
+def register():
+    """Register a local file without starting the standalone server."""
+    tokens = []
+
+    def register(path) -> str:
+        path = os.path.abspath(path)
+        with server._registry_lock:
+            token = server._register(path, server._stat_regular(path))
+        tokens.append(token)
+        return token
+
+    yield register
+    with server._registry_lock:
+        for token in tokens:
+            record = server._file_registry.pop(token, None)
+            if record is not None:
+                server._path_tokens.pop(record.path, None)
+
+
+@pytest.fixture
+def serve():
+    """Start a file server engine on a free port and return the server."""
+    started = []
+
+    def serve(engine: str = "threading", max_workers: int = 4, max_queue: int = 16):
+        if engine == "asyncio":
+            from igv_streamlit._aioserver import AsyncFileServer
+            srv = AsyncFileServer(("127.0.0.1", 0), max_workers + max_queue)
+        else:
+            srv = server._PooledHTTPServer(("127.0.0.1", 0), max_workers, max_queue)
+        thread = threading.Thread(target=srv.serve_forever, daemon=True)
+        thread.start()
+        started.append((srv, thread))
+        return srv
+
+    yield serve
+    for srv, thread in started:
+        srv.shutdown()
+        thread.join(5)
+        if hasattr(srv, "server_close"):
+            srv.server_close()
+
+
+def get(srv, path: str, headers: dict[str, str] | None = None,
+        method: str = "GET") -> http.client.HTTPResponse:
+    """One request on a fresh connection; the response is read in full."""
+    conn = http.client.HTTPConnection("127.0.0.1", srv.server_address[1], timeout=10)
+    conn.request(method, path, headers=headers or {})
+    response = conn.getresponse()
+    response.body = response.read()
+    conn.close()
+    return response
@@ -0,0 +1,123 @@
+# tests/test_artifacts.py
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from igv_streamlit import _artifacts
+
+
+def _slow_copy(log: str):
+    """A build that copies its source slowly and logs each run to ``log``."""
+    def build(src: str, dst: str) -> None:
+        with open(log, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.3)
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            fout.write(fin.read().upper())
+    return build
+
+
+def _build_in_child(cache: str, source: str, log: str) -> None:
+    _artifacts.set_cache_dir(cache)
+    _artifacts.get_or_build(source, ".up", _slow_copy(log))
+
+
+@pytest.mark.skipif(_artifacts.fcntl is None, reason="needs fcntl and fork")
+def test_concurrent_callers_wait_for_one_build(tmp_path, cache_dir):
+    source = tmp_path / "a.txt"
+    source.write_text("abc")
+    log = str(tmp_path / "builds.log")
+    build = _slow_copy(log)
+
+    fork  = multiprocessing.get_context("fork")
+    child = fork.Process(target=_build_in_child, args=(str(cache_dir), str(source), log))
+    child.start()
+    paths = []
+    threads = [threading.Thread(
+        target=lambda: paths.append(_artifacts.get_or_build(str(source), ".up", build)))
+        for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    child.join(10)
+
+    assert child.exitcode == 0
+    assert len(set(paths)) == 1
+    assert open(paths[0]).read() == "ABC"
+    assert len(open(log).read().split()) == 1
+    assert _artifacts.lookup(str(source), os.stat(source), ".up") == paths[0]
+
+
+def test_changed_source_is_rebuilt(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("abc")
+    log   = str(tmp_path / "builds.log")
+    first = _artifacts.get_or_build(str(source), ".up", _slow_copy(log))
+
+    source.write_text("abcd")
+    assert _artifacts.lookup(str(source), os.stat(source), ".up") is None
+    second = _artifacts.get_or_build(str(source), ".up", _slow_copy(log))
+    assert second != first
+    assert open(second).read() == "ABCD"
+
+
+def test_failed_build_leaves_nothing_behind(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("abc")
+
+    def build(src: str, dst: str) -> None:
+        with open(dst, "w") as f:
+            f.write("partial")
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        _artifacts.get_or_build(str(source), ".up", build)
+    path = _artifacts.artifact_path(str(source), os.stat(source), ".up")
+    assert not os.path.exists(path)
+    assert [name for name in os.listdir(os.path.dirname(path))
+            if name.endswith(".tmp")] == []
+
+
+def test_builds_leave_no_lock_files(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("abc")
+    path = _artifacts.get_or_build(str(source), ".up", _slow_copy(str(tmp_path / "log")))
+    assert [name for name in os.listdir(os.path.dirname(path))
+            if name.endswith(".lock")] == []
+
+    # one left by a build that died is cleared by the next trim
+    open(f"{path}.lock", "w").close()
+    _artifacts.trim()
+    assert not os.path.exists(f"{path}.lock")
+    assert os.path.exists(path)
+
+
+def test_least_recently_used_artifacts_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(_artifacts, "_capacity", 25)
+    monkeypatch.setattr(_artifacts, "_TOUCH_INTERVAL", 0.0)
+    build = _slow_copy(str(tmp_path / "log"))
+    paths = {}
+    for name in ("a", "b", "c"):
+        source = tmp_path / f"{name}.txt"
+        source.write_text(name * 10)
+        if name == "c":
+            # a, built first, is used after b, so b goes to make room for c
+            for old, when in (("a", 1), ("b", 2)):
+                st = os.stat(paths[old])
+                os.utime(paths[old], ns=(when * 10**9, st.st_mtime_ns))
+            mtime = os.stat(paths["a"]).st_mtime_ns
+            assert _artifacts.lookup(str(tmp_path / "a.txt"),
+                                     os.stat(tmp_path / "a.txt"), ".up") == paths["a"]
+            assert os.stat(paths["a"]).st_mtime_ns == mtime    # still the same ETag
+        paths[name] = _artifacts.get_or_build(str(source), ".up", build)
+
+    assert os.path.exists(paths["a"])
+    assert not os.path.exists(paths["b"])
+    assert open(paths["c"]).read() == "C" * 10
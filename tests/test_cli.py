@@ -0,0 +1,50 @@
+# tests/test_cli.py
+
+from __future__ import annotations
+
+import subprocess
+import sys
+
+import pytest
+
+from igv_streamlit import cli
+
+
+@pytest.fixture
+def viewer(monkeypatch):
+    """The environment each ``main`` call would start the viewer with."""
+    runs = []
+    monkeypatch.setattr(subprocess, "run", lambda cmd, env: runs.append(env))
+    return runs
+
+
+def test_files_named_like_commands_can_be_viewed(viewer, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cli.main(["--genome", "hg19", "reads.bam"])
+    cli.main(["view", "serve"])
+    cli.main(["--", "pin"])
+    assert [(env["SIGV_FILE"], env["SIGV_GENOME"]) for env in viewer] == [
+        (str(tmp_path / "reads.bam"), "hg19"),
+        (str(tmp_path / "serve"), "hg38"),
+        (str(tmp_path / "pin"), "hg38")]
+
+
+def test_subcommands_parse_their_own_arguments(viewer, monkeypatch):
+    from igv_streamlit import _pin
+    calls = []
+    monkeypatch.setattr(_pin, "main", lambda argv: calls.append(argv) or 3)
+    with pytest.raises(SystemExit) as exited:
+        cli.main(["pin", "--locus", "chr1", "x.cram"])
+    assert exited.value.code == 3
+    assert calls == [["--locus", "chr1", "x.cram"]]
+
+    with pytest.raises(SystemExit):
+        cli.main(["reads.bam", "--bogus"])
+    assert viewer == []
+
+
+def test_viewing_does_not_load_numpy():
+    code = ("import sys; from igv_streamlit import cli; "
+            "assert 'numpy' not in sys.modules and "
+            "'igv_streamlit._pin' not in sys.modules")
+    subprocess.check_call([sys.executable, "-c", code])
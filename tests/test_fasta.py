@@ -0,0 +1,55 @@
+# tests/test_fasta.py
+
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from igv_streamlit import _fasta
+
+FASTA = os.path.join(os.path.dirname(__file__), os.pardir, "local-data",
+                     "PlasmoDB-54_Pfalciparum3D7_Genome.fasta")
+
+
+def test_fai_matches_samtools(tmp_path):
+    _fasta.build_fai(FASTA, str(tmp_path / "built.fai"))
+    assert (tmp_path / "built.fai").read_bytes() == open(FASTA + ".fai", "rb").read()
+
+
+@pytest.mark.parametrize("eol", ["\n", "\r\n"])
+def test_fai_of_short_last_lines_and_crlf(tmp_path, eol):
+    path = tmp_path / "ref.fa"
+    data = eol.join([">a first", "ACGTA", "CG", ">b", "TTT", ">c",
+                     "GGGGG", "GGGGG", ""]).encode()
+    path.write_bytes(data)
+    _fasta.build_fai(str(path), str(tmp_path / "ref.fa.fai"))
+    width = 5 + len(eol)
+    assert (tmp_path / "ref.fa.fai").read_text().splitlines() == [
+        f"a\t7\t{data.index(b'ACGTA')}\t5\t{width}",
+        f"b\t3\t{data.index(b'TTT')}\t3\t{3 + len(eol)}",
+        f"c\t10\t{data.index(b'GGGGG')}\t5\t{width}"]
+
+
+@pytest.mark.parametrize("content", [b"", b"ACGT\n", b">a\nACGT\nAC\nACGT\n"])
+def test_fasta_that_cannot_be_indexed(tmp_path, content):
+    path = tmp_path / "ref.fa"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        _fasta.build_fai(str(path), str(tmp_path / "ref.fa.fai"))
+
+
+def test_fai_next_to_the_fasta_is_used_while_up_to_date(tmp_path):
+    path = tmp_path / "ref.fa"
+    path.write_bytes(b">a\nACGT\n")
+    sibling = tmp_path / "ref.fa.fai"
+    sibling.write_bytes(b"a\t4\t3\t4\t5\n")
+    assert _fasta.fai_for(str(path)) == str(sibling)
+
+    os.utime(sibling, ns=(0, 0))
+    built = _fasta.fai_for(str(path))
+    assert built != str(sibling)
+    assert open(built, "rb").read() == b"a\t4\t3\t4\t5\n"
+
+    with pytest.raises(ValueError):
+        _fasta.fai_for(str(tmp_path / "ref.fa.gz"))
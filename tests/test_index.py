@@ -0,0 +1,176 @@
+# tests/test_index.py
+
+from __future__ import annotations
+
+import bisect
+import io
+import os
+import random
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from igv_streamlit import _bgzf, index
+
+DATA = os.path.join(os.path.dirname(__file__), os.pardir, "local-data")
+BAM  = os.path.join(DATA, "SPT24175.filtered.bam")
+CRAM = os.path.join(DATA, "PF0833-C.filtered.cram")
+
+
+def _bam_header(names: list[str]) -> bytes:
+    text = b"".join(b"@SQ\tSN:%s\tLN:1000\n" % n.encode() for n in names)
+    refs = b"".join(struct.pack("<i", len(n) + 1) + n.encode() + b"\0"
+                    + struct.pack("<i", 1000) for n in names)
+    return b"BAM\1" + struct.pack("<i", len(text)) + text + \
+        struct.pack("<i", len(names)) + refs
+
+
+def _small_itf8(value: int) -> bytes:
+    return bytes([value]) if value < 0x80 else bytes([0x80 | value >> 8, value & 0xFF])
+
+
+def _cram(major: int, minor: int, names: list[str]) -> bytes:
+    """A CRAM file definition and header container, counting 2**48 bases."""
+    text  = "".join(f"@SQ\tSN:{n}\tLN:1000\n" for n in names).encode()
+    data  = struct.pack("<i", len(text)) + text
+    block = bytes([0, 0]) + _small_itf8(0) + _small_itf8(len(data)) * 2 + data
+    if major >= 3:
+        block += struct.pack("<I", zlib.crc32(block))
+    header = struct.pack("<i", len(block)) + bytes([0, 0, 0, 0])   # ref .. records
+    header += bytes([0])                                  # record counter
+    header += bytes.fromhex("fd000000000000")             # bases: ltf8 2**48
+    header += bytes([1, 0])                               # blocks, no landmarks
+    if major >= 3:
+        header += struct.pack("<I", zlib.crc32(header))
+    return b"CRAM" + bytes([major, minor]) + bytes(20) + header + block
+
+
+def test_bam_references_come_from_whole_blocks():
+    out = io.BytesIO()
+    writer = _bgzf.BgzfWriter(out)
+    writer.write(_bam_header(["chr1", "chr2"]))
+    writer.close()
+    data = out.getvalue()
+
+    names, end = index.bam_references(data)
+    assert names == ["chr1", "chr2"]
+    assert data[end:] == _bgzf._EOF
+    assert index.bam_references(data[:end - 1]) is None
+
+
+@pytest.mark.parametrize("version", [(2, 1), (3, 0)])
+def test_cram_references(version):
+    data = _cram(*version, ["chr1", "chr2", "chrM"])
+    names, end = index.cram_references(data)
+    assert names == ["chr1", "chr2", "chrM"]
+    assert end == len(data)
+    assert index.cram_references(data[:end - 1]) is None
+
+
+def _bam_reads(path: str) -> tuple[list[str], list[tuple[int, int, int, int, int]]]:
+    """
+    The reference names of a BAM file and, for each mapped read, its
+    ``(ref, start, end)`` and the file offsets of the blocks holding its
+    first and last byte.
+    """
+    starts, data = [], bytearray()
+    with open(path, "rb") as f:
+        for offset, block in _bgzf.iter_blocks(f):
+            starts.append((len(data), offset))
+            data += block
+    ends = [offset for _, offset in starts[1:]] + [os.path.getsize(path)]
+
+    def block_end(pos: int) -> int:
+        return ends[bisect.bisect_right(starts, (pos, 1 << 62)) - 1]
+
+    def block_start(pos: int) -> int:
+        return starts[bisect.bisect_right(starts, (pos, 1 << 62)) - 1][1]
+
+    l_text, = struct.unpack_from("<i", data, 4)
+    n_ref,  = struct.unpack_from("<i", data, 8 + l_text)
+    names, pos = [], 12 + l_text
+    for _ in range(n_ref):
+        l_name, = struct.unpack_from("<i", data, pos)
+        names.append(data[pos + 4:pos + 3 + l_name].decode())
+        pos += 8 + l_name
+
+    reads = []
+    while pos < len(data):
+        size, ref, start, l_name, _, _, n_cigar, flag, _ = \
+            struct.unpack_from("<iiiBBHHHi", data, pos)
+        cigar = struct.unpack_from(f"<{n_cigar}I", data, pos + 36 + l_name)
+        span  = sum(op >> 4 for op in cigar if op & 0xF in (0, 2, 3, 7, 8)) or 1
+        if ref >= 0 and not flag & 4:
+            reads.append((ref, start, start + span,
+                          block_start(pos), block_end(pos + 3 + size)))
+        pos += 4 + size
+    return names, reads
+
+
+def _covered(ranges: np.ndarray, first: int, last: int) -> bool:
+    return any(start <= first and last <= end for start, end in ranges)
+
+
+def test_bai_ranges_hold_every_overlapping_read():
+    bai = index.load_index(BAM + ".bai")
+    names, reads = _bam_reads(BAM)
+    assert bai.names == names
+    rnd = random.Random(0)
+    regions = []
+    for ref, start, end, _, _ in rnd.sample(reads, 200):
+        beg = max(0, start + rnd.randrange(-500, 500))
+        regions.append((names[ref], beg, beg + rnd.randrange(1, 2000)))
+    chroms, begs, ends = (np.array(column) for column in zip(*regions))
+
+    found = index.byte_ranges(bai, chroms, begs, ends)
+    for i, (chrom, beg, end) in enumerate(regions):
+        ranges = found[found[:, 0] == i, 1:]
+        assert ranges.tolist() == index.byte_ranges(bai, chrom, beg, end).tolist()
+        ref = names.index(chrom)
+        for r, start, stop, first, last in reads:
+            if r == ref and start < end and stop > beg:
+                assert _covered(ranges, first, last), (chrom, beg, end, start)
+
+    assert index.byte_ranges(bai, "nowhere", 0, 1000).shape == (0, 2)
+    assert bai.header_end() >= bai.first_offset() > 0
+
+
+def test_crai_names_come_from_the_cram_header():
+    crai = index.load_index(CRAM + ".crai")
+    ref, start, span, container, offset, length = crai.slices[0]
+    name = crai.names[ref]
+    assert crai.names == index.cram_references(open(CRAM, "rb").read(1 << 16))[0]
+
+    ranges = index.byte_ranges(crai, name, start, start + 10)
+    assert ranges.tolist() == [[container, container + offset + length + index._TAIL]]
+    assert index.byte_ranges(crai, name, start + span, start + span + 10).size == 0
+    assert index.byte_ranges(crai, crai.names[ref - 1], start, start + 10).size == 0
+
+
+def test_fai_ranges_hold_exactly_the_bases(tmp_path):
+    sequences = {"one": "ACGT" * 50 + "A", "two": "T" * 7, "three": "GATTACA" * 30}
+    path = tmp_path / "ref.fasta"
+    with open(path, "w") as f:
+        for name, seq in sequences.items():
+            f.write(f">{name} description\n")
+            f.writelines(seq[i:i + 60] + "\n" for i in range(0, len(seq), 60))
+    from igv_streamlit import _fasta
+    _fasta.build_fai(str(path), str(tmp_path / "ref.fasta.fai"))
+    fai  = index.load_index(str(tmp_path / "ref.fasta.fai"))
+    data = path.read_bytes()
+
+    for name, seq in sequences.items():
+        for beg, end in ((0, 1), (0, len(seq)), (59, 61), (100, 1000), (3, 4)):
+            if beg >= len(seq):
+                continue
+            (start, stop), = index.byte_ranges(fai, name, beg, end)
+            assert data[start:stop].replace(b"\n", b"").decode() == seq[beg:end]
+    assert index.byte_ranges(fai, "two", 7, 20).size == 0
+
+
+def test_merge_ranges():
+    assert index.merge_ranges([]).shape == (0, 2)
+    assert index.merge_ranges([(50, 60), (0, 10), (10, 20), (55, 70), (30, 40)]
+                              ).tolist() == [[0, 20], [30, 40], [50, 70]]
@@ -0,0 +1,55 @@
+# tests/test_prefork.py
+
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from igv_streamlit import _prefork, server
+
+from conftest import get
+
+pytestmark = pytest.mark.skipif(not _prefork.supported(),
+                                reason="needs SO_REUSEPORT and fork")
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    pool = _prefork.WorkerPool(0, 2, str(tmp_path / "registry.jsonl"),
+                               server._worker_config())
+    monkeypatch.setattr(server, "_standalone_server", pool)
+    yield pool
+    pool.shutdown()
+
+
+def test_server_stats_add_up_the_workers(pool, register, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"x" * 1000)
+    token = register(path)
+    pool.registry.append(token, server._file_registry[token])
+    before = server._process_stats(None)["requests"]["requests"]
+
+    for _ in range(6):
+        assert get(pool, f"/file/{token}").body == b"x" * 1000
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        stats = server.server_stats()
+        if len(pool.worker_stats()) == 2 and stats["server"].get("accepted") == 6:
+            break
+        time.sleep(0.1)
+    assert stats["server"]["workers"] == 2
+    assert stats["server"]["running"] == 1
+    assert stats["server"]["accepted"] == 6
+    assert stats["requests"]["requests"] == before + 6
+
+
+def test_shared_proxy_figures_are_not_added_up():
+    total = {"proxy": {"cached_bytes": 100, "hits": 1,
+                       "mirrors": {"a": {"p95_ms": 20, "requests": 2}}}}
+    server._add_stats(total, {"proxy": {"cached_bytes": 100, "hits": 2,
+                                        "mirrors": {"a": {"p95_ms": 30,
+                                                          "requests": 1}}}})
+    assert total == {"proxy": {"cached_bytes": 100, "hits": 3,
+                               "mirrors": {"a": {"p95_ms": 30, "requests": 3}}}}
@@ -0,0 +1,302 @@
+# tests/test_proxy.py
+
+from __future__ import annotations
+
+import math
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from igv_streamlit import _proxy, server
+
+from conftest import get
+
+
+@pytest.fixture
+def upstream(tmp_path, serve, register):
+    """A remote file, served by the standalone server; its URL and bytes."""
+    data = os.urandom(3 * _proxy.BLOCK_SIZE + 100)
+    path = tmp_path / "remote.bam"
+    path.write_bytes(data)
+    srv = serve()
+    return f"http://127.0.0.1:{srv.server_address[1]}/file/{register(path)}", data
+
+
+@pytest.fixture
+def gated(monkeypatch):
+    """Hold every upstream request until ``release`` is set; count them."""
+    gate = threading.Event()
+    gate.started = threading.Event()
+    gate.calls = 0
+    real = _proxy._open_mirrored
+
+    def open_mirrored(*args, **kwargs):
+        gate.calls += 1
+        gate.started.set()
+        gate.wait(10)
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(_proxy, "_open_mirrored", open_mirrored)
+    return gate
+
+
+def test_reads_through_the_cache(upstream):
+    url, data = upstream
+    offset = _proxy.BLOCK_SIZE - 10
+    assert _proxy.read((url,), offset, 5000) == data[offset:offset + 5000]
+    assert _proxy.read((url,), len(data) - 50, 1000) == data[-50:]
+
+
+def test_revalidation_does_not_hold_the_entry(upstream, gated):
+    url, _ = upstream
+    gated.set()
+    _proxy.read((url,), 0, 10)
+    remote = _proxy._remote_for((url,))
+    remote.checked = -math.inf
+    gated.clear()
+    gated.started.clear()
+    gated.calls = 0
+
+    prober = threading.Thread(
+        target=lambda: server._file_pool.release(remote.open()))
+    prober.start()
+    assert gated.started.wait(5)
+    try:
+        # The check is out on the wire: the entry stays usable meanwhile
+        assert remote.lock.acquire(timeout=1)
+        remote.lock.release()
+        server._file_pool.release(remote.open())
+        assert gated.calls == 1
+    finally:
+        gated.set()
+        prober.join(5)
+
+
+def test_first_check_is_shared_by_waiting_requests(gated):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}/gone.bam"
+    remote = _proxy._remote_for((url,))
+    errors = []
+
+    def open_entry():
+        try:
+            remote.open()
+        except _proxy.UpstreamError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_entry) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert gated.started.wait(5)
+    time.sleep(0.2)
+    gated.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 4
+    assert gated.calls == 1
+
+
+def test_proxied_replies_get_their_own_executor(upstream, tmp_path, register):
+    url, _ = upstream
+    local = tmp_path / "local.txt"
+    local.write_text("local")
+    with server._registry_lock:
+        server._remote_registry["remotetoken"] = (url,)
+    try:
+        pool = server._reply_executor("/file/remotetoken/remote.bam")
+        assert pool is _proxy.executor()
+        assert pool._max_workers == _proxy._EXECUTOR_WORKERS
+        assert server._reply_executor(f"/file/{register(local)}") is None
+    finally:
+        with server._registry_lock:
+            del server._remote_registry["remotetoken"]
+
+
+def test_losing_mirror_request_is_aborted(upstream, monkeypatch):
+    url, data = upstream
+    monkeypatch.setattr(_proxy, "_HEDGE_DELAY", 0.05)
+    accepted = []
+    with socket.socket() as stalled:
+        stalled.bind(("127.0.0.1", 0))
+        stalled.listen()
+        stalled.settimeout(5)
+        slow = f"http://127.0.0.1:{stalled.getsockname()[1]}/stalls.bam"
+        thread = threading.Thread(target=lambda: accepted.append(stalled.accept()[0]))
+        thread.start()
+        before = _proxy.stats()["hedges_aborted"]
+
+        with _proxy._open_mirrored({slow: slow, url: url}, 0, 99, {}) as body:
+            assert body.mirror == url
+            assert body.read(100) == data[:100]
+        thread.join(5)
+        conn = accepted[0]
+        conn.settimeout(5)
+        with conn:
+            # The request arrives, then the connection is shut down unanswered
+            assert conn.recv(65536).startswith(b"GET /stalls.bam")
+            assert conn.recv(65536) == b""
+    assert _proxy.stats()["hedges_aborted"] == before + 1
+
+
+class _FtpHandler(socketserver.StreamRequestHandler):
+    """Just enough of an FTP server for ranged ``RETR`` of one file."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        files, rest, passive = self.server.files, 0, None
+        self.reply("220 ready")
+        for line in self.rfile:
+            command, _, arg = line.decode().strip().partition(" ")
+            command = command.upper()
+            if command == "USER":
+                self.reply("331 password please")
+            elif command in ("PASS", "TYPE", "NOOP"):
+                self.reply("230 ok" if command == "PASS" else "200 ok")
+            elif command in ("SIZE", "MDTM"):
+                if arg not in files:
+                    self.reply("550 no such file")
+                else:
+                    self.reply(f"213 {len(files[arg])}" if command == "SIZE"
+                               else "213 20260101120000")
+            elif command == "PASV":
+                passive = socket.create_server(("127.0.0.1", 0))
+                port = passive.getsockname()[1]
+                self.reply(f"227 passive (127,0,0,1,{port >> 8},{port & 0xFF})")
+            elif command == "REST":
+                rest = int(arg)
+                self.reply("350 restarting")
+            elif command == "RETR":
+                self.reply("150 sending")
+                conn, _ = passive.accept()
+                try:
+                    conn.sendall(files[arg][rest:])
+                    self.reply("226 done")
+                except OSError:
+                    self.reply("426 transfer aborted")
+                finally:
+                    conn.close()
+                    passive.close()
+                    rest = 0
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+@pytest.fixture
+def ftp_server():
+    srv = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _FtpHandler)
+    srv.daemon_threads = True
+    srv.files = {}
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    _proxy._ftp.close_all()
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_ftp_ranges_are_read_through_the_cache(ftp_server):
+    data = os.urandom(3 * _proxy.BLOCK_SIZE + 100)
+    ftp_server.files["/pub/remote.bam"] = data
+    base = f"ftp://127.0.0.1:{ftp_server.server_address[1]}/pub"
+    before = _proxy.stats()
+
+    offset = 2 * _proxy.BLOCK_SIZE - 10
+    assert _proxy.read((f"{base}/remote.bam",), offset, 5000) == \
+        data[offset:offset + 5000]
+    assert _proxy.read((f"{base}/remote.bam",), 0, 100) == data[:100]
+    # The control connection is kept and reused after a cut-short transfer
+    assert _proxy.stats()["reused_connections"] > before["reused_connections"]
+
+    with pytest.raises(_proxy.UpstreamError) as raised:
+        _proxy.read((f"{base}/missing.bam",), 0, 10)
+    assert raised.value.status == 404
+
+
+@pytest.fixture
+def remotes(monkeypatch):
+    """register_remote() without starting a server, undone afterwards."""
+    monkeypatch.setattr(server, "_url_prefix", lambda: "/file/")
+    monkeypatch.setattr(server, "_remote_registry", {})
+    monkeypatch.setattr(server, "_url_tokens", {})
+
+
+def test_file_urls_only_take_the_file_name(serve, register, tmp_path, remotes):
+    local = tmp_path / "reads.bam"
+    local.write_bytes(b"local")
+    token = register(local)
+    remote = server.register_remote("ftp://127.0.0.1:1/pub/remote%20reads.bam")
+    srv = serve()
+
+    assert get(srv, f"/file/{token}/reads.bam").body == b"local"
+    for path in (f"/file/{token}/reads.bam.bai", f"/file/{token}/other.bam",
+                 f"{remote}.bai", remote.rsplit("/", 1)[0] + "/other.bam"):
+        assert get(srv, path).status == 404, path
+    assert remote.endswith("/remote%2520reads.bam")
+    assert server._artifacts.display_name(
+        str(tmp_path / "ab" / ("0" * 38 + "-genes.gff.gz.tbi"))) == "genes.gff.gz.tbi"
+
+
+def test_proxied_tracks_get_the_index_next_to_them(ftp_server, serve, remotes):
+    import igv_streamlit
+    data, bai = os.urandom(1000), os.urandom(100)
+    ftp_server.files.update({"/pub/reads.bam": data, "/pub/reads.bam.bai": bai,
+                             "/pub/ref.fa": b">a\nACGT\n",
+                             "/pub/ref.fa.fai": b"a\t4\t3\t4\t5\n"})
+    base = f"ftp://127.0.0.1:{ftp_server.server_address[1]}/pub"
+    srv  = serve()
+
+    track = igv_streamlit._resolve_local_paths({"url": f"{base}/reads.bam"})
+    assert track["indexURL"].endswith("/reads.bam.bai")
+    assert get(srv, track["indexURL"]).body == bai
+    assert get(srv, track["url"].split("?")[0]).body == data
+
+    reference = igv_streamlit._resolve_local_paths({"fastaURL": f"{base}/ref.fa"})
+    assert get(srv, reference["indexURL"]).body == b"a\t4\t3\t4\t5\n"
+
+    # An index given, or none wanted, is left alone
+    for extra in ({"indexURL": "https://example.org/x.bai"}, {"indexed": False}):
+        track = igv_streamlit._resolve_local_paths(
+            {"url": f"{base}/reads.bam", **extra})
+        assert track.get("indexURL") == extra.get("indexURL")
+    track = igv_streamlit._resolve_local_paths({"url": f"{base}/genes.bed"})
+    assert "indexURL" not in track
+
+
+def test_pinned_track_loads_with_the_upstream_gone(ftp_server, serve, remotes,
+                                                   monkeypatch):
+    import igv_streamlit
+    from igv_streamlit import _pin, index
+    path = os.path.join(os.path.dirname(__file__), os.pardir, "local-data",
+                        "SPT24175.filtered.bam")
+    bam, bai = open(path, "rb").read(), open(path + ".bai", "rb").read()
+    ftp_server.files.update({"/pub/reads.bam": bam, "/pub/reads.bam.bai": bai})
+    url = f"ftp://127.0.0.1:{ftp_server.server_address[1]}/pub/reads.bam"
+    idx = index.read_index(bai, index.bam_references(bam)[0])
+    chrom = idx.names[int(idx.keys[0] >> 32)]      # the one with reads
+
+    report = _pin.pin([{"name": "reads", "url": url}], [f"{chrom}:390001-410000"])
+    assert report["reads"]["errors"] == []
+    assert report["reads"]["complete"] == 1.0
+
+    ftp_server.shutdown()
+    ftp_server.server_close()
+    _proxy._ftp.close_all()
+    monkeypatch.setattr(_proxy, "_REVALIDATE_INTERVAL", 0.0)
+    track = igv_streamlit._resolve_local_paths({"url": url})
+    srv   = serve()
+
+    assert get(srv, track["indexURL"]).body == bai
+    (start, end), = index.byte_ranges(idx, chrom, 390_000, 410_000)
+    response = get(srv, track["url"], {"Range": f"bytes=0-{end - 1}"})
+    assert response.status == 206
+    assert response.body == bam[:end]
@@ -0,0 +1,608 @@
+# tests/test_server.py
+
+from __future__ import annotations
+
+import http.client
+import os
+import socket
+import time
+
+import pytest
+
+from igv_streamlit import server
+
+from conftest import get
+
+
+@pytest.fixture
+def bam(tmp_path):
+    path = tmp_path / "reads.bam"
+    path.write_bytes(bytes(range(256)) * 4096)
+    return path
+
+
+# ── connections ──────────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_idle_keepalive_connections_hold_no_worker(engine, serve, register, bam,
+                                                   monkeypatch):
+    monkeypatch.setattr(server, "_KEEPALIVE_TIMEOUT", 8.0)
+    token = register(bam)
+    srv   = serve(engine, max_workers=2)
+    port  = srv.server_address[1]
+
+    idle = []
+    for _ in range(4):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.request("GET", f"/file/{token}", headers={"Range": "bytes=0-9"})
+        assert conn.getresponse().read() == bytes(range(10))
+        idle.append(conn)
+
+    t0 = time.monotonic()
+    response = get(srv, f"/file/{token}", {"Range": "bytes=10-19"})
+    assert response.status == 206
+    assert response.body == bytes(range(10, 20))
+    assert time.monotonic() - t0 < 2.0
+
+    # The idle connections are still usable
+    for conn in idle:
+        conn.request("GET", f"/file/{token}", headers={"Range": "bytes=20-29"})
+        assert conn.getresponse().read() == bytes(range(20, 30))
+        conn.close()
+
+
+def test_idle_keepalive_connections_expire(serve, register, bam, monkeypatch):
+    monkeypatch.setattr(server, "_KEEPALIVE_TIMEOUT", 0.2)
+    token = register(bam)
+    srv   = serve(max_workers=1)
+
+    sock = socket.create_connection(srv.server_address, timeout=5)
+    sock.sendall(f"GET /file/{token} HTTP/1.1\r\nRange: bytes=0-0\r\n\r\n".encode())
+    response = b""
+    while not response.endswith(b"\x00"):
+        response += sock.recv(65536)
+    assert b"206" in response.split(b"\r\n")[0]
+    assert sock.recv(1) == b""          # closed by the server
+    sock.close()
+    assert srv.stats()["expired"] == 1
+
+
+# ── fair sharing between sessions ────────────────────────────────────────────
+
+def test_session_comes_from_the_query_or_the_connection():
+    assert server._session_key("/file/t/x.bam?igv_session=abc", ("127.0.0.1", 5)) == "abc"
+    assert server._session_key("/file/t?a=1&igv_session=abc", ("127.0.0.1", 5)) == "abc"
+    assert server._session_key("/file/t", ("127.0.0.1", 5)) == "127.0.0.1:5"
+    assert server._session_key("/file/t", ("127.0.0.1", 6)) == "127.0.0.1:6"
+
+
+def test_alignment_urls_carry_the_session(tmp_path, register, monkeypatch):
+    import igv_streamlit
+    bam = tmp_path / "reads.bam"
+    bai = tmp_path / "reads.bam.bai"
+    bed = tmp_path / "genes.bed"
+    for path in (bam, bai, bed):
+        path.write_bytes(b"x")
+    monkeypatch.setattr(igv_streamlit, "register_file",
+                        lambda path: f"/file/{register(path)}")
+    track = igv_streamlit._resolve_local_paths(
+        {"path": str(bam), "indexPath": str(bai)}, "abc")
+    assert track["url"].endswith("?igv_session=abc")
+    assert "?" not in track["indexURL"]
+    assert "headers" not in track
+    # the same for every session, for the browser cache
+    track = igv_streamlit._resolve_local_paths({"path": str(bed)}, "abc")
+    assert "?" not in track["url"]
+
+    monkeypatch.setattr(server, "_fair_share", False)
+    track = igv_streamlit._resolve_local_paths({"path": str(bam)}, "abc")
+    assert "?" not in track["url"]
+
+
+def test_preflights_allow_no_custom_headers():
+    allowed = dict(server._PREFLIGHT_HEADERS)["Access-Control-Allow-Headers"]
+    assert {h.strip() for h in allowed.split(",")} == {"Range", "Content-Type"}
+
+
+def _interleaving(turns: list[str]) -> bool:
+    # Neither session gets two turns in a row while the other one waits
+    return all(a != b for a, b in zip(turns[:-2], turns[1:-1]))
+
+
+def test_threaded_turns_alternate_between_sessions():
+    import threading
+    scheduler = server._FairScheduler(slots=1)
+    turns = []
+    for key in "ab":
+        scheduler.begin(key)
+    with scheduler.turn("a", 1000):     # hold the slot until both queue up
+        def send(key):
+            for _ in range(4):
+                with scheduler.turn(key, 1000):
+                    turns.append(key)
+                    time.sleep(0.005)
+        threads = [threading.Thread(target=send, args=(key,)) for key in "ab"]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+    for thread in threads:
+        thread.join()
+    assert sorted(turns) == list("aaaabbbb")
+    assert _interleaving(turns)
+
+
+def test_async_turns_alternate_between_sessions():
+    import asyncio
+    scheduler = server._FairScheduler(slots=1)
+    turns = []
+    for key in "ab":
+        scheduler.begin(key)
+
+    async def send(key):
+        for _ in range(4):
+            async with scheduler.turn_async(key, 1000):
+                turns.append(key)
+                await asyncio.sleep(0.005)
+
+    async def main():
+        await asyncio.gather(send("a"), send("b"))
+
+    asyncio.run(main())
+    assert sorted(turns) == list("aaaabbbb")
+    assert _interleaving(turns)
+    assert scheduler.stats()["queued"] > 0
+
+
+def test_bulk_bodies_are_not_read_through_the_cache(register, tmp_path):
+    path = tmp_path / "reads.bam"
+    path.write_bytes(b"\0" * (server._SMALL_BODY + 1))
+    token = register(path)
+    reply = server._build_reply("GET", f"/file/{token}", {"range": "bytes=0-"})
+    try:
+        assert reply.bulk
+        assert reply.segments == [(0, server._SMALL_BODY + 1)]
+    finally:
+        reply.close()
+
+
+def test_only_small_reads_go_through_the_cache(register, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_fair_share", False)
+    path = tmp_path / "reads.bam"
+    path.write_bytes(b"\1" * 2 * server._CACHED_READ_MAX)
+    token = register(path)
+    for end, cached in ((server._CACHED_READ_MAX - 1, True),
+                        (server._CACHED_READ_MAX, False)):
+        reply = server._build_reply("GET", f"/file/{token}",
+                                    {"range": f"bytes=0-{end}"})
+        try:
+            assert isinstance(reply.segments[0], bytes) == cached
+        finally:
+            reply.close()
+
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_concurrent_sessions_get_their_bytes(engine, serve, register, tmp_path,
+                                             monkeypatch):
+    import threading
+    monkeypatch.setattr(server, "_FAIR_SLICE", 16 * 1024)
+    path = tmp_path / "reads.bam"
+    data = bytes(range(256)) * (4 * 4096)
+    path.write_bytes(data)
+    token = register(path)
+    srv   = serve(engine)
+    queued = server._scheduler.stats()["queued"]
+
+    bodies = {}
+    def fetch(session):
+        bodies[session] = get(srv, f"/file/{token}?igv_session={session}").body
+    threads = [threading.Thread(target=fetch, args=(s,)) for s in ("a", "b", "c")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert bodies == {s: data for s in "abc"}
+    assert server._scheduler.stats()["queued"] >= queued
+
+
+# ── file pool ────────────────────────────────────────────────────────────────
+
+def test_pooled_descriptors_are_shared_and_closed_after_the_last_user(tmp_path):
+    pool = server._FilePool(max_open=2)
+    path = tmp_path / "a.bam"
+    path.write_bytes(b"old")
+    first  = pool.acquire("a", str(path))
+    second = pool.acquire("a", str(path))
+    assert first is second and first.refs == 2
+
+    # Replaced under a reader: the next request gets the new file
+    (tmp_path / "new.bam").write_bytes(b"newer")
+    os.replace(tmp_path / "new.bam", path)
+    fresh = pool.acquire("a", str(path))
+    assert fresh is not first
+    assert server._pread(fresh.fd, 10, 0) == b"newer"
+    assert server._pread(first.fd, 10, 0) == b"old"
+    pool.release(first)
+    pool.release(second)
+    assert first.evicted and first.refs == 0     # closed by the last release
+
+    # Least recently used descriptors go once there are too many
+    for token in "bc":
+        (tmp_path / f"{token}.bam").write_bytes(b"x")
+        pool.release(pool.acquire(token, str(tmp_path / f"{token}.bam")))
+    pool.release(fresh)
+    assert fresh.evicted
+    with pytest.raises(FileNotFoundError):
+        pool.acquire("d", str(tmp_path))
+    pool.close_all()
+
+
+# ── block cache ──────────────────────────────────────────────────────────────
+
+def test_pinned_file_and_its_compressed_variant_both_stay_pinned(
+        tmp_path, register, monkeypatch):
+    import gzip
+    from igv_streamlit import _artifacts, _compression
+    cache = server._BlockCache(capacity=4 * 1024 * 1024)
+    monkeypatch.setattr(server, "_block_cache", cache)
+    fai  = tmp_path / "ref.fasta.fai"
+    data = b"".join(b"chr%d\t1000000\t%d\t60\t61\n" % (i, i * 1000) for i in range(2000))
+    fai.write_bytes(data)
+    token = register(fai)
+    _artifacts.get_or_build(str(fai), ".gzip", _compression.ENCODERS["gzip"])
+
+    def fetch(accept_encoding=None):
+        headers = {"accept-encoding": accept_encoding} if accept_encoding else {}
+        reply = server._build_reply("GET", f"/file/{token}", headers)
+        try:
+            body = b"".join(reply.segments)
+            coding = dict(reply.headers).get("Content-Encoding")
+        finally:
+            reply.close()
+        return gzip.decompress(body) if coding == "gzip" else body
+
+    assert fetch() == data
+    assert fetch("gzip") == data
+    misses = cache.stats()["misses"]
+    assert fetch() == data
+    assert fetch("gzip") == data
+    assert cache.stats()["misses"] == misses
+    assert len(cache._pinned_paths) == 2
+
+
+# ── ranges ───────────────────────────────────────────────────────────────────
+
+def test_range_headers_are_parsed_and_coalesced():
+    assert server._parse_range("bytes=0-9", 100) == [(0, 9)]
+    assert server._parse_range("bytes=-10", 100) == [(90, 99)]
+    assert server._parse_range("bytes=90-", 100) == [(90, 99)]
+    assert server._parse_range("bytes=50-200", 100) == [(50, 99)]
+    assert server._parse_range("bytes=20-29, 0-9,5-14", 100) == [(0, 14), (20, 29)]
+    assert server._parse_range("bytes=0-9,10-19", 100) == [(0, 19)]
+    assert server._parse_range("bytes=100-", 100) == []
+    assert server._parse_range("bytes=-0", 100) == []
+    for header in ("bytes=abc", "bytes=9-0", "bytes=-", "bytes=", "items=0-9",
+                   "bytes=" + ",".join(["0-0"] * (server._MAX_RANGES + 1))):
+        assert server._parse_range(header, 100) is None, header
+
+
+def _parts(response) -> list[tuple[str, bytes]]:
+    """The ``(Content-Range, data)`` of each part of a multipart/byteranges body."""
+    kind, _, boundary = response.getheader("Content-Type").partition("; boundary=")
+    assert kind == "multipart/byteranges"
+    body = response.body
+    assert body.endswith(f"\r\n--{boundary}--\r\n".encode())
+    parts = []
+    for part in body.split(f"\r\n--{boundary}".encode())[1:-1]:
+        head, _, data = part.partition(b"\r\n\r\n")
+        headers = dict(line.split(": ", 1) for line in head.decode().split("\r\n")[1:])
+        parts.append((headers["Content-Range"], data))
+    return parts
+
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_range_requests(engine, serve, register, bam):
+    data  = bam.read_bytes()
+    size  = len(data)
+    token = register(bam)
+    srv   = serve(engine)
+    path  = f"/file/{token}"
+
+    response = get(srv, path)
+    assert response.status == 200
+    assert response.getheader("Accept-Ranges") == "bytes"
+    assert response.body == data
+
+    for spec, (start, end) in (("bytes=100-199", (100, 199)),
+                               ("bytes=-300", (size - 300, size - 1)),
+                               (f"bytes={size - 5}-", (size - 5, size - 1)),
+                               ("bytes=0-4,3-9", (0, 9))):
+        response = get(srv, path, {"Range": spec})
+        assert response.status == 206, spec
+        assert response.getheader("Content-Range") == f"bytes {start}-{end}/{size}"
+        assert response.body == data[start:end + 1]
+
+    response = get(srv, path, {"Range": "bytes=0-9,1000-1009,-5"})
+    assert response.status == 206
+    assert int(response.getheader("Content-Length")) == len(response.body)
+    assert _parts(response) == [
+        (f"bytes 0-9/{size}", data[:10]),
+        (f"bytes 1000-1009/{size}", data[1000:1010]),
+        (f"bytes {size - 5}-{size - 1}/{size}", data[-5:])]
+
+    response = get(srv, path, {"Range": f"bytes={size}-"})
+    assert response.status == 416
+    assert response.getheader("Content-Range") == f"bytes */{size}"
+
+    response = get(srv, path, {"Range": "bytes=oops"})
+    assert response.status == 200
+    assert response.body == data
+
+
+# ── conditional requests ─────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_conditional_requests(engine, serve, register, bam):
+    data  = bam.read_bytes()
+    token = register(bam)
+    srv   = serve(engine)
+    path  = f"/file/{token}"
+
+    first = get(srv, path)
+    etag, last_modified = first.getheader("ETag"), first.getheader("Last-Modified")
+    assert etag.startswith('"') and etag.endswith('"')
+
+    for headers in ({"If-None-Match": etag},
+                    {"If-None-Match": f'"other", W/{etag}'},
+                    {"If-None-Match": "*"},
+                    {"If-Modified-Since": last_modified}):
+        response = get(srv, path, headers)
+        assert response.status == 304, headers
+        assert response.body == b""
+        assert response.getheader("ETag") == etag
+
+    assert get(srv, path, {"If-None-Match": '"other"'}).status == 200
+    # If-None-Match wins over If-Modified-Since
+    assert get(srv, path, {"If-None-Match": '"other"',
+                           "If-Modified-Since": last_modified}).status == 200
+
+    response = get(srv, path, {"Range": "bytes=0-9", "If-Range": etag})
+    assert (response.status, response.body) == (206, data[:10])
+    response = get(srv, path, {"Range": "bytes=0-9", "If-Range": last_modified})
+    assert response.status == 206
+    response = get(srv, path, {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert (response.status, response.body) == (200, data)
+
+
+def test_changed_file_gets_a_new_etag(register, bam, monkeypatch):
+    monkeypatch.setattr(server, "_RESTAT_INTERVAL", 0.0)
+    token = register(bam)
+
+    def etag():
+        reply = server._build_reply("HEAD", f"/file/{token}", {})
+        reply.close()
+        return dict(reply.headers)["ETag"]
+
+    before = etag()
+    with open(bam, "ab") as f:
+        f.write(b"more")
+    assert etag() != before
+
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_head_and_errors(engine, serve, register, bam):
+    token = register(bam)
+    srv   = serve(engine)
+
+    response = get(srv, f"/file/{token}", method="HEAD")
+    assert response.status == 200
+    assert int(response.getheader("Content-Length")) == bam.stat().st_size
+    assert response.body == b""
+
+    assert get(srv, "/file/0123456789abcdef0123456789abcdef").status == 404
+    assert get(srv, "/elsewhere").status == 404
+    response = get(srv, f"/file/{token}", method="POST")
+    assert response.status == 405
+    assert response.getheader("Allow") == "GET, HEAD, OPTIONS"
+
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_preflights_are_answered_and_cached(engine, serve, register, bam):
+    srv = serve(engine)
+    for path in (f"/file/{register(bam)}", "/file/unregistered"):
+        response = get(srv, path, {
+            "Origin": "http://localhost:8501",
+            "Access-Control-Request-Method": "GET",
+            "Access-Control-Request-Headers": "range"}, method="OPTIONS")
+        assert response.status == 204
+        assert response.getheader("Access-Control-Max-Age") == "86400"
+        assert response.getheader("Access-Control-Allow-Origin") == "*"
+
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_one_connection_serves_many_requests(engine, serve, register, bam):
+    data  = bam.read_bytes()
+    token = register(bam)
+    srv   = serve(engine)
+
+    conn = http.client.HTTPConnection("127.0.0.1", srv.server_address[1], timeout=10)
+    for start in range(0, 50_000, 10_000):
+        conn.request("GET", f"/file/{token}",
+                     headers={"Range": f"bytes={start}-{start + 999}"})
+        response = conn.getresponse()
+        assert response.status == 206
+        assert response.read() == data[start:start + 1000]
+    conn.request("GET", f"/file/{token}")
+    assert conn.getresponse().read() == data
+    conn.close()
+    assert srv.stats()["accepted"] == (1 if engine == "threading" else 6)
+
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_bodies_are_the_same_without_sendfile(engine, serve, register, bam,
+                                              monkeypatch):
+    monkeypatch.setattr(server, "_USE_SENDFILE", False)
+    monkeypatch.setattr(server, "_block_cache", server._BlockCache(capacity=0))
+    data  = bam.read_bytes()
+    token = register(bam)
+    srv   = serve(engine)
+    assert get(srv, f"/file/{token}").body == data
+    assert get(srv, f"/file/{token}", {"Range": "bytes=10-19"}).body == data[10:20]
+    response = get(srv, f"/file/{token}", {"Range": "bytes=10-19,100000-"})
+    assert [part for _, part in _parts(response)] == [data[10:20], data[100000:]]
+
+
+# ── back-pressure ────────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_requests_beyond_capacity_get_503(engine, serve, register, tmp_path,
+                                          monkeypatch):
+    monkeypatch.setattr(server, "_fair_share", False)
+    path = tmp_path / "big.bam"
+    with open(path, "wb") as f:
+        f.truncate(64 * 1024 * 1024)
+    token = register(path)
+    srv   = serve(engine, max_workers=1, max_queue=0 if engine == "asyncio" else 1)
+
+    def stalled() -> socket.socket:
+        # Asks for the whole file and reads none of it
+        sock = socket.create_connection(srv.server_address, timeout=5)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.sendall(f"GET /file/{token} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        time.sleep(0.3)
+        return sock
+
+    held = [stalled()]
+    if engine == "threading":
+        held.append(socket.create_connection(srv.server_address, timeout=5))
+        time.sleep(0.3)             # waits in the queue
+    try:
+        response = get(srv, f"/file/{token}", {"Range": "bytes=0-9"})
+        assert response.status == 503
+        assert response.getheader("Retry-After") == str(server._RETRY_AFTER)
+        assert srv.stats()["rejected"] == 1
+    finally:
+        for sock in held:
+            sock.close()
+
+
+# ── compression ──────────────────────────────────────────────────────────────
+
+def test_content_coding_negotiation():
+    from igv_streamlit import _compression
+    preferred = next(iter(_compression.ENCODERS))
+    assert _compression.negotiate(None) is None
+    assert _compression.negotiate("identity") is None
+    assert _compression.negotiate("gzip") == "gzip"
+    assert _compression.negotiate("GZIP;q=0.5") == "gzip"
+    assert _compression.negotiate("gzip;q=0") is None
+    assert _compression.negotiate("*") == preferred
+    assert _compression.negotiate("*;q=0.1, gzip;q=0") == (
+        None if preferred == "gzip" else preferred)
+
+
+@pytest.mark.parametrize("engine", ["threading", "asyncio"])
+def test_text_files_are_served_compressed_once_built(engine, serve, register,
+                                                     tmp_path):
+    import gzip
+    path = tmp_path / "genes.gff"
+    data = b"".join(b"chr1\tsrc\tgene\t%d\t%d\t.\t+\t.\tID=g%d\n" % (i, i + 50, i)
+                    for i in range(1, 5000))
+    path.write_bytes(data)
+    token = register(path)
+    srv   = serve(engine)
+    accept = {"Accept-Encoding": "gzip"}
+
+    plain = get(srv, f"/file/{token}")
+    assert plain.getheader("Content-Encoding") is None
+    deadline = time.monotonic() + 10
+    while True:
+        response = get(srv, f"/file/{token}", accept)
+        if response.getheader("Content-Encoding") == "gzip" or \
+                time.monotonic() > deadline:
+            break
+        assert response.body == data    # the variant is still being built
+        time.sleep(0.05)
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert gzip.decompress(response.body) == data
+    assert response.getheader("Vary") == "Accept-Encoding"
+    assert response.getheader("ETag") == plain.getheader("ETag")[:-1] + '-gzip"'
+    assert get(srv, f"/file/{token}", {
+        **accept, "If-None-Match": response.getheader("ETag")}).status == 304
+
+    # Ranges are always of the identity encoding
+    response = get(srv, f"/file/{token}", {**accept, "Range": "bytes=0-99"})
+    assert response.status == 206
+    assert response.getheader("Content-Encoding") is None
+    assert response.body == data[:100]
+
+
+# ── read-ahead ───────────────────────────────────────────────────────────────
+
+def test_sequential_ranges_are_read_ahead(register, bam, monkeypatch):
+    monkeypatch.setattr(server, "_readahead", server._ReadAhead())
+    token = register(bam)
+
+    def read(start, end):
+        reply = server._build_reply("GET", f"/file/{token}",
+                                    {"range": f"bytes={start}-{end - 1}"})
+        reply.close()
+
+    for start in range(0, 40_000, 10_000):
+        read(start, start + 10_000)
+    read(500_000, 510_000)
+    stats = server._readahead.stats()
+    assert (stats["sequential"], stats["random"]) == (3, 1)
+    assert stats["issued"] >= 1
+    assert stats["bytes_issued"] >= server._READAHEAD_MIN
+
+
+# ── registry ─────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def registry(monkeypatch):
+    """register_file(s) without a server, undone afterwards."""
+    monkeypatch.setattr(server, "_url_prefix", lambda: "/file/")
+    monkeypatch.setattr(server, "_file_registry", {})
+    monkeypatch.setattr(server, "_path_tokens", {})
+    return server._file_registry
+
+
+def test_registering_a_path_again_keeps_its_url(registry, tmp_path):
+    paths = [tmp_path / f"{name}.bam" for name in "abc"]
+    for path in paths:
+        path.write_bytes(b"x")
+    urls = server.register_files([str(p) for p in paths])
+    assert len(set(urls)) == 3
+    assert server.register_file(str(paths[1])) == urls[1]
+    assert server.register_files([str(p) for p in reversed(paths)]) == urls[::-1]
+    assert len(registry) == 3
+
+    with pytest.raises(FileNotFoundError):
+        server.register_files([str(tmp_path / "d.bam"), str(paths[0])])
+    with pytest.raises(FileNotFoundError):
+        server.register_file(str(tmp_path))
+    assert len(registry) == 3
+
+
+def test_stable_tokens_follow_the_file_version(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_stable_tokens", True)
+    monkeypatch.setattr(server, "_token_key", None)
+    path = tmp_path / "a.bam"
+    path.write_bytes(b"x")
+    url = server.register_file(str(path))
+
+    # The same in another process: the key is read back from the cache dir
+    monkeypatch.setattr(server, "_token_key", None)
+    del registry[url.rsplit("/", 1)[1]]
+    server._path_tokens.clear()
+    assert server.register_file(str(path)) == url
+
+    path.write_bytes(b"xy")
+    new = server.register_file(str(path))
+    assert new != url
+    assert list(registry) == [new.rsplit("/", 1)[1]]
+    reply = server._build_reply("GET", new, {})
+    try:
+        assert dict(reply.headers)["Cache-Control"] == server._IMMUTABLE_CACHE_CONTROL
+    finally:
+        reply.close()
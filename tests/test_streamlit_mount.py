@@ -0,0 +1,79 @@
+# tests/test_streamlit_mount.py
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import logging
+
+import pytest
+
+import igv_streamlit as sigv
+from igv_streamlit import _streamlit_mount
+
+
+@pytest.fixture(autouse=True)
+def unmounted(monkeypatch):
+    """Start every test as if nothing had been mounted in this process."""
+    monkeypatch.setattr(_streamlit_mount, "_mounted", None)
+    monkeypatch.setattr(_streamlit_mount, "_attempted", False)
+    monkeypatch.setattr(_streamlit_mount, "_middleware_installed", False)
+
+
+def _request(app, path: str) -> tuple[int, bytes]:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+    asyncio.run(app(scope, receive, send))
+    status = sent[0]["status"]
+    return status, b"".join(m.get("body", b"") for m in sent[1:])
+
+
+async def _inner(scope, receive, send):
+    await send({"type": "http.response.start", "status": 299, "headers": []})
+    await send({"type": "http.response.body", "body": b"streamlit"})
+
+
+def test_middleware_serves_files_and_passes_the_rest_on(tmp_path, register):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello igv")
+    token = register(path)
+
+    middleware = sigv.file_middleware()
+    app = middleware.cls(_inner, *middleware.args, **middleware.kwargs)
+    assert _request(app, f"/_igv_streamlit/file/{token}") == (200, b"hello igv")
+    assert _request(app, "/_stcore/health") == (299, b"streamlit")
+
+
+def test_installed_middleware_mounts_without_patching(monkeypatch):
+    sigv.file_middleware().cls(_inner)
+
+    def scan():
+        raise AssertionError("patched Streamlit although the middleware is installed")
+
+    monkeypatch.setattr(gc, "get_objects", scan)
+    assert _streamlit_mount.mount() == "/_igv_streamlit"
+
+
+def test_untested_streamlit_is_not_patched(monkeypatch, caplog):
+    monkeypatch.setattr(_streamlit_mount, "_streamlit_version", lambda: (99, 0))
+    monkeypatch.setattr(_streamlit_mount, "_mount_starlette",
+                        lambda prefix: pytest.fail("patched an untested release"))
+    with caplog.at_level(logging.WARNING, logger=_streamlit_mount.__name__):
+        assert _streamlit_mount.mount() is None
+    assert "file_middleware()" in caplog.text
+
+
+def test_patching_says_so(monkeypatch, caplog):
+    monkeypatch.setattr(_streamlit_mount, "_streamlit_version",
+                        lambda: _streamlit_mount._PATCHABLE_VERSIONS[0])
+    monkeypatch.setattr(_streamlit_mount, "_mount_starlette", lambda prefix: True)
+    with caplog.at_level(logging.WARNING, logger=_streamlit_mount.__name__):
+        assert _streamlit_mount.mount() == "/_igv_streamlit"
+    assert "patching its private server internals" in caplog.text
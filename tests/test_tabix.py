@@ -0,0 +1,164 @@
+# tests/test_tabix.py
+
+from __future__ import annotations
+
+import gzip
+import random
+import struct
+import time
+
+import numpy as np
+import pytest
+
+from igv_streamlit import _bgzf, _tabix, index
+
+
+def _gff(path, n: int = 3000, seed: int = 0) -> list[bytes]:
+    rnd   = random.Random(seed)
+    lines = [b"##gff-version 3\n"]
+    for i in range(n):
+        chrom = f"chr{rnd.randrange(1, 4)}".encode()
+        start = rnd.randrange(1, 1_000_000)
+        lines.append(b"\t".join([chrom, b"src", b"gene", b"%d" % start,
+                                 b"%d" % (start + rnd.randrange(1, 5000)),
+                                 b".", b"+", b".", b"ID=g%d\n" % i]))
+    path.write_bytes(b"".join(lines))
+    return lines
+
+
+def _wait_for(predicate, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(0.02)
+    raise AssertionError("timed out")
+
+
+def test_sort_in_runs_matches_sort_in_memory(tmp_path, monkeypatch):
+    src   = tmp_path / "genes.gff"
+    lines = _gff(src)
+    preset = _tabix.PRESETS[".gff"]
+
+    _tabix.sort_and_bgzip(str(src), str(tmp_path / "memory.gz"), preset)
+    monkeypatch.setattr(_tabix, "_SORT_RUN_BYTES", 4096)
+    _tabix.sort_and_bgzip(str(src), str(tmp_path / "runs.gz"), preset)
+
+    in_memory = gzip.decompress((tmp_path / "memory.gz").read_bytes())
+    in_runs   = gzip.decompress((tmp_path / "runs.gz").read_bytes())
+    assert in_runs == in_memory
+    records = in_runs.splitlines(keepends=True)
+    assert records[0] == lines[0]
+    assert sorted(records) == sorted(lines)
+    order = {}
+    keys  = [(order.setdefault(r.split(b"\t")[0], len(order)), int(r.split(b"\t")[3]))
+             for r in records[1:]]
+    assert keys == sorted(keys)
+
+
+def test_indexed_copy_is_built_in_the_background(tmp_path):
+    src = tmp_path / "genes.gff"
+    _gff(src)
+    assert _tabix.built_indexed_copy(str(src)) is None
+
+    gz, tbi = _wait_for(lambda: _tabix.built_indexed_copy(str(src)))
+    assert (gz, tbi) == _tabix.indexed_copy(str(src))
+    assert gzip.decompress(open(tbi, "rb").read())[:4] == b"TBI\1"
+
+
+def test_unsorted_bgzf_is_rejected(tmp_path):
+    src = tmp_path / "genes.gff"
+    src.write_bytes(b"chr1\ts\tg\t500\t600\t.\t+\t.\tx\n"
+                    b"chr1\ts\tg\t100\t200\t.\t+\t.\ty\n")
+    with open(tmp_path / "plain.gz", "wb") as f:
+        writer = _bgzf.BgzfWriter(f)
+        writer.write(src.read_bytes())
+        writer.close()
+    with pytest.raises(ValueError, match="not sorted"):
+        _tabix.tabix_index(str(tmp_path / "plain.gz"), str(tmp_path / "x.tbi"),
+                           _tabix.PRESETS[".gff"])
+
+
+def test_auto_indexed_track_is_served_plain_until_built(tmp_path, register,
+                                                         monkeypatch):
+    import igv_streamlit
+    src = tmp_path / "genes.gff"
+    _gff(src)
+    monkeypatch.setattr(igv_streamlit.server, "_auto_index_min_size", 0)
+    monkeypatch.setattr(igv_streamlit, "register_file",
+                        lambda path: f"/file/{register(path)}")
+    track = {"name": "genes", "path": str(src)}
+
+    assert igv_streamlit._auto_index_track(track) == track
+    _wait_for(lambda: _tabix.built_indexed_copy(str(src)))
+    indexed = igv_streamlit._auto_index_track(track)
+    assert "path" not in indexed
+    assert indexed["url"].endswith("/genes.gff.gz")
+    assert indexed["indexURL"].endswith("/genes.gff.gz.tbi")
+
+
+def test_header_end_covers_the_block_of_the_first_record(tmp_path):
+    src = tmp_path / "genes.gff"
+    _gff(src)
+    bgz, tbi = _tabix.indexed_copy(str(src))
+    idx   = index.load_index(tbi)
+    data  = open(bgz, "rb").read()
+    first = idx.first_offset()
+    bsize = struct.unpack_from("<H", data, first + 16)[0] + 1
+    assert 0 < first + bsize <= idx.header_end()
+
+
+def _vcf(path, n: int = 20000, seed: int = 0) -> None:
+    rnd   = random.Random(seed)
+    lines = [b"##fileformat=VCFv4.2\n",
+             b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"]
+    for i in range(n):
+        pos  = rnd.randrange(1, 2_000_000)
+        ref  = b"ACGT"[:rnd.randrange(1, 5)]
+        info = b"END=%d" % (pos + rnd.randrange(1, 100_000)) if i % 50 == 0 else b"."
+        lines.append(b"chr%d\t%d\tv%d\t%s\tA\t.\tPASS\t%s\n"
+                     % (rnd.randrange(1, 3), pos, i, ref, info))
+    path.write_bytes(b"".join(lines))
+
+
+def _span(fields: list[bytes], vcf: bool) -> tuple[int, int]:
+    """0-based, half-open interval of a GFF or VCF record, worked out by hand."""
+    if not vcf:
+        return int(fields[3]) - 1, int(fields[4])
+    beg  = int(fields[1]) - 1
+    info = dict(item.split(b"=") for item in fields[7].split(b";") if b"=" in item)
+    return beg, int(info[b"END"]) if b"END" in info else beg + len(fields[3])
+
+
+@pytest.mark.parametrize("name", ["genes.gff", "calls.vcf"])
+def test_tbi_ranges_hold_every_overlapping_record(tmp_path, name):
+    src = tmp_path / name
+    vcf = name.endswith(".vcf")
+    _vcf(src) if vcf else _gff(src, n=20000)
+    bgz, tbi = _tabix.indexed_copy(str(src))
+    idx  = index.load_index(tbi)
+    data = open(bgz, "rb").read()
+    records = [line for line in gzip.decompress(data).splitlines(keepends=True)
+               if not line.startswith(b"#")]
+    spans = [(fields[0].decode(), *_span(fields, vcf))
+             for fields in (line.split(b"\t") for line in records)]
+    assert sorted(idx.names) == sorted({chrom for chrom, _, _ in spans})
+
+    rnd = random.Random(1)
+    regions = [(rnd.choice(idx.names), beg, beg + rnd.choice((1, 500, 50_000)))
+               for beg in (rnd.randrange(0, 2_000_000) for _ in range(100))]
+    chroms, begs, ends = (np.array(column) for column in zip(*regions))
+    found = index.byte_ranges(idx, chroms, begs, ends)
+
+    checked = 0
+    for i, (chrom, beg, end) in enumerate(regions):
+        text = b""
+        for start, stop in found[found[:, 0] == i, 1:]:
+            text += b"".join(block for _, block in _bgzf.complete_blocks(data[start:stop]))
+        for line, (c, lo, hi) in zip(records, spans):
+            if c == chrom and lo < end and hi > beg:
+                assert line in text, (chrom, beg, end, line)
+                checked += 1
+    assert checked > len(regions)
+    assert index.byte_ranges(idx, "chrX", 0, 1_000_000).size == 0